@@ -0,0 +1,161 @@
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+from .config import (
+    ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY_THRESHOLD, ANSWER_CACHE_MIN_QUESTION_TOKENS,
+    ANSWER_CACHE_MAX_ENTRIES_PER_STARTUP, ANSWER_CACHE_MAX_STARTUPS
+)
+import numpy as np
+import re
+import threading
+import time
+import zlib
+
+EMBEDDING_DIM = 1024
+
+# Dropped before embedding so "what is the burn rate" and "what's the burn rate?" look alike.
+# Question and quantity words stay: "who are the investors" and "how many investors" differ
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "of", "for", "to", "in", "on", "at", "and", "or",
+    "tell", "me", "us", "please", "can", "could", "you", "give", "show", "do", "does", "did", "their",
+    "its", "it", "they", "this", "that", "company", "startup", "about",
+}
+
+# Contracted question words, after apostrophes are stripped
+CONTRACTIONS = {"whats": "what", "whos": "who", "hows": "how", "wheres": "where", "whens": "when"}
+
+# Words that point back into the conversation ("tell me more", "why is that?"); such questions are never cached
+FOLLOW_UP_WORDS = {
+    "more", "that", "it", "this", "these", "those", "them", "they", "why", "else", "again", "above",
+    "previous", "earlier", "elaborate", "expand",
+}
+
+# Direct answers are cheap to recompute; research answers depend on fresh web results
+UNCACHED_ROUTES = ("direct", "research")
+
+def _words(question: str) -> List[str]:
+    words = re.sub(r"[^a-z0-9\s]", " ", question.lower().replace("'", "")).split()
+    return [CONTRACTIONS.get(w, w) for w in words]
+
+def normalize_question(question: str) -> str:
+    """Lowercase, strip punctuation and drop filler words"""
+    return " ".join(w for w in _words(question) if w not in STOPWORDS)
+
+def is_cacheable_question(question: str) -> bool:
+    """False for short or follow-up questions whose answer depends on the conversation so far"""
+    words = _words(question)
+    if FOLLOW_UP_WORDS.intersection(words):
+        return False
+    return len([w for w in words if w not in STOPWORDS]) >= ANSWER_CACHE_MIN_QUESTION_TOKENS
+
+def question_numbers(question: str) -> frozenset:
+    """Numbers and years in a question; a cached answer must be about exactly the same ones"""
+    return frozenset(w for w in _words(question) if any(c.isdigit() for c in w))
+
+def embed_question(question: str) -> np.ndarray:
+    """Hashed word and character-trigram features, L2-normalized"""
+    normalized = normalize_question(question)
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    words = normalized.split()
+    features = list(words) + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f" {word} "
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    for feature in features:
+        # crc32 is stable across processes, unlike hash()
+        vector[zlib.crc32(feature.encode("utf-8")) % EMBEDDING_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class AnswerCache:
+    """In-process cache of chat answers per startup, matched by cosine similarity of questions"""
+
+    def __init__(self, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+                 threshold: float = ANSWER_CACHE_SIMILARITY_THRESHOLD,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES_PER_STARTUP,
+                 max_startups: int = ANSWER_CACHE_MAX_STARTUPS):
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_startups = max_startups
+        self._lock = threading.Lock()
+        # gcs_key -> {"version", "vectors": (n, dim) array, "items": [...]}, least recently used first
+        self._startups: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def lookup(self, gcs_key: str, question: str, version: str) -> Optional[Dict[str, Any]]:
+        """Return the cached answer for the most similar fresh question with the same numbers, if similar enough"""
+        if not is_cacheable_question(question):
+            return None
+        query = embed_question(question)
+        numbers = question_numbers(question)
+        now = time.time()
+
+        with self._lock:
+            startup = self._startups.get(gcs_key)
+            if startup is None:
+                return None
+            if startup["version"] != version:
+                # The analysis was regenerated since these answers were cached
+                del self._startups[gcs_key]
+                return None
+            self._startups.move_to_end(gcs_key)
+
+            self._expire(startup, now)
+            if not startup["items"]:
+                return None
+
+            similarities = startup["vectors"] @ query
+            # "revenue in 2022" must not be answered with the cached "revenue in 2023"
+            for best in np.argsort(-similarities):
+                if similarities[best] < self.threshold:
+                    return None
+                if startup["items"][best]["numbers"] == numbers:
+                    item = dict(startup["items"][best])
+                    item["similarity"] = round(float(similarities[best]), 4)
+                    return item
+            return None
+
+    def store(self, gcs_key: str, question: str, answer: str, version: str) -> None:
+        """Cache an answer for a question about one startup's analysis version"""
+        if not is_cacheable_question(question):
+            return
+        vector = embed_question(question)
+
+        with self._lock:
+            startup = self._startups.get(gcs_key)
+            if startup is None or startup["version"] != version:
+                startup = {"version": version, "vectors": np.zeros((0, EMBEDDING_DIM), dtype=np.float32), "items": []}
+                self._startups[gcs_key] = startup
+            self._startups.move_to_end(gcs_key)
+
+            startup["vectors"] = np.vstack([startup["vectors"], vector])[-self.max_entries:]
+            startup["items"].append({
+                "question": question, "answer": answer, "numbers": question_numbers(question), "created_at": time.time()
+            })
+            startup["items"] = startup["items"][-self.max_entries:]
+
+            while len(self._startups) > self.max_startups:
+                self._startups.popitem(last=False)
+
+    def invalidate(self, gcs_key: str) -> None:
+        """Drop all cached answers for a startup, e.g. after its analysis is regenerated"""
+        with self._lock:
+            self._startups.pop(gcs_key, None)
+
+    def _expire(self, startup: Dict[str, Any], now: float) -> None:
+        keep = [i for i, item in enumerate(startup["items"]) if now - item["created_at"] < self.ttl_seconds]
+        if len(keep) != len(startup["items"]):
+            startup["vectors"] = startup["vectors"][keep]
+            startup["items"] = [startup["items"][i] for i in keep]
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"gcs_key": key, "entries": len(startup["items"])}
+                for key, startup in self._startups.items()
+            ]
+
+answer_cache = AnswerCache()
+
+def analysis_version(analysis: Dict[str, Any]) -> str:
+    """Cache version of an analysis row; changes whenever the analysis is regenerated"""
+    return str(analysis.get("updated_at"))
@@ -0,0 +1,223 @@
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Optional
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from .config import BULKHEADS, BULKHEAD_STREAM_BUFFER, SCHEDULER_CLASSES
+from .scheduler import FairQueue, TenantQuotaExceeded, current_request, tenant_quota
+import asyncio
+import threading
+import time
+
+class BulkheadFull(Exception):
+    """Raised when a bulkhead's queue is full; surfaced to clients as 503"""
+
+    def __init__(self, name: str):
+        super().__init__(f"The {name} bulkhead is at capacity, please retry shortly")
+        self.name = name
+
+class Bulkhead:
+    """A bounded pool of worker threads for one class of blocking I/O, with admission control and metrics.
+    
+    Queued work is not served first-in first-out: a FairQueue picks the next task
+    by priority class weight and rotates between tenants, and each tenant may only
+    have TENANT_QUOTAS tasks per class queued or running here. `reserved` keeps
+    worker threads free for a class, e.g. so running analyses cannot take every
+    model thread away from chat.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, reserved: Dict[str, int] = None):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.reserved = dict(reserved or {})
+        self._queue = FairQueue(
+            {cls: settings["weight"] for cls, settings in SCHEDULER_CLASSES.items()}, max_workers, self.reserved
+        )
+        self._workers = []
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.busy_seconds = 0.0
+        self._classes = {
+            cls: {"completed": 0, "rejected": 0, "quota_rejected": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            for cls in SCHEDULER_CLASSES
+        }
+        self._in_flight: Dict[tuple, int] = {}
+
+    def _start_workers(self) -> None:
+        # Threads are started on first use so importing the module stays cheap
+        if self._workers:
+            return
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._work, name=f"bulkhead-{self.name}-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _admit(self, request_class: str, tenant: Optional[str]) -> None:
+        with self._lock:
+            self._start_workers()
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                self._classes[request_class]["rejected"] += 1
+                raise BulkheadFull(self.name)
+            if tenant is not None:
+                key = (tenant, request_class)
+                if self._in_flight.get(key, 0) >= tenant_quota(tenant, request_class):
+                    self._classes[request_class]["quota_rejected"] += 1
+                    raise TenantQuotaExceeded(tenant, request_class, self.name)
+                self._in_flight[key] = self._in_flight.get(key, 0) + 1
+            self.queued += 1
+
+    def _release(self, request_class: str, tenant: Optional[str]) -> None:
+        # Caller holds self._lock
+        if tenant is not None:
+            key = (tenant, request_class)
+            self._in_flight[key] -= 1
+            if not self._in_flight[key]:
+                del self._in_flight[key]
+
+    def _submit(self, func: Callable, *args, **kwargs) -> Future:
+        """Queue func under the current request's class and tenant, keeping counters up to date"""
+        request_class, tenant = current_request()
+        self._admit(request_class, tenant)
+        future = Future()
+        self._queue.put(request_class, tenant, (future, func, args, kwargs, request_class, tenant, time.perf_counter()))
+        return future
+
+    def _work(self) -> None:
+        while True:
+            future, func, args, kwargs, request_class, tenant, enqueued = self._queue.get()
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                # A task cancelled while queued is dropped without running
+                if not future.set_running_or_notify_cancel():
+                    self._release(request_class, tenant)
+                    self._queue.done(request_class)
+                    continue
+                self.active += 1
+                wait = started - enqueued
+                self.total_wait_seconds += wait
+                self.max_wait_seconds = max(self.max_wait_seconds, wait)
+                class_stats = self._classes[request_class]
+                class_stats["total_wait_seconds"] += wait
+                class_stats["max_wait_seconds"] = max(class_stats["max_wait_seconds"], wait)
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+                    self._classes[request_class]["completed"] += 1
+                    self.busy_seconds += time.perf_counter() - started
+                    self._release(request_class, tenant)
+                self._queue.done(request_class)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking call on this bulkhead and await its result"""
+        return await asyncio.wrap_future(self._submit(func, *args, **kwargs))
+
+    async def stream(self, make_iterator: Callable[[], Iterable],
+                     max_buffered: int = BULKHEAD_STREAM_BUFFER) -> AsyncIterator[Any]:
+        """Consume a blocking iterator on one bulkhead thread and yield its items asynchronously.
+        
+        At most max_buffered items are read ahead; the thread blocks until the consumer
+        catches up. If the consumer stops early (client disconnect), the iterator is
+        closed, so a generator can release its cursor and connection.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffered)
+        stopped = threading.Event()
+        done = object()
+
+        def put(item) -> bool:
+            # Wait for room in the queue, giving up once the consumer has gone away
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while True:
+                try:
+                    future.result(timeout=0.5)
+                    return True
+                except FutureTimeout:
+                    if stopped.is_set():
+                        future.cancel()
+                        return False
+
+        def pump():
+            iterator = None
+            try:
+                # Inside the try: a failure to start the stream must still reach the consumer
+                iterator = iter(make_iterator())
+                for item in iterator:
+                    if stopped.is_set() or not put(item):
+                        return
+            except Exception as e:
+                if not stopped.is_set():
+                    put(e)
+            finally:
+                close = getattr(iterator, "close", None) if iterator is not None else None
+                if close:
+                    close()
+                if not stopped.is_set():
+                    put(done)
+
+        self._submit(pump)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+
+    def stats(self) -> Dict[str, Any]:
+        queue_depth = self._queue.depth()
+        with self._lock:
+            elapsed = max(time.time() - self._started_at, 1e-9)
+            started = self.completed + self.active
+            return {
+                "name": self.name,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "reserved": self.reserved,
+                "queue_depth": self.queued,
+                "active": self.active,
+                "utilization": round(self.active / self.max_workers, 3),
+                "busy_ratio": round(self.busy_seconds / (elapsed * self.max_workers), 4),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.total_wait_seconds / started * 1000, 2) if started else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+                "classes": {
+                    cls: {
+                        "queue_depth": queue_depth[cls],
+                        "completed": stats["completed"],
+                        "rejected": stats["rejected"],
+                        "quota_rejected": stats["quota_rejected"],
+                        "avg_wait_ms": round(stats["total_wait_seconds"] / stats["completed"] * 1000, 2) if stats["completed"] else 0.0,
+                        "max_wait_ms": round(stats["max_wait_seconds"] * 1000, 2)
+                    }
+                    for cls, stats in self._classes.items()
+                },
+                "tenants_in_flight": {f"{tenant}/{cls}": count for (tenant, cls), count in self._in_flight.items()}
+            }
+
+bulkheads: Dict[str, Bulkhead] = {
+    name: Bulkhead(name, settings["max_workers"], settings["max_queue"], settings.get("reserved"))
+    for name, settings in BULKHEADS.items()
+}
+
+db_bulkhead = bulkheads["db"]
+gcs_bulkhead = bulkheads["gcs"]
+model_bulkhead = bulkheads["model"]
+export_bulkhead = bulkheads["export"]
+
+def get_bulkhead_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: bulkhead.stats() for name, bulkhead in bulkheads.items()}
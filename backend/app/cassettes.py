@@ -0,0 +1,299 @@
+from typing import Any, Dict, Iterator, List
+from datetime import datetime
+from .config import CASSETTE_MODE, CASSETTE_DIR, CASSETTE_REPLAY_SPEED
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+class CassetteNotFound(LookupError):
+    """Raised in replay mode when no recording exists for a request"""
+
+    def __init__(self, kind: str, key: str, description: str):
+        super().__init__(f"No {kind} cassette for {description} ({key}); record it with CASSETTE_MODE='record'")
+
+def _plain(value: Any) -> Any:
+    """Convert SDK objects (pydantic models) into JSON-compatible values"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+class Cassette:
+    """Directory of recorded calls, one JSON file per distinct request.
+    
+    Requests are keyed by a hash of their canonical JSON form, so the same
+    prompt over the same documents always maps to the same recording.
+    """
+
+    def __init__(self, root: str, mode: str, speed: float):
+        self.root = root
+        self.mode = mode
+        self.speed = speed
+
+    def key(self, request: Dict[str, Any]) -> str:
+        canonical = json.dumps(_plain(request), sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def path(self, kind: str, key: str, suffix: str = ".json") -> str:
+        return os.path.join(self.root, kind, key[:2], key + suffix)
+
+    def save(self, kind: str, key: str, data: Dict[str, Any]) -> None:
+        path = self.path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so concurrent readers never see a partial cassette
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as out:
+            json.dump(data, out, default=str)
+        os.replace(tmp_path, path)
+
+    def save_file(self, kind: str, key: str, source_path: str) -> None:
+        path = self.path(kind, key, ".bin")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(source_path, path)
+
+    def save_bytes(self, kind: str, key: str, data: bytes) -> None:
+        path = self.path(kind, key, ".bin")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as out:
+            out.write(data)
+
+    def load(self, kind: str, key: str, description: str) -> Dict[str, Any]:
+        try:
+            with open(self.path(kind, key), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise CassetteNotFound(kind, key, description)
+
+    def pause(self, seconds: float) -> None:
+        """Reproduce recorded latency, scaled by the replay speed"""
+        if self.speed > 0 and seconds > 0:
+            time.sleep(seconds / self.speed)
+
+_cassette = Cassette(CASSETTE_DIR, CASSETTE_MODE, CASSETTE_REPLAY_SPEED)
+
+def get_cassette() -> Cassette:
+    return _cassette
+
+# Gemini
+
+def _gemini_request(method: str, model: str, contents: Any, config: Any) -> Dict[str, Any]:
+    return {"method": method, "model": model, "contents": contents, "config": config}
+
+def _response_from(data: Dict[str, Any]):
+    from google.genai import types
+    return types.GenerateContentResponse.model_validate(data)
+
+class _CassetteModels:
+    """Stands in for client.models, recording or replaying generate_content calls"""
+
+    def __init__(self, cassette: Cassette, models=None):
+        self._cassette = cassette
+        self._models = models
+
+    def __getattr__(self, name):
+        if self._models is None:
+            raise AttributeError(f"models.{name} is not available in cassette replay mode")
+        return getattr(self._models, name)
+
+    def generate_content(self, *, model: str, contents: Any, config: Any = None):
+        key = self._cassette.key(_gemini_request("generate_content", model, contents, config))
+        if self._cassette.mode == "replay":
+            recording = self._cassette.load("gemini", key, f"generate_content on {model}")
+            self._cassette.pause(recording["seconds"])
+            return _response_from(recording["response"])
+
+        started = time.perf_counter()
+        response = self._models.generate_content(model=model, contents=contents, config=config)
+        self._cassette.save("gemini", key, {
+            "method": "generate_content",
+            "model": model,
+            "recorded_at": datetime.now().isoformat(),
+            "seconds": round(time.perf_counter() - started, 4),
+            "response": _plain(response),
+        })
+        return response
+
+    def generate_content_stream(self, *, model: str, contents: Any, config: Any = None) -> Iterator[Any]:
+        key = self._cassette.key(_gemini_request("generate_content_stream", model, contents, config))
+        if self._cassette.mode == "replay":
+            return self._replay_stream(key, model)
+        return self._record_stream(key, model, self._models.generate_content_stream(
+            model=model, contents=contents, config=config
+        ))
+
+    def _replay_stream(self, key: str, model: str) -> Iterator[Any]:
+        recording = self._cassette.load("gemini", key, f"generate_content_stream on {model}")
+        previous = 0.0
+        for chunk in recording["chunks"]:
+            self._cassette.pause(chunk["offset"] - previous)
+            previous = chunk["offset"]
+            yield _response_from(chunk["response"])
+
+    def _record_stream(self, key: str, model: str, stream: Iterator[Any]) -> Iterator[Any]:
+        started = time.perf_counter()
+        chunks = []
+        for chunk in stream:
+            chunks.append({"offset": round(time.perf_counter() - started, 4), "response": _plain(chunk)})
+            yield chunk
+        # Only complete streams are saved; an abandoned stream leaves no cassette
+        self._cassette.save("gemini", key, {
+            "method": "generate_content_stream",
+            "model": model,
+            "recorded_at": datetime.now().isoformat(),
+            "seconds": chunks[-1]["offset"] if chunks else 0.0,
+            "chunks": chunks,
+        })
+
+class CassetteGeminiClient:
+    """Wraps a genai.Client (None in replay mode) so model calls go through the cassette"""
+
+    def __init__(self, cassette: Cassette, client=None):
+        self._client = client
+        self.models = _CassetteModels(cassette, client.models if client is not None else None)
+
+    def __getattr__(self, name):
+        if self._client is None:
+            raise AttributeError(f"client.{name} is not available in cassette replay mode")
+        return getattr(self._client, name)
+
+# Cloud Storage
+
+BLOB_FIELDS = ("name", "size", "time_created", "updated", "content_type", "md5_hash")
+
+def _blob_meta(blob) -> Dict[str, Any]:
+    meta = {}
+    for field in BLOB_FIELDS:
+        value = getattr(blob, field, None)
+        meta[field] = value.isoformat() if hasattr(value, "isoformat") else value
+    return meta
+
+class _ReplayBlob:
+    """Blob metadata and content served from a cassette"""
+
+    def __init__(self, cassette: Cassette, bucket_name: str, meta: Dict[str, Any], key: str = None):
+        self._cassette = cassette
+        self._key = key
+        self.bucket_name = bucket_name
+        for field in BLOB_FIELDS:
+            setattr(self, field, meta.get(field))
+        for field in ("time_created", "updated"):
+            if getattr(self, field):
+                setattr(self, field, datetime.fromisoformat(getattr(self, field)))
+
+    def _content_path(self) -> str:
+        path = self._cassette.path("gcs", self._key, ".bin") if self._key else None
+        if not path or not os.path.exists(path):
+            raise CassetteNotFound("gcs", self._key or "-", f"content of gs://{self.bucket_name}/{self.name}")
+        return path
+
+    def download_as_bytes(self) -> bytes:
+        with open(self._content_path(), "rb") as f:
+            return f.read()
+
+    def download_to_filename(self, filename: str) -> None:
+        shutil.copyfile(self._content_path(), filename)
+
+    def upload_from_filename(self, filename: str) -> None:
+        logging.info(f"Cassette replay: skipping upload of {filename} to gs://{self.bucket_name}/{self.name}")
+
+class _RecordingBlob:
+    """Proxies a real blob and saves downloaded content to the cassette"""
+
+    def __init__(self, cassette: Cassette, key: str, blob):
+        self._cassette = cassette
+        self._key = key
+        self._blob = blob
+
+    def __getattr__(self, name):
+        return getattr(self._blob, name)
+
+    def download_as_bytes(self) -> bytes:
+        data = self._blob.download_as_bytes()
+        self._cassette.save_bytes("gcs", self._key, data)
+        return data
+
+    def download_to_filename(self, filename: str) -> None:
+        self._blob.download_to_filename(filename)
+        self._cassette.save_file("gcs", self._key, filename)
+
+class _CassetteBucket:
+    def __init__(self, cassette: Cassette, name: str, bucket=None):
+        self._cassette = cassette
+        self._bucket = bucket
+        self.name = name
+
+    def list_blobs(self, prefix: str = None, max_results: int = None) -> List[Any]:
+        key = self._cassette.key({"method": "list_blobs", "bucket": self.name, "prefix": prefix, "max_results": max_results})
+        if self._cassette.mode == "replay":
+            recording = self._cassette.load("gcs", key, f"list_blobs gs://{self.name}/{prefix or ''}")
+            self._cassette.pause(recording["seconds"])
+            return [_ReplayBlob(self._cassette, self.name, meta) for meta in recording["blobs"]]
+
+        started = time.perf_counter()
+        blobs = list(self._bucket.list_blobs(prefix=prefix, max_results=max_results))
+        self._cassette.save("gcs", key, {
+            "method": "list_blobs",
+            "seconds": round(time.perf_counter() - started, 4),
+            "blobs": [_blob_meta(blob) for blob in blobs],
+        })
+        return blobs
+
+    def get_blob(self, blob_name: str):
+        key = self._cassette.key({"method": "get_blob", "bucket": self.name, "blob": blob_name})
+        if self._cassette.mode == "replay":
+            recording = self._cassette.load("gcs", key, f"gs://{self.name}/{blob_name}")
+            self._cassette.pause(recording["seconds"])
+            if recording["blob"] is None:
+                return None
+            return _ReplayBlob(self._cassette, self.name, recording["blob"], key)
+
+        started = time.perf_counter()
+        blob = self._bucket.get_blob(blob_name)
+        self._cassette.save("gcs", key, {
+            "method": "get_blob",
+            "seconds": round(time.perf_counter() - started, 4),
+            "blob": _blob_meta(blob) if blob is not None else None,
+        })
+        return _RecordingBlob(self._cassette, key, blob) if blob is not None else None
+
+    def blob(self, blob_name: str):
+        if self._cassette.mode == "replay":
+            return _ReplayBlob(self._cassette, self.name, {"name": blob_name})
+        return self._bucket.blob(blob_name)
+
+class CassetteStorageClient:
+    """Wraps a storage.Client (None in replay mode) so bucket reads go through the cassette"""
+
+    def __init__(self, cassette: Cassette, client=None):
+        self._cassette = cassette
+        self._client = client
+
+    def bucket(self, name: str) -> _CassetteBucket:
+        return _CassetteBucket(self._cassette, name, self._client.bucket(name) if self._client is not None else None)
+
+def wrap_gemini_client(client=None):
+    """Return `client` unchanged unless record/replay mode is on"""
+    if _cassette.mode == "off":
+        return client
+    logging.info(f"Gemini calls in cassette {_cassette.mode} mode ({_cassette.root})")
+    return CassetteGeminiClient(_cassette, client)
+
+def wrap_storage_client(client=None):
+    """Return `client` unchanged unless record/replay mode is on"""
+    if _cassette.mode == "off":
+        return client
+    logging.info(f"GCS calls in cassette {_cassette.mode} mode ({_cassette.root})")
+    return CassetteStorageClient(_cassette, client)
+
+def replaying() -> bool:
+    """True when calls are served from cassettes and no real clients should be created"""
+    return _cassette.mode == "replay"
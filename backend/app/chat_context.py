@@ -0,0 +1,156 @@
+from typing import Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from .config import (
+    CHAT_RAW_TURNS, CHAT_PROMPT_TOKEN_BUDGET, CHAT_SUMMARY_MODEL, CHAT_SUMMARY_MAX_TOKENS,
+    CHAT_COMPACTION_WORKERS, CHAT_COMPACTION_MAX_TURNS, CHAT_COMPACTION_TOKEN_BUDGET
+)
+import logging
+import threading
+
+# Background workers fold older turns into each session's running summary
+_compaction_executor = ThreadPoolExecutor(max_workers=CHAT_COMPACTION_WORKERS, thread_name_prefix="compaction")
+_pending_sessions = set()
+_pending_lock = threading.Lock()
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    max_chars = max(max_tokens, 0) * 4
+    return text if len(text) <= max_chars else text[:max_chars] + " [truncated]"
+
+def render_analysis_summary(analysis_summary: Any) -> str:
+    """Render the stored analysis_summary (dict or text) as plain text"""
+    if isinstance(analysis_summary, dict):
+        return "\n".join(str(v) for v in analysis_summary.values() if v)
+    return str(analysis_summary or "")
+
+def load_chat_context(session_id: str) -> Dict[str, Any]:
+    """Load the running summary and the last few raw turns for a session"""
+    from app.dao import get_recent_conversation_turns, get_session_summary
+    session_summary = get_session_summary(session_id)
+    return {
+        "summary": session_summary["summary"] if session_summary else "",
+        "recent_turns": get_recent_conversation_turns(session_id, CHAT_RAW_TURNS)
+    }
+
+def build_chat_prompt(startup_name: str, analysis_summary: Any, session_summary: str,
+                      recent_turns: List[Dict[str, Any]], user_message: str,
+                      token_budget: int = CHAT_PROMPT_TOKEN_BUDGET) -> str:
+    """Assemble the chat prompt from the analysis prefix, the running summary and recent turns.
+
+    The analysis and the user message are always included. Up to a third of the
+    remaining budget is reserved for the running summary; recent turns fill the rest,
+    newest first, so the oldest turns are dropped when they do not fit. The summary
+    is then truncated to whatever budget the kept turns leave.
+    """
+    analysis_text = render_analysis_summary(analysis_summary)
+    header = f"""You are an expert startup analyst assistant discussing {startup_name}.
+STARTUP ANALYSIS SUMMARY (your primary knowledge base):
+{analysis_text}
+"""
+    footer = f"""Based on this analysis summary and conversation history, provide accurate, insightful responses about this startup. Provide your answers as plain text only without any markdown, citations, references, or formatting. Reference specific details from the analysis when relevant.
+
+User: {user_message}
+
+Assistant:"""
+
+    remaining = token_budget - estimate_tokens(header) - estimate_tokens(footer)
+
+    # Keep the newest raw turns that fit, leaving room for part of the summary
+    summary_reserve = min(estimate_tokens(session_summary), max(remaining // 3, 0)) if session_summary else 0
+    turn_lines = []
+    turn_budget = remaining - summary_reserve
+    for msg in reversed(recent_turns):
+        role = "User" if msg['sender'] == 'user' else "Assistant"
+        line = f"{role}: {msg['message']}"
+        cost = estimate_tokens(line)
+        if cost > turn_budget:
+            break
+        turn_lines.insert(0, line)
+        turn_budget -= cost
+    remaining -= sum(estimate_tokens(line) for line in turn_lines)
+
+    sections = [header]
+    if session_summary:
+        sections.append(f"EARLIER CONVERSATION (summary):\n{_truncate_to_tokens(session_summary, remaining)}\n")
+    sections.append("RECENT CONVERSATION:\n" + ("\n".join(turn_lines) if turn_lines else "No previous conversation.") + "\n")
+    sections.append(footer)
+    return "\n".join(sections)
+
+def compact_session(session_id: str) -> Optional[Dict[str, Any]]:
+    """Fold the oldest unsummarized turns, except the last CHAT_RAW_TURNS, into the session's running summary.
+
+    One pass folds at most CHAT_COMPACTION_MAX_TURNS turns and CHAT_COMPACTION_TOKEN_BUDGET
+    tokens of transcript; if more are waiting, another pass is scheduled.
+    """
+    from app.dao import get_session_summary, get_unsummarized_conversation_turns, upsert_session_summary
+    from app.gemini_service import initialize_gemini_client
+    from google.genai import types
+
+    existing = get_session_summary(session_id)
+    # Read CHAT_RAW_TURNS extra so the newest turns can be held back when the backlog ends in this page
+    limit = CHAT_COMPACTION_MAX_TURNS + CHAT_RAW_TURNS
+    turns = get_unsummarized_conversation_turns(session_id, existing["summarized_through"] if existing else None, limit)
+    candidates = turns[:-CHAT_RAW_TURNS] if CHAT_RAW_TURNS else turns
+
+    to_fold, lines, tokens = [], [], 0
+    for turn in candidates:
+        line = f"User: {turn['user_message']}\nAssistant: {turn['model_response']}"
+        cost = estimate_tokens(line)
+        if to_fold and tokens + cost > CHAT_COMPACTION_TOKEN_BUDGET:
+            break
+        to_fold.append(turn)
+        lines.append(_truncate_to_tokens(line, CHAT_COMPACTION_TOKEN_BUDGET))
+        tokens += cost
+    if not to_fold:
+        return existing
+    transcript = "\n".join(lines)
+    previous = existing["summary"] if existing else "None yet."
+    prompt = f"""Update the running summary of a conversation between an investment analyst and an assistant about a startup.
+Keep every figure, name, decision and open question that may matter later. Write compact plain text, at most {CHAT_SUMMARY_MAX_TOKENS // 2} words.
+
+CURRENT SUMMARY:
+{previous}
+
+NEW TURNS TO FOLD IN:
+{transcript}
+
+UPDATED SUMMARY:"""
+
+    response = initialize_gemini_client().models.generate_content(
+        model=CHAT_SUMMARY_MODEL,
+        contents=prompt,
+        config=types.GenerateContentConfig(
+            temperature=0.2,
+            max_output_tokens=CHAT_SUMMARY_MAX_TOKENS,
+            thinking_config=types.ThinkingConfig(thinking_budget=0),
+        ),
+    )
+    summary = (response.text or "").strip()
+    if not summary:
+        return existing
+
+    turns_summarized = (existing["turns_summarized"] if existing else 0) + len(to_fold)
+    upsert_session_summary(session_id, summary, to_fold[-1]["created_at"], turns_summarized)
+    if len(to_fold) < len(candidates) or len(turns) == limit:
+        schedule_compaction(session_id)
+    return {"session_id": session_id, "summary": summary, "turns_summarized": turns_summarized}
+
+def schedule_compaction(session_id: str) -> None:
+    """Queue compact_session for a session unless it is already queued"""
+    with _pending_lock:
+        if session_id in _pending_sessions:
+            return
+        _pending_sessions.add(session_id)
+
+    def run():
+        with _pending_lock:
+            _pending_sessions.discard(session_id)
+        try:
+            compact_session(session_id)
+        except Exception as e:
+            logging.error(f"Chat history compaction failed for {session_id}: {e}")
+
+    _compaction_executor.submit(run)
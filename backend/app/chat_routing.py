@@ -0,0 +1,133 @@
+from typing import Dict, Any, List
+from .config import CHAT_DIRECT_ANSWERS, CHAT_MODEL_ROUTES
+import json
+import re
+import time
+
+# extracted_data field -> phrases that refer to it in a question
+FIELD_ALIASES = {
+    "company_name": ["company name", "official name"],
+    "website_url": ["website", "url", "homepage"],
+    "industry": ["industry", "sector"],
+    "valuation": ["valuation", "valued"],
+    "funding_rounds": ["funding rounds", "how many rounds"],
+    "type_of_funding": ["type of funding", "funding type"],
+    "founders_info": ["founder", "founders", "founded by", "founding team"],
+    "number_of_employees": ["employees", "headcount", "team size", "number of staff"],
+    "headquarters": ["headquarters", "hq", "headquartered"],
+    "business_model": ["business model"],
+    "revenue": ["revenue", "total sales"],
+    "arr": ["arr", "annual recurring revenue"],
+    "profit": ["profit", "net income"],
+    "current_investors_stake": ["investor stake", "investors stake", "ownership"],
+    "tam": ["tam", "total addressable market", "market size"],
+    "liabilities": ["liabilities", "debt"],
+    "cac": ["cac", "customer acquisition cost"],
+    "burn_rate": ["burn rate", "burn"],
+    "runway": ["runway"],
+    "cash_reserve": ["cash reserve", "cash reserves", "cash in bank"],
+    "fixed_assets": ["fixed assets"],
+    "marketing_cost": ["marketing cost", "marketing spend", "marketing budget"],
+    "operations_cost": ["operations cost", "operational expenses", "opex"],
+    "risk_gauge": ["risk score", "risk gauge", "risk rating"],
+    "usp": ["usp", "unique selling"],
+    "patents": ["patent", "patents"],
+    "growth": ["growth rate"],
+}
+
+# Nouns that turn a field name into a different question: "revenue model", "employee turnover"
+QUALIFIER_NOUNS = (
+    "model", "models", "growth", "cost", "costs", "turnover", "breakdown", "mix", "split", "strategy",
+    "stream", "streams", "trend", "trends", "target", "targets", "projection", "projections", "multiple", "per",
+)
+QUALIFIED = rf"(?!\s+(?:{'|'.join(QUALIFIER_NOUNS)})\b)"
+
+# Words that signal the question needs fresh outside information or open-ended reasoning
+RESEARCH_PATTERN = re.compile(
+    r"\b(latest|recent|news|today|current(ly)?|now|compare|comparison|competitor|competitors|peers?|"
+    r"market trends?|why|should (we|i)|recommend|outlook|forecast|predict|search)\b",
+    re.IGNORECASE,
+)
+QUESTION_WORDS = ("what", "who", "where", "how much", "how many", "when", "which", "tell me", "show")
+DIRECT_MAX_WORDS = 12
+
+def _as_dict(value: Any) -> Dict[str, Any]:
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+def match_fields(message: str) -> List[str]:
+    """Return the extracted_data fields a message refers to; "revenue model" does not refer to revenue"""
+    lowered = message.lower()
+    matched = []
+    for field, aliases in FIELD_ALIASES.items():
+        if any(re.search(rf"\b{re.escape(alias)}\b{QUALIFIED}", lowered) for alias in aliases):
+            matched.append(field)
+    # "total runway" and "runway" both match plain runway questions; prefer the specific one
+    if "runway" in matched and "total runway" in lowered:
+        matched.remove("runway")
+        matched.append("total_runway")
+    return matched
+
+def asks_for_field(message: str, field: str) -> bool:
+    """True when the field name ends the question, as in "What is the revenue?" (but not "the revenue growth?")"""
+    lowered = message.strip().lower().rstrip("?.! ")
+    aliases = FIELD_ALIASES.get(field) or [field.replace("_", " ")]
+    return any(re.search(rf"\b{re.escape(alias)}$", lowered) for alias in aliases)
+
+def _direct_answer(field: str, value: str, startup_name: str) -> str:
+    label = field.replace("_", " ")
+    return f"According to the stored analysis, the {label} of {startup_name} is: {value}"
+
+def route_chat_message(message: str, analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """Pick how to answer a chat message: directly from extracted_data, the fast model or the research model.
+    
+    The returned decision carries the model, grounding flag and token budget to use,
+    plus the reason and routing time so it can be recorded with the conversation.
+    """
+    started = time.perf_counter()
+    extracted_data = _as_dict(analysis.get("extracted_data"))
+    startup_name = analysis.get("startup_name", "Unknown Company")
+    fields = match_fields(message)
+    words = len(message.split())
+    lowered = message.strip().lower()
+
+    decision = None
+    if RESEARCH_PATTERN.search(message):
+        decision = dict(CHAT_MODEL_ROUTES["research"], route="research", reason="needs fresh or open-ended information")
+    elif (CHAT_DIRECT_ANSWERS and len(fields) == 1 and words <= DIRECT_MAX_WORDS
+          and lowered.startswith(QUESTION_WORDS) and asks_for_field(message, fields[0])):
+        value = str(extracted_data.get(fields[0], "Not specified"))
+        if value and value != "Not specified":
+            decision = {
+                "route": "direct",
+                "model": None,
+                "grounding": False,
+                "max_output_tokens": 0,
+                "reason": f"answered from extracted_data.{fields[0]}",
+                "answer": _direct_answer(fields[0], value, startup_name)
+            }
+    if decision is None:
+        if words > 60:
+            decision = dict(CHAT_MODEL_ROUTES["research"], route="research", reason="long, open-ended message")
+        else:
+            decision = dict(CHAT_MODEL_ROUTES["fast"], route="fast", reason="answerable from the stored analysis")
+
+    decision["fields"] = fields
+    decision["routing_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return decision
+
+def decision_meta(decision: Dict[str, Any], latency_seconds: float) -> Dict[str, Any]:
+    """The subset of a routing decision stored in conversations.model_meta"""
+    return {
+        "route": decision["route"],
+        "model": decision["model"],
+        "grounding": decision["grounding"],
+        "max_output_tokens": decision["max_output_tokens"],
+        "reason": decision["reason"],
+        "routing_ms": decision["routing_ms"],
+        "latency_ms": round(latency_seconds * 1000, 1)
+    }
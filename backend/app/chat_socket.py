@@ -0,0 +1,144 @@
+from typing import Any, AsyncIterator, Dict, List, Optional
+from contextlib import aclosing
+from .bulkheads import db_bulkhead, model_bulkhead
+from .config import ANSWER_CACHE_ENABLED, CHAT_RAW_TURNS
+import asyncio
+import logging
+import time
+
+class ChatSession:
+    """Chat state for one open WebSocket: analysis, running summary and recent turns.
+
+    The context is loaded once when the socket opens and then kept in memory, so
+    each turn only builds a prompt and streams the model response. Turns are
+    written to conversations in order by a background writer task; close() waits
+    for pending writes.
+    """
+
+    def __init__(self, gcs_key: str, analysis: Dict[str, Any], summary: str, recent_turns: List[Dict[str, Any]]):
+        from app.answer_cache import analysis_version
+        self.gcs_key = gcs_key
+        self.analysis = analysis
+        self.startup_name = analysis.get('startup_name', 'Unknown')
+        self.version = analysis_version(analysis)
+        self.summary = summary
+        self.recent_turns = recent_turns
+        self.turns = 0
+        # Older turns left the in-memory window; re-read the compacted summary before the next turn
+        self._summary_stale = False
+        self._writes: asyncio.Queue = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_turns())
+
+    @classmethod
+    async def open(cls, gcs_key: str) -> Optional["ChatSession"]:
+        """Load the analysis and chat context for a session; None if there is no analysis"""
+        from app.chat_context import load_chat_context
+        from app.dao import get_analysis_result
+        analysis = await db_bulkhead.run(get_analysis_result, gcs_key)
+        if not analysis:
+            return None
+        chat_context = await db_bulkhead.run(load_chat_context, gcs_key)
+        return cls(gcs_key, analysis, chat_context["summary"], chat_context["recent_turns"])
+
+    async def _write_turns(self) -> None:
+        from app.chat_context import schedule_compaction
+        from app.dao import store_conversation_pair
+        while True:
+            turn = await self._writes.get()
+            if turn is None:
+                return
+            try:
+                await db_bulkhead.run(store_conversation_pair, self.gcs_key, turn["message"], turn["answer"],
+                                      self.startup_name, turn["model_meta"])
+                schedule_compaction(self.gcs_key)
+            except Exception as e:
+                logging.error(f"Failed to store chat turn for {self.gcs_key}: {e}")
+
+    def _remember(self, message: str, answer: str, model_meta: Dict[str, Any]) -> None:
+        """Keep the turn in memory and queue it for storage"""
+        self.recent_turns.append({"message": message, "sender": "user"})
+        self.recent_turns.append({"message": answer, "sender": "assistant"})
+        if len(self.recent_turns) > 2 * CHAT_RAW_TURNS:
+            self.recent_turns = self.recent_turns[-2 * CHAT_RAW_TURNS:]
+            self._summary_stale = True
+        self.turns += 1
+        self._writes.put_nowait({"message": message, "answer": answer, "model_meta": model_meta})
+
+    async def _refresh_summary(self) -> None:
+        from app.dao import get_session_summary
+        session_summary = await db_bulkhead.run(get_session_summary, self.gcs_key)
+        if session_summary:
+            self.summary = session_summary["summary"]
+        self._summary_stale = False
+
+    async def ask(self, message: str) -> AsyncIterator[Dict[str, Any]]:
+        """Answer one message, yielding {"type": "token"} events and a final {"type": "done"}"""
+        from app.answer_cache import UNCACHED_ROUTES, answer_cache
+        from app.chat_context import build_chat_prompt
+        from app.chat_routing import route_chat_message, decision_meta
+        started = time.perf_counter()
+
+        # Repeated questions about the same analysis are served from the answer cache
+        cached = answer_cache.lookup(self.gcs_key, message, self.version) if ANSWER_CACHE_ENABLED else None
+        if cached:
+            model_meta = {
+                "route": "cache",
+                "similarity": cached["similarity"],
+                "cached_question": cached["question"],
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+            yield {"type": "token", "text": cached["answer"]}
+            self._remember(message, cached["answer"], model_meta)
+            yield {"type": "done", "route": model_meta}
+            return
+
+        decision = route_chat_message(message, self.analysis)
+        if decision["route"] == "direct":
+            answer = decision["answer"]
+            yield {"type": "token", "text": answer}
+        else:
+            if self._summary_stale:
+                await self._refresh_summary()
+            prompt = build_chat_prompt(
+                self.startup_name, self.analysis.get('analysis_summary', ''), self.summary, self.recent_turns, message
+            )
+            chunks = []
+            async with aclosing(_stream_model(prompt, decision)) as stream:
+                async for text in stream:
+                    chunks.append(text)
+                    yield {"type": "token", "text": text}
+            answer = "".join(chunks)
+            if ANSWER_CACHE_ENABLED and answer and decision["route"] not in UNCACHED_ROUTES:
+                answer_cache.store(self.gcs_key, message, answer, self.version)
+
+        model_meta = decision_meta(decision, time.perf_counter() - started)
+        logging.info(f"Chat socket route for {self.gcs_key}: {model_meta}")
+        self._remember(message, answer, model_meta)
+        yield {"type": "done", "route": model_meta}
+
+    async def close(self) -> None:
+        """Flush queued turn writes and stop the writer"""
+        self._writes.put_nowait(None)
+        await self._writer
+
+async def _stream_model(prompt: str, decision: Dict[str, Any]) -> AsyncIterator[str]:
+    from google.genai import types
+    from app.gemini_service import initialize_gemini_client
+    client = initialize_gemini_client()
+
+    # Ground with Google Search only on the research route
+    tools = [types.Tool(google_search=types.GoogleSearch())] if decision["grounding"] else []
+    config = types.GenerateContentConfig(
+        tools=tools,
+        temperature=0.7,
+        max_output_tokens=decision["max_output_tokens"],
+    )
+    # The blocking stream is consumed on a model bulkhead thread, not the event loop
+    stream = model_bulkhead.stream(
+        lambda: client.models.generate_content_stream(model=decision["model"], contents=prompt, config=config)
+    )
+    async with aclosing(stream):
+        async for chunk in stream:
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
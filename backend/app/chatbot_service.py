@@ -1,13 +1,17 @@
-from google import genai
-from google.genai import types
 from typing import Dict, Any, List
 import logging
+import time
 
 def generate_chat_response_gemini(gcs_key: str, user_message: str) -> Dict[str, Any]:
     """Generate chatbot response using direct Gemini API"""
     
     try:
-        from app.dao import get_analysis_result, get_conversation_history, store_conversation_pair
+        from google.genai import types
+        from app.answer_cache import UNCACHED_ROUTES, answer_cache, analysis_version
+        from app.chat_context import build_chat_prompt, load_chat_context, schedule_compaction
+        from app.chat_routing import route_chat_message, decision_meta
+        from app.config import ANSWER_CACHE_ENABLED
+        from app.dao import get_analysis_result, store_conversation_pair
         from app.gemini_service import initialize_gemini_client
         
         # Get analysis summary for context
@@ -21,52 +25,68 @@ def generate_chat_response_gemini(gcs_key: str, user_message: str) -> Dict[str,
         analysis_summary = analysis_result.get('analysis_summary', '')
         startup_name = analysis_result.get('startup_name', 'Unknown Company')
         
-        # Get conversation history
-        conversation_history = get_conversation_history(session_id=gcs_key, limit=10)
-        
-        # Build conversation context
-        context_lines = []
-        for msg in conversation_history:
-            role = "User" if msg['sender'] == 'user' else "Assistant"
-            context_lines.append(f"{role}: {msg['message']}")
-        
-        conversation_context = "\n".join(context_lines) if context_lines else "No previous conversation."
-        
-        # Create comprehensive system prompt
-        system_prompt = f"""You are an expert startup analyst assistant discussing {startup_name}.
-                STARTUP ANALYSIS SUMMARY (your primary knowledge base):
-                {analysis_summary}
-                CONVERSATION HISTORY:
-                {conversation_context}
-                Based on this analysis summary and conversation history, provide accurate, insightful responses about this startup. Provide your answers as plain text only without any markdown, citations, references, or formatting. Reference specific details from the analysis when relevant.
-                """
-
-        
-        # Initialize Gemini client
-        client = initialize_gemini_client()
-        # Define the grounding tool with Google Search
-        grounding_tool = types.Tool(google_search=types.GoogleSearch())
-
-        # Configure generation settings with grounding tool enabled
-        config = types.GenerateContentConfig(
-            tools=[grounding_tool],
-            temperature=0.7,
-            max_output_tokens=1000,
-        )
+        # Repeated questions about the same analysis are served from the answer cache
+        started = time.perf_counter()
+        version = analysis_version(analysis_result)
+        cached = answer_cache.lookup(gcs_key, user_message, version) if ANSWER_CACHE_ENABLED else None
+        if cached:
+            model_meta = {
+                "route": "cache",
+                "similarity": cached["similarity"],
+                "cached_question": cached["question"],
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+            store_conversation_pair(gcs_key, user_message, cached["answer"], startup_name, model_meta=model_meta)
+            schedule_compaction(gcs_key)
+            return {
+                "status": "success",
+                "session_id": gcs_key,
+                "startup_name": startup_name,
+                "user_message": user_message,
+                "bot_response": cached["answer"],
+                "has_analysis_context": bool(analysis_summary),
+                "route": model_meta
+            }
         
-        # SIMPLIFIED: Use string contents and `config` as dictionary instead of generation_config
-        full_prompt = f"{system_prompt}\n\nUser: {user_message}\n\nAssistant:"
+        # Pick the model tier (or a direct answer) for this message
+        decision = route_chat_message(user_message, analysis_result)
         
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
-            contents=full_prompt,
-            config=config 
-        )
+        if decision["route"] == "direct":
+            bot_response = decision["answer"]
+        else:
+            # Running summary of older turns plus the last few turns verbatim, under a token budget
+            chat_context = load_chat_context(gcs_key)
+            full_prompt = build_chat_prompt(
+                startup_name, analysis_summary, chat_context["summary"], chat_context["recent_turns"], user_message
+            )
+            
+            # Initialize Gemini client
+            client = initialize_gemini_client()
+            
+            # Ground with Google Search only on the research route
+            tools = [types.Tool(google_search=types.GoogleSearch())] if decision["grounding"] else []
+            config = types.GenerateContentConfig(
+                tools=tools,
+                temperature=0.7,
+                max_output_tokens=decision["max_output_tokens"],
+            )
+            
+            response = client.models.generate_content(
+                model=decision["model"],
+                contents=full_prompt,
+                config=config 
+            )
+            
+            bot_response = response.text.strip()
+            if ANSWER_CACHE_ENABLED and decision["route"] not in UNCACHED_ROUTES:
+                answer_cache.store(gcs_key, user_message, bot_response, version)
         
-        bot_response = response.text.strip()
+        model_meta = decision_meta(decision, time.perf_counter() - started)
+        logging.info(f"Chat route for {gcs_key}: {model_meta}")
         
         # Store conversation pair (single row with both user message and bot response)
-        store_conversation_pair(gcs_key, user_message, bot_response, startup_name)
+        store_conversation_pair(gcs_key, user_message, bot_response, startup_name, model_meta=model_meta)
+        schedule_compaction(gcs_key)
         
         return {
             "status": "success",
@@ -74,7 +94,8 @@ def generate_chat_response_gemini(gcs_key: str, user_message: str) -> Dict[str,
             "startup_name": startup_name,
             "user_message": user_message,
             "bot_response": bot_response,
-            "has_analysis_context": bool(analysis_summary)
+            "has_analysis_context": bool(analysis_summary),
+            "route": model_meta
         }
         
     except Exception as e:
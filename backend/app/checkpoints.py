@@ -0,0 +1,140 @@
+from typing import Any, Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from .config import REPARSE_WORKERS
+import logging
+import multiprocessing
+
+SECTION_NAMES = ("short_summary", "analysis", "peer_comparison")
+
+def _file_version(file: Dict[str, Any]) -> tuple:
+    # md5 is missing for composite objects; fall back to size and update time
+    return (file.get("md5_hash"),) if file.get("md5_hash") else (file.get("size"), file.get("updated"))
+
+def manifest_signature(files: List[Dict[str, Any]]) -> List[tuple]:
+    """What identifies a run's inputs: each file's path and version (content hash, or size and update time)"""
+    return sorted(((file.get("full_path"),) + _file_version(file) for file in files), key=lambda entry: str(entry[0]))
+
+def diff_manifests(previous: List[Dict[str, Any]], current: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Object names added, changed or removed between two manifests"""
+    before = {file["name"]: _file_version(file) for file in previous}
+    after = {file["name"]: _file_version(file) for file in current}
+    return {
+        "added": sorted(name for name in after if name not in before),
+        "changed": sorted(name for name in after if name in before and after[name] != before[name]),
+        "removed": sorted(name for name in before if name not in after),
+        "unchanged": sorted(name for name in after if name in before and after[name] == before[name]),
+    }
+
+class AnalysisCheckpoint:
+    """Checkpoints one analysis run's artifacts so a failed run can resume.
+    
+    Extracted texts are reused whenever the folder's manifest is unchanged.
+    Raw model output is reused only if the previous run never completed, so an
+    explicit re-run after a stored result still calls the model.
+    """
+
+    def __init__(self, gcs_key: str, startup_name: str, execution: str, resume: bool = True):
+        self.gcs_key = gcs_key
+        self.startup_name = startup_name
+        self.execution = execution
+        self.resume = resume
+        self.extracted_texts: Optional[Dict[str, str]] = None
+        self.generated: Dict[str, Any] = {}
+        self.resumed_from: Optional[str] = None
+
+    def begin(self, files: List[Dict[str, Any]]) -> None:
+        """Load reusable artifacts for this manifest, or start a fresh checkpoint"""
+        from app.dao import get_analysis_artifacts, start_analysis_artifacts
+        previous = get_analysis_artifacts(self.gcs_key, self.startup_name) if self.resume else None
+        if previous and manifest_signature(previous["manifest"]) == manifest_signature(files):
+            self.extracted_texts = previous["extracted_texts"]
+            if previous["stage"] != "stored" and previous["execution"] == self.execution:
+                self.generated = previous["generated_content"] or {}
+                self.resumed_from = previous["stage"]
+                logging.info(f"Resuming analysis of {self.gcs_key} from stage '{previous['stage']}'")
+                return
+        start_analysis_artifacts(self.gcs_key, self.startup_name, self.execution, files, self.extracted_texts)
+
+    def save_extracted(self, extracted_texts: Dict[str, str]) -> None:
+        from app.dao import update_analysis_artifacts
+        self.extracted_texts = extracted_texts
+        update_analysis_artifacts(self.gcs_key, self.startup_name, "extracted", extracted_texts=extracted_texts)
+
+    def generated_text(self) -> Optional[str]:
+        return self.generated.get("text")
+
+    def generated_section(self, name: str) -> Optional[str]:
+        return (self.generated.get("sections") or {}).get(name)
+
+    def save_generated(self, text: str) -> None:
+        from app.dao import update_analysis_artifacts
+        self.generated = {"text": text}
+        update_analysis_artifacts(self.gcs_key, self.startup_name, "generated", generated_text=text)
+
+    def save_section(self, name: str, text: str) -> None:
+        from app.dao import update_analysis_artifacts
+        update_analysis_artifacts(self.gcs_key, self.startup_name, "generated", generated_section={name: text})
+
+    def mark_stored(self) -> None:
+        from app.dao import update_analysis_artifacts
+        update_analysis_artifacts(self.gcs_key, self.startup_name, "stored")
+
+def is_complete_output(generated_content: Dict[str, Any]) -> bool:
+    """True if raw output covers every section (single call, or all parallel sections)"""
+    if generated_content.get("text"):
+        return True
+    sections = generated_content.get("sections") or {}
+    return all(sections.get(name) for name in SECTION_NAMES)
+
+def reparse_all_analyses(workers: int = REPARSE_WORKERS) -> Dict[str, Any]:
+    """Re-run section splitting and KV extraction over every stored raw output, without the model.
+    
+    Parsing runs in a process pool; results are written back with upsert_analysis_result.
+    Checkpoints with only some parallel sections are skipped.
+    """
+    from app.answer_cache import answer_cache
+    from app.company_profiles import expand_cached_peers
+    from app.controller import parse_raw_output
+    from app.dao import iter_generated_artifacts, upsert_analysis_result
+
+    counts = {"reparsed": 0, "skipped": 0, "failed": 0}
+    errors = []
+
+    def store(row: Dict[str, Any], parsed: Dict[str, Any]) -> None:
+        # Cached peer rows are filled in from the profile store, as after generation
+        parsed["peer_comparison_table"], _ = expand_cached_peers(parsed["peer_comparison_table"])
+        upsert_analysis_result(
+            gcs_key=row["gcs_key"],
+            startup_name=row["startup_name"],
+            extracted_data=parsed["extracted_data"],
+            analysis_summary=parsed["analysis_summary"],
+            files_processed=row["files_processed"],
+            peer_comparison_table=parsed["peer_comparison_table"]
+        )
+        answer_cache.invalidate(row["gcs_key"])
+
+    def drain(pending: List[tuple]) -> None:
+        for row, future in pending:
+            try:
+                store(row, future.result())
+                counts["reparsed"] += 1
+            except Exception as e:
+                counts["failed"] += 1
+                errors.append({"gcs_key": row["gcs_key"], "startup_name": row["startup_name"], "error": str(e)})
+                logging.error(f"Re-parse failed for {row['gcs_key']}: {e}")
+        pending.clear()
+
+    # Keep a bounded number of raw outputs in flight instead of loading them all
+    pending = []
+    # Spawned, not forked, so workers do not inherit the API process's connections and threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for row in iter_generated_artifacts():
+            if not is_complete_output(row["generated_content"]):
+                counts["skipped"] += 1
+                continue
+            pending.append((row, pool.submit(parse_raw_output, row.pop("generated_content"))))
+            if len(pending) >= workers * 4:
+                drain(pending)
+        drain(pending)
+
+    return {"status": "success", **counts, "errors": errors}
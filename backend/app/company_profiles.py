@@ -0,0 +1,158 @@
+from typing import Any, Dict, List, Optional, Tuple
+from .config import COMPANY_PROFILES_ENABLED, COMPANY_PROFILE_MAX_AGE_DAYS, COMPANY_PROFILE_MAX_CACHED_PEERS
+import logging
+import re
+import unicodedata
+
+NAME_COLUMN = "Company Name"
+
+# Legal-form words dropped from the end of a name, so "Acme Pvt. Ltd." and "ACME" share a profile
+COMPANY_SUFFIXES = {
+    "inc", "incorporated", "ltd", "limited", "llc", "llp", "plc", "corp", "corporation", "co", "company",
+    "pvt", "private", "gmbh", "ag", "sa", "bv", "pte", "pty",
+}
+
+# extracted_data field -> peer table column; a startup's own data room beats web research
+EXTRACTED_TO_PEER_COLUMNS = {
+    "founders_info": "Founding Team",
+    "number_of_employees": "Employee Estimate",
+    "business_model": "Revenue Model",
+    "growth": "Market Traction",
+}
+
+# Columns shown next to a cached name in the prompt so the model can judge the peer
+DESCRIPTION_COLUMNS = ("Primary AI Healthcare Focus", "Core Technology")
+
+def normalize_company_name(name: Any) -> str:
+    """Cache key for a company: lowercase ASCII words without punctuation or legal-form suffixes"""
+    if not isinstance(name, str):
+        return ""
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii").lower()
+    words = re.sub(r"[^a-z0-9]+", " ", ascii_name).split()
+    if words and words[0] == "the":
+        words = words[1:]
+    while len(words) > 1 and words[-1] in COMPANY_SUFFIXES:
+        words = words[:-1]
+    return " ".join(words)
+
+def peer_rows(peer_table: Any) -> List[Dict[str, Any]]:
+    """The company rows of a parsed peer comparison table"""
+    if not isinstance(peer_table, dict):
+        return []
+    companies = (peer_table.get("comparison") or {}).get("companies")
+    return [row for row in companies if isinstance(row, dict)] if isinstance(companies, list) else []
+
+def _specified(value: Any) -> bool:
+    return value not in (None, "") and str(value).strip().lower() not in ("not specified", "n/a", "unknown")
+
+def cached_peer_profiles(startup_name: str) -> List[Dict[str, Any]]:
+    """Fresh stored profiles of companies related to a startup through earlier peer tables; [] on failure"""
+    if not COMPANY_PROFILES_ENABLED or not startup_name:
+        return []
+    from app.dao import get_peer_candidate_profiles
+    try:
+        return get_peer_candidate_profiles(
+            normalize_company_name(startup_name), COMPANY_PROFILE_MAX_AGE_DAYS, COMPANY_PROFILE_MAX_CACHED_PEERS
+        )
+    except Exception as e:
+        logging.error(f"Could not load cached peer profiles for {startup_name}: {e}")
+        return []
+
+def render_cached_peers(profiles: List[Dict[str, Any]]) -> str:
+    """Prompt block listing cached companies the model may pick as peers without researching them"""
+    if not profiles:
+        return ""
+    lines = []
+    for profile in profiles:
+        description = next(
+            (str(profile["profile"][c]) for c in DESCRIPTION_COLUMNS if _specified(profile["profile"].get(c))), ""
+        )
+        lines.append(f"    - {profile['company_name']}" + (f": {description[:120]}" if description else ""))
+    return f"""    CACHED PEER PROFILES: these companies were researched recently and their profiles are already stored:
+{chr(10).join(lines)}
+    If you choose any of them as a peer, output only {{"Company Name": "<name exactly as listed>", "cached": true}} for that company
+    instead of researching it again; the stored profile is filled in afterwards. Research and describe in full only companies not listed here.
+
+"""
+
+def expand_cached_peers(peer_table: Any) -> Tuple[Any, List[str]]:
+    """Replace {"Company Name", "cached": true} rows with stored profiles; returns (table, reused names)"""
+    rows = peer_rows(peer_table)
+    stubs = [row for row in rows if row.get("cached") is True]
+    if not stubs:
+        return peer_table, []
+
+    from app.dao import get_company_profiles
+    keys = [normalize_company_name(row.get(NAME_COLUMN)) for row in stubs]
+    try:
+        profiles = get_company_profiles([key for key in keys if key])
+    except Exception as e:
+        logging.error(f"Could not load cached company profiles: {e}")
+        profiles = {}
+
+    reused = []
+    for row, key in zip(stubs, keys):
+        row.pop("cached")
+        stored = profiles.get(key)
+        if stored is None:
+            logging.warning(f"Peer table referenced unknown cached company {row.get(NAME_COLUMN)!r}")
+            continue
+        name = row.get(NAME_COLUMN)
+        row.update(stored["profile"])
+        row[NAME_COLUMN] = name
+        reused.append(name)
+    return peer_table, reused
+
+def _own_profile(startup_name: str, extracted_data: Optional[Dict[str, Any]],
+                 own_row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """A startup's profile: its peer table row, overlaid with fields from its own extracted_data"""
+    profile = dict(own_row or {})
+    for field, column in EXTRACTED_TO_PEER_COLUMNS.items():
+        value = (extracted_data or {}).get(field)
+        if _specified(value):
+            profile[column] = value
+    if not profile:
+        return None
+    profile[NAME_COLUMN] = (extracted_data or {}).get("company_name") or startup_name
+    return profile
+
+def record_company_profiles(gcs_key: str, startup_name: str, extracted_data: Optional[Dict[str, Any]],
+                            peer_table: Any, reused: List[str] = ()) -> Dict[str, int]:
+    """Store the companies of a freshly generated analysis in the profile cache.
+
+    Peers the model researched are stored from the peer table; peers filled in from
+    the cache keep their original refresh time. The startup's own profile comes from
+    its row in the peer table plus its extracted_data. Pass peer_table=None or
+    extracted_data=None when that part was not regenerated.
+    """
+    if not COMPANY_PROFILES_ENABLED or not startup_name:
+        return {"profiles": 0, "peers": 0}
+    from app.dao import upsert_company_peer_set, upsert_company_profiles
+
+    startup_keys = {normalize_company_name(startup_name), normalize_company_name((extracted_data or {}).get("company_name"))}
+    startup_keys.discard("")
+    reused_keys = {normalize_company_name(name) for name in reused}
+
+    profiles, peers, own_row = [], [], None
+    for row in peer_rows(peer_table):
+        key = normalize_company_name(row.get(NAME_COLUMN))
+        if not key:
+            continue
+        if key in startup_keys:
+            own_row = row
+            continue
+        peers.append(key)
+        if key not in reused_keys and len(row) > 1:
+            profiles.append({"name_key": key, "company_name": row[NAME_COLUMN], "profile": row, "source": "peer_table"})
+
+    own = _own_profile(startup_name, extracted_data, own_row) if extracted_data is not None or own_row else None
+    if own:
+        profiles.append({
+            "name_key": normalize_company_name(startup_name), "company_name": own[NAME_COLUMN], "profile": own,
+            "source": "extracted_data" if extracted_data is not None else "peer_table"
+        })
+
+    upsert_company_profiles(profiles, gcs_key, COMPANY_PROFILE_MAX_AGE_DAYS)
+    if peer_table is not None and peers:
+        upsert_company_peer_set(normalize_company_name(startup_name), startup_name, list(dict.fromkeys(peers)))
+    return {"profiles": len(profiles), "peers": len(peers)}
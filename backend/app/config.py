@@ -9,4 +9,155 @@ USE_PRIVATE_IP = False
 # default admin user : postgres
 
 GOOGLE_API_KEY = "your-gemini-api-key"
-GCS_BUCKET = "evaluate-startup"
\ No newline at end of file
+GCS_BUCKET = "evaluate-startup"
+# Pre-establish the DB pool and Gemini client in a background thread at startup
+WARMUP_ON_STARTUP = True
+
+# Production launcher (python -m app.serve). Each worker is a separate process with
+# its own bulkheads, DB pool and caches, all accepting on the same socket
+SERVER_HOST = "0.0.0.0"
+SERVER_PORT = 8080
+SERVER_WORKERS = 0  # 0 = one per CPU the container may use (cgroup quota, else affinity)
+SERVER_BACKLOG = 2048  # pending connections the kernel queues per socket
+SERVER_KEEP_ALIVE_SECONDS = 75  # longer than load balancer idle timeouts (60s) so they close first
+SERVER_GRACEFUL_SHUTDOWN_SECONDS = 30  # after SIGTERM, in-flight requests and streams get this long to finish
+# "module:function" callables run once in every worker at startup, e.g. to open pools or load caches
+WORKER_INIT_HOOKS = []
+
+# Conversations are range-partitioned by month on created_at
+CONVERSATION_PARTITION_MONTHS_AHEAD = 3
+CONVERSATION_RETENTION_MONTHS = 12  # 0 disables detaching and archiving old partitions
+CONVERSATION_ARCHIVE_PATH = "archive/conversations"  # local directory or gs://bucket/prefix
+CONVERSATION_MAINTENANCE_INTERVAL_SECONDS = 6 * 3600
+
+# Local text extraction (PDF, PPTX, XLSX, DOCX) before sending documents to the model
+ENABLE_LOCAL_EXTRACTION = True
+EXTRACTION_WORKERS = 2
+EXTRACTION_TIMEOUT_SECONDS = 120
+EXTRACTION_MAX_ROWS_PER_SHEET = 2000
+EXTRACTION_SPOOL_THRESHOLD_BYTES = 8 * 1024 * 1024  # larger blobs are downloaded to temp files
+EXTRACTION_MEMORY_BUDGET_BYTES = 64 * 1024 * 1024  # per request: in-memory blobs plus extracted text
+EXTRACTION_MAX_CHARS_PER_DOCUMENT = 2_000_000  # text an extractor may return; reserved from the budget up front
+
+# Input token budget for the documents of one analysis request: exact duplicates
+# (same MD5) are dropped, then documents are ranked by relevance and added until
+# the budget is used. Keeps gemini-2.5-pro prompts under its 200k-token price tier
+# with room for the prompt; 0 disables ranking and trimming
+INPUT_TOKEN_BUDGET = 180_000
+INPUT_MIN_TRUNCATED_TOKENS = 2_000  # a text document is trimmed only if this much budget is left
+
+# Eager pre-analysis: uploads under L1/L2 are debounced, then analyzed in the background
+INGEST_DEBOUNCE_SECONDS = 30
+INGEST_MAX_DELAY_SECONDS = 300  # analyze even if uploads keep arriving
+INGEST_ANALYSIS_WORKERS = 1
+INGEST_LOCAL_FEED_DIR = None  # set to a directory laid out like the bucket to emulate notifications
+INGEST_LOCAL_FEED_POLL_SECONDS = 5
+INGEST_EXECUTION_MODE = "delta"  # uploads usually add or replace a file or two
+
+# Analysis generation: "single" asks one model call for all three sections,
+# "parallel" issues one concurrent call per section with its own model and cap,
+# "delta" revises the stored analysis from only the added or changed files
+ANALYSIS_EXECUTION_MODE = "single"
+ANALYSIS_SECTION_MODELS = {
+    "short_summary": {"model": "gemini-2.5-flash", "max_output_tokens": 4096, "grounding": False},
+    "analysis": {"model": "gemini-2.5-pro", "max_output_tokens": 32768, "grounding": True},
+    "peer_comparison": {"model": "gemini-2.5-pro", "max_output_tokens": 16384, "grounding": True},
+}
+
+# Shared company-profile cache: peers and startups researched in earlier analyses are
+# offered to the peer comparison section so only unknown or stale companies are researched
+COMPANY_PROFILES_ENABLED = True
+COMPANY_PROFILE_MAX_AGE_DAYS = 30  # older profiles are researched again
+COMPANY_PROFILE_MAX_CACHED_PEERS = 8  # cached companies listed in one prompt
+
+# Chat model routing: simple factual questions about stored fields are answered
+# directly, analysis questions go to the fast tier, open-ended research to the pro tier
+CHAT_DIRECT_ANSWERS = True
+CHAT_MODEL_ROUTES = {
+    "fast": {"model": "gemini-2.5-flash", "grounding": False, "max_output_tokens": 1000},
+    "research": {"model": "gemini-2.5-pro", "grounding": True, "max_output_tokens": 1000},
+}
+
+# Per-startup semantic answer cache for repeated chat questions
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_TTL_SECONDS = 6 * 3600
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.9
+ANSWER_CACHE_MIN_QUESTION_TOKENS = 3  # shorter normalized questions depend on the conversation
+ANSWER_CACHE_MAX_ENTRIES_PER_STARTUP = 256
+ANSWER_CACHE_MAX_STARTUPS = 1000
+
+# Chat prompt compaction: older turns are folded into a per-session running summary
+CHAT_RAW_TURNS = 4  # most recent turns kept verbatim in the prompt
+CHAT_PROMPT_TOKEN_BUDGET = 8000
+CHAT_SUMMARY_MODEL = "gemini-2.5-flash"
+CHAT_SUMMARY_MAX_TOKENS = 800
+# Oldest unsummarized turns folded per compaction pass, and the token cap on their transcript;
+# a long backlog is worked off over several passes
+CHAT_COMPACTION_WORKERS = 1
+CHAT_COMPACTION_MAX_TURNS = 40
+CHAT_COMPACTION_TOKEN_BUDGET = 24000
+
+# Bulkheads: separate bounded executors per I/O class; a full queue answers 503
+BULKHEADS = {
+    "db": {"max_workers": 16, "max_queue": 64},
+    "gcs": {"max_workers": 8, "max_queue": 32},
+    # Analyses may hold at most 5 model threads: 2 stay free for chat and 1 for interactive work
+    "model": {"max_workers": 8, "max_queue": 16, "reserved": {"chat": 2, "interactive": 1}},
+    "export": {"max_workers": 2, "max_queue": 4},  # long-running bulk exports
+}
+# Items a streaming bulkhead task may read ahead of a slow consumer before it blocks
+BULKHEAD_STREAM_BUFFER = 1000
+# The DB pool has one connection per thread that can use one (see db.pool_size);
+# overflow covers short-lived threads such as warmup
+DB_POOL_OVERFLOW = 4
+
+# Bulk export: rows fetched per server-side cursor round trip
+EXPORT_BATCH_SIZE = 500
+# Encoded export chunks (one batch or about 64 KB each) read ahead of a slow client
+EXPORT_BUFFERED_CHUNKS = 4
+
+# Analysis run records: list prices in USD per million tokens, used to estimate
+# the cost of each run (long-context surcharges are not modelled)
+MODEL_PRICING_PER_MILLION_TOKENS = {
+    "gemini-2.5-pro": {"input": 1.25, "cached_input": 0.31, "output": 10.0},
+    "gemini-2.5-flash": {"input": 0.30, "cached_input": 0.075, "output": 2.50},
+}
+
+# Record/replay of Gemini and GCS calls for offline, reproducible profiling.
+# "record" captures each call to CASSETTE_DIR, "replay" serves calls from it
+# without touching the network; CASSETTE_REPLAY_SPEED 1.0 keeps the recorded
+# latency, 10.0 replays ten times faster and 0 replays instantly
+CASSETTE_MODE = "off"  # "off", "record" or "replay"
+CASSETTE_DIR = "cassettes"
+CASSETTE_REPLAY_SPEED = 1.0
+
+# Typed metric normalization: approximate USD rates used to fill the *_usd
+# sort columns; the original amount and currency are kept in normalized_metrics
+CURRENCY_TO_USD = {
+    "USD": 1.0, "EUR": 1.08, "GBP": 1.27, "INR": 0.012, "SGD": 0.74, "JPY": 0.0067, "CNY": 0.14,
+    "AUD": 0.66, "CAD": 0.73, "HKD": 0.128, "NZD": 0.6,
+}
+DEFAULT_CURRENCY = "USD"  # assumed when an amount carries no currency
+
+# Checkpointed analysis runs: a failed run resumes from its last completed stage;
+# bulk re-parse of stored raw outputs runs in this many processes
+REPARSE_WORKERS = 2
+
+# Analysis payloads (extracted data, summary, peer table) are versioned in a side
+# table; a version is written only when the content changes and this many are kept
+ANALYSIS_PAYLOAD_VERSIONS_KEPT = 10
+
+# Request scheduling inside each bulkhead: queued work is served by weighted fair
+# queuing across priority classes (ties go to the higher weight) and round-robin
+# across tenants (the L1 prefix) within a class; slo_ms is the latency target
+SCHEDULER_CLASSES = {
+    "interactive": {"weight": 8, "slo_ms": 500},  # mode=read lookups, listings, metrics
+    "chat": {"weight": 4, "slo_ms": 10_000},
+    "analysis": {"weight": 1, "slo_ms": 300_000},  # mode=new generations, exports, maintenance
+}
+# Max queued + running tasks per tenant and class in one bulkhead; over quota answers 429.
+# "default" applies to every tenant without its own entry
+TENANT_QUOTAS = {
+    "default": {"interactive": 32, "chat": 8, "analysis": 2},
+}
+SCHEDULER_SLO_WINDOW = 1000  # recent requests per class kept for latency percentiles
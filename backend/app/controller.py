@@ -1,5 +1,10 @@
-from typing import Dict, Any
+from typing import Dict, Any, List
+from .config import ANALYSIS_EXECUTION_MODE, ANALYSIS_SECTION_MODELS
 from .gemini_service import *
+from .checkpoints import AnalysisCheckpoint, diff_manifests
+from .run_metrics import AnalysisRun
+from .company_profiles import cached_peer_profiles, expand_cached_peers, record_company_profiles, render_cached_peers
+from contextlib import nullcontext
 import logging
 import time
 import json
@@ -49,35 +54,10 @@ def list_all_files_from_path(relative_path: str) -> Dict[str, Any]:
             "relative_path": relative_path
         }
 
-def generate_content_from_path(relative_path: str, startup_name: str = None) -> Dict[str, Any]:
-    """Generate AI content from all files in GCS path and extract startup information"""
-    start_time = time.time()
-    
-    # Extract startup name from files if not provided
-    if not startup_name:
-        try:
-            from app.gemini_service import get_all_files_from_path
-            all_files = get_all_files_from_path(relative_path)
-            
-            startup_names = set()
-            for file in all_files:
-                filename = file.get("name", "").split("/")[-1]
-                if "_" in filename:
-                    name_part = filename.split("_")[0].lower().strip()
-                    if name_part:
-                        startup_names.add(name_part)
-            
-            if startup_names:
-                startup_name = list(startup_names)[0]
-            else:
-                startup_name = relative_path.split('/')[-1] or "unknown"
-                
-        except Exception as e:
-            startup_name = "unknown"
-            logging.error(f"Could not extract startup name: {e}")
-    
-    # Enhanced prompt for both analysis and structured data
-    enhanced_prompt = f"""
+SECTION_SEPARATOR = "===OUTPUT-SECTION-SEPARATOR==="
+
+def _prompt_preamble(startup_name: str) -> str:
+    return f"""
     Please analyze the startup documents AND search for additional information using these sources:
     PRIMARY: Use Google Search for current information about {startup_name or 'this company'}
     FALLBACK SOURCES (for comprehensive financial data):
@@ -97,15 +77,16 @@ def generate_content_from_path(relative_path: str, startup_name: str = None) ->
     - "[company_name] cost structure analysis"
     - "[company_name] financial statements"
 
-    Provide THREE outputs, separated by the exact line only after outputs from 1., 2., and 3.:
-    ===OUTPUT-SECTION-SEPARATOR===
+"""
 
-    1. SHORT SUMMARY:
+def _short_summary_section() -> str:
+    return """    1. SHORT SUMMARY:
     Provide a concise plain-text paragraph summarizing the startup’s core business and key highlights in 1 or 2 lines.
 
-    ===OUTPUT-SECTION-SEPARATOR===
+"""
 
-    2. ANALYSIS SUMMARY AND STRUCTURED DATA:
+def _analysis_section() -> str:
+    return f"""    2. ANALYSIS SUMMARY AND STRUCTURED DATA:
     Provide a detailed analysis including financial insights, risk evaluation using the Scorecard Risk Method and other relevant frameworks.
     For the risk portion, analyze these areas: market risk, product risk, team and execution risk, regulatory risk, financial risk.
     Assign an overall risk score out of 5 (where 5 = very low risk, 1 = very high risk), using a JSON field "risk_gauge". In another JSON field "risk_gauge_reason", provide a brief summary justifying the risk score (covering all risk areas).
@@ -153,9 +134,10 @@ def generate_content_from_path(relative_path: str, startup_name: str = None) ->
         "risk_gauge_reason": "A concise summary justifying the risk score, covering all risk areas"
     }}
 
-    ===OUTPUT-SECTION-SEPARATOR===
+"""
 
-    3. PEER COMPARISON JSON:
+def _peer_comparison_section(startup_name: str, cached_peers: List[Dict[str, Any]] = None) -> str:
+    return f"""    3. PEER COMPARISON JSON:
     Generate a JSON object for {startup_name or 'this company'} and its top 5 peer companies in the below structure:
     {{
         "comparison": {{
@@ -180,7 +162,9 @@ def generate_content_from_path(relative_path: str, startup_name: str = None) ->
     }}
     Provide ONLY the JSON object WITHOUT any additional text or explanation.
 
-    IMPORTANT INSTRUCTIONS:
+""" + render_cached_peers(cached_peers)
+
+IMPORTANT_INSTRUCTIONS = """    IMPORTANT INSTRUCTIONS:
     - Search multiple authoritative sources for each financial metric
     - Use financial databases and industry reports when available
     - Calculate derived metrics (like runway) using available data
@@ -192,32 +176,84 @@ def generate_content_from_path(relative_path: str, startup_name: str = None) ->
     - Do not include source citations or bracketed references like [Doc 1, page 4] in your output.
     """
 
-    
-    # Generate content using existing function
-    from app.gemini_service import generate_from_path
-    result = generate_from_path(relative_path, enhanced_prompt, enable_grounding=True)
-    
-    if result.get("status") != "success":
-        return {
-            "status": "error",
-            "message": result.get("message", "Generation failed"),
-            "gcs_key": relative_path,
-            "startup_name": startup_name,
-            "response_time_seconds": round(time.time() - start_time, 3)
-        }
-    
-    # # Extract both analysis summary and structured data
-    from app.kv_parser import extract_analysis_and_kv_pairs
-    # analysis_summary, extracted_data = extract_analysis_and_kv_pairs(result["generated_content"])
-    
-    full_generated = result["generated_content"]
+def _three_outputs(startup_name: str, cached_peers: List[Dict[str, Any]] = None) -> str:
+    return (
+        """    Provide THREE outputs, separated by the exact line only after outputs from 1., 2., and 3.:
+    ===OUTPUT-SECTION-SEPARATOR===
 
+"""
+        + _short_summary_section()
+        + """    ===OUTPUT-SECTION-SEPARATOR===
 
-    parts = [p.strip() for p in full_generated.split("===OUTPUT-SECTION-SEPARATOR===") if p.strip()]
-    short_summary = parts[0] if len(parts) > 0 else ""
-    analysis_and_json_text = parts[1] if len(parts) > 1 else ""
-    peer_comparison_json_text = parts[2] if len(parts) > 2 else "{}"
+"""
+        + _analysis_section()
+        + """    ===OUTPUT-SECTION-SEPARATOR===
+
+"""
+        + _peer_comparison_section(startup_name, cached_peers)
+        + IMPORTANT_INSTRUCTIONS
+    )
+
+def build_analysis_prompt(startup_name: str, cached_peers: List[Dict[str, Any]] = None) -> str:
+    """Single prompt asking for all three outputs, separated by SECTION_SEPARATOR"""
+    return _prompt_preamble(startup_name) + _three_outputs(startup_name, cached_peers)
+
+def build_delta_prompt(startup_name: str, previous: Dict[str, Any], delta: Dict[str, List[str]],
+                       cached_peers: List[Dict[str, Any]] = None) -> str:
+    """Prompt to revise a stored analysis given only the added or changed documents"""
+    summary = previous.get("analysis_summary") or {}
+    previous_analysis = json.dumps({
+        "short_summary": summary.get("short_summary", ""),
+        "detailed_analysis_summary": summary.get("detailed_analysis_summary", ""),
+        "structured_data": previous.get("extracted_data") or {},
+        "peer_comparison": previous.get("peer_comparison_table") or {}
+    }, indent=2, ensure_ascii=False)
+    changes = "\n".join(
+        f"    - {label}: {', '.join(name.split('/')[-1] for name in delta[key]) or 'none'}"
+        for key, label in (("added", "Added files"), ("changed", "Changed files"), ("removed", "Removed files"))
+    )
+    return (
+        _prompt_preamble(startup_name)
+        + f"""    This is an UPDATE of an existing analysis. The attached documents are only the files that were
+    added or changed in the data room since the previous analysis:
+{changes}
+
+    PREVIOUS ANALYSIS (based on the earlier version of the data room):
+{previous_analysis}
+
+    Revise the previous analysis with the attached documents: keep what is still valid, update every
+    figure and statement the new documents change, and drop facts that came only from removed files.
+    Return the complete revised outputs in the format below, not just the differences.
+
+"""
+        + _three_outputs(startup_name, cached_peers)
+    )
+
+def build_section_prompts(startup_name: str, cached_peers: List[Dict[str, Any]] = None) -> Dict[str, str]:
+    """One self-contained prompt per output section, for parallel generation"""
+    sections = {
+        "short_summary": _short_summary_section(),
+        "analysis": _analysis_section(),
+        "peer_comparison": _peer_comparison_section(startup_name, cached_peers)
+    }
+    return {
+        name: _prompt_preamble(startup_name) + "    Provide ONLY the following output:\n\n" + section + IMPORTANT_INSTRUCTIONS
+        for name, section in sections.items()
+    }
+
+def _strip_code_fence(text: str) -> str:
+    """Remove a surrounding ```json ... ``` fence if the model added one"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text.strip()
 
+def parse_sections(short_summary: str, analysis_and_json_text: str, peer_comparison_json_text: str) -> Dict[str, Any]:
+    """Parse the three output sections into the stored analysis fields"""
+    from app.kv_parser import extract_analysis_and_kv_pairs
+    
     analysis_summary, extracted_data = extract_analysis_and_kv_pairs(analysis_and_json_text)
     
     combined_analysis_kv = {
@@ -227,11 +263,233 @@ def generate_content_from_path(relative_path: str, startup_name: str = None) ->
 
 
     try:
-        peer_comparison_json = json.loads(peer_comparison_json_text)
+        peer_comparison_json = json.loads(_strip_code_fence(peer_comparison_json_text))
     except Exception as e:
         logging.error(f"Failed to parse peer comparison JSON: {e}")
         peer_comparison_json = {}
     
+    return {
+        "extracted_data": extracted_data,
+        "analysis_summary": combined_analysis_kv,
+        "peer_comparison_table": peer_comparison_json
+    }
+
+def parse_generated_content(full_generated: str) -> Dict[str, Any]:
+    """Split single-call model output on SECTION_SEPARATOR and parse each section"""
+    parts = [p.strip() for p in full_generated.split(SECTION_SEPARATOR) if p.strip()]
+    short_summary = parts[0] if len(parts) > 0 else ""
+    analysis_and_json_text = parts[1] if len(parts) > 1 else ""
+    peer_comparison_json_text = parts[2] if len(parts) > 2 else "{}"
+    return parse_sections(short_summary, analysis_and_json_text, peer_comparison_json_text)
+
+def parse_raw_output(generated_content: Dict[str, Any]) -> Dict[str, Any]:
+    """Parse a checkpointed raw output ({"text"} or {"sections"}) without calling the model"""
+    if generated_content.get("text"):
+        return parse_generated_content(generated_content["text"])
+    sections = generated_content["sections"]
+    return parse_sections(
+        sections["short_summary"].strip(), sections["analysis"], sections["peer_comparison"] or "{}"
+    )
+
+def _generate_sections_in_parallel(relative_path: str, startup_name: str, run: AnalysisRun = None,
+                                   checkpoint: AnalysisCheckpoint = None,
+                                   cached_peers: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Generate the three sections concurrently and merge them, keeping stored values for failed sections"""
+    prompts = build_section_prompts(startup_name, cached_peers)
+    sections = {
+        name: dict(ANALYSIS_SECTION_MODELS[name], prompt=prompt)
+        for name, prompt in prompts.items()
+    }
+    
+    from app.gemini_service import generate_sections_from_path
+    result = generate_sections_from_path(relative_path, sections, run=run, checkpoint=checkpoint)
+    if result.get("status") != "success":
+        return result
+    
+    outcomes = result["sections"]
+    failed = [name for name, outcome in outcomes.items() if outcome["status"] != "success"]
+    if len(failed) == len(outcomes):
+        return {
+            "status": "error",
+            "message": "; ".join(f"{name}: {outcomes[name]['message']}" for name in failed)
+        }
+    
+    text = {name: outcome["text"] or "" for name, outcome in outcomes.items()}
+    with run.stage("parse") if run else nullcontext():
+        parsed = parse_sections(
+            text["short_summary"].strip(), text["analysis"], text["peer_comparison"] or "{}"
+        )
+    
+    if failed:
+        # Keep the previously stored values for sections that failed this time
+        from app.dao import get_analysis_result
+        previous = get_analysis_result(gcs_key=relative_path, startup_name=startup_name) or {}
+        if "short_summary" in failed:
+            parsed["analysis_summary"]["short_summary"] = (previous.get("analysis_summary") or {}).get("short_summary", "")
+        if "analysis" in failed:
+            parsed["analysis_summary"]["detailed_analysis_summary"] = (previous.get("analysis_summary") or {}).get("detailed_analysis_summary", "")
+            parsed["extracted_data"] = previous.get("extracted_data") or {}
+        if "peer_comparison" in failed:
+            parsed["peer_comparison_table"] = previous.get("peer_comparison_table") or {}
+    
+    result.update(parsed)
+    result["failed_sections"] = {name: outcomes[name]["message"] for name in failed}
+    result["section_timings"] = {
+        name: {"model": outcome["model"], "seconds": outcome["seconds"]}
+        for name, outcome in outcomes.items()
+    }
+    return result
+
+def _generate_delta(relative_path: str, startup_name: str, run: AnalysisRun,
+                    checkpoint: AnalysisCheckpoint, cached_peers: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Revise the stored analysis from only the files added or changed since it was made.
+    
+    Returns None when there is no completed previous run to compare against.
+    """
+    from app.dao import get_analysis_artifacts, get_analysis_result
+    previous_run = get_analysis_artifacts(relative_path, startup_name)
+    previous = get_analysis_result(gcs_key=relative_path, startup_name=startup_name)
+    if not previous_run or previous_run["stage"] != "stored" or not previous:
+        return None
+    
+    with run.stage("list_files"):
+        all_files = get_all_files_from_path(relative_path)
+    run.files_processed = len(all_files)
+    if not all_files:
+        return {
+            "status": "error",
+            "message": f"No files found in path: {relative_path}"
+        }
+    
+    delta = diff_manifests(previous_run["manifest"], all_files)
+    result = {
+        "status": "success",
+        "relative_path": relative_path,
+        "full_path": f"gs://{BUCKET_NAME}/{relative_path}",
+        "total_files_processed": len(all_files),
+        "files_processed": _file_info(all_files),
+        "delta": delta
+    }
+    
+    if not (delta["added"] or delta["changed"] or delta["removed"]):
+        # Nothing changed since the stored analysis
+        result.update(
+            extracted_data=previous["extracted_data"],
+            analysis_summary=previous["analysis_summary"],
+            peer_comparison_table=previous["peer_comparison_table"],
+            unchanged=True
+        )
+        return result
+    
+    checkpoint.begin(all_files)
+    to_send = set(delta["added"]) | set(delta["changed"])
+    try:
+        parts = build_document_parts(
+            [file["full_path"] for file in all_files if file["name"] in to_send], run=run, files=all_files
+        )
+        with run.stage("generate"):
+            generated_content = generate_from_parts(
+                parts, build_delta_prompt(startup_name, previous, delta, cached_peers), enable_grounding=True, run=run
+            )
+    except Exception as e:
+        logging.error(f"Delta analysis failed for {relative_path}: {e}")
+        return {
+            "status": "error",
+            "message": f"Failed to generate content: {str(e)}"
+        }
+    
+    checkpoint.save_generated(generated_content)
+    with run.stage("parse"):
+        result.update(parse_generated_content(generated_content))
+    return result
+
+def generate_content_from_path(relative_path: str, startup_name: str = None, execution: str = None,
+                               resume: bool = True) -> Dict[str, Any]:
+    """Generate AI content from all files in GCS path and extract startup information.
+    
+    execution is "single" (one call producing all sections), "parallel" (one
+    concurrent call per section) or "delta" (revise the stored analysis from only
+    the added or changed files, falling back to "single" when there is no
+    completed previous run); it defaults to ANALYSIS_EXECUTION_MODE.
+    Each stage is checkpointed; with resume, a run that previously failed over
+    the same files picks up from its last completed stage.
+    """
+    start_time = time.time()
+    execution = execution or ANALYSIS_EXECUTION_MODE
+    run = AnalysisRun(relative_path, execution)
+    
+    # Extract startup name from files if not provided
+    if not startup_name:
+        try:
+            from app.gemini_service import get_all_files_from_path
+            with run.stage("list_files"):
+                all_files = get_all_files_from_path(relative_path)
+            
+            startup_names = set()
+            for file in all_files:
+                filename = file.get("name", "").split("/")[-1]
+                if "_" in filename:
+                    name_part = filename.split("_")[0].lower().strip()
+                    if name_part:
+                        startup_names.add(name_part)
+            
+            if startup_names:
+                startup_name = list(startup_names)[0]
+            else:
+                startup_name = relative_path.split('/')[-1] or "unknown"
+                
+        except Exception as e:
+            startup_name = "unknown"
+            logging.error(f"Could not extract startup name: {e}")
+    
+    run.startup_name = startup_name
+    checkpoint = AnalysisCheckpoint(relative_path, startup_name, execution, resume=resume)
+    result = None
+    
+    # Fresh profiles of related companies; the model is asked to research only the others
+    cached_peers = cached_peer_profiles(startup_name)
+    if execution == "delta":
+        result = _generate_delta(relative_path, startup_name, run, checkpoint, cached_peers)
+        if result is None:
+            logging.info(f"No completed previous analysis of {relative_path}; running a full analysis")
+            execution = run.execution = checkpoint.execution = "single"
+    
+    if execution == "parallel":
+        result = _generate_sections_in_parallel(
+            relative_path, startup_name, run=run, checkpoint=checkpoint, cached_peers=cached_peers
+        )
+    elif result is None:
+        # Generate content using existing function
+        from app.gemini_service import generate_from_path
+        result = generate_from_path(
+            relative_path, build_analysis_prompt(startup_name, cached_peers), enable_grounding=True, run=run, checkpoint=checkpoint
+        )
+        if result.get("status") == "success":
+            with run.stage("parse"):
+                result.update(parse_generated_content(result["generated_content"]))
+    
+    if result.get("status") != "success":
+        message = result.get("message", "Generation failed")
+        return {
+            "status": "error",
+            "message": message,
+            "gcs_key": relative_path,
+            "startup_name": startup_name,
+            "run_id": run.record("error", message),
+            "response_time_seconds": round(time.time() - start_time, 3)
+        }
+    
+    extracted_data = result["extracted_data"]
+    combined_analysis_kv = result["analysis_summary"]
+    
+    # Rows the model marked as cached are filled in from the company-profile store
+    peer_comparison_json, reused_peers = expand_cached_peers(result["peer_comparison_table"])
+    
+    # Typed money/count/duration/score values for the indexed metric columns
+    from app.normalizers import normalize_metrics
+    with run.stage("parse"):
+        normalized_metrics = normalize_metrics(extracted_data)
+    
     print(f"=== EXTRACTED ANALYSIS & DATA ===")
     # print(f"Analysis Summary Length: {len(analysis_summary)} chars")
     # print(f"Extracted KV Pairs: {extracted_data}")
@@ -242,21 +500,46 @@ def generate_content_from_path(relative_path: str, startup_name: str = None) ->
     if startup_name and extracted_data:
         try:
             from app.dao import upsert_analysis_result
-            upsert_analysis_result(
-                gcs_key=relative_path,
-                startup_name=startup_name,
-                extracted_data=extracted_data,
-                analysis_summary=combined_analysis_kv,
-                files_processed=result.get("total_files_processed", 0),
-                peer_comparison_table=peer_comparison_json
-            )
+            with run.stage("store"):
+                upsert_analysis_result(
+                    gcs_key=relative_path,
+                    startup_name=startup_name,
+                    extracted_data=extracted_data,
+                    analysis_summary=combined_analysis_kv,
+                    files_processed=result.get("total_files_processed", 0),
+                    peer_comparison_table=peer_comparison_json,
+                    normalized_metrics=normalized_metrics
+                )
             stored = True
             print("=== STORAGE SUCCESSFUL ===")
+            
+            # Sections that failed this time are retried on the next run
+            if not result.get("failed_sections"):
+                checkpoint.mark_stored()
+            
+            # Answers cached against the previous analysis are now stale
+            from app.answer_cache import answer_cache
+            answer_cache.invalidate(relative_path)
+            
+            # Sections kept from the stored analysis (failed or unchanged) are not fresh research
+            if not result.get("unchanged"):
+                failed = result.get("failed_sections") or {}
+                try:
+                    record_company_profiles(
+                        relative_path, startup_name,
+                        None if "analysis" in failed else extracted_data,
+                        None if "peer_comparison" in failed else peer_comparison_json,
+                        reused_peers
+                    )
+                except Exception as e:
+                    logging.error(f"Failed to update company profiles for {startup_name}: {e}")
         except Exception as e:
             logging.error(f"Failed to store in database: {e}")
             print(f"=== STORAGE FAILED: {e} ===")
     
     response_time = round(time.time() - start_time, 3)
+    failed_sections = result.get("failed_sections", {})
+    run_id = run.record("partial" if failed_sections else "success")
     
     return {
         "status": "success",
@@ -265,9 +548,22 @@ def generate_content_from_path(relative_path: str, startup_name: str = None) ->
         "extracted_data": extracted_data,
         "analysis_summary": combined_analysis_kv,
         "peer_comparison_table": peer_comparison_json,
+        "normalized_metrics": normalized_metrics,
         "files_processed": result.get("total_files_processed", 0),
         "files_info": result.get("files_processed", []),
         "stored_in_database": stored,
+        "execution": execution,
+        "failed_sections": failed_sections,
+        "section_timings": result.get("section_timings", {}),
+        "usage": run.totals(),
+        "input_plan": run.input_plan,
+        "peer_profiles": {
+            "offered": [profile["company_name"] for profile in cached_peers],
+            "reused": reused_peers
+        },
+        "resumed_from": checkpoint.resumed_from,
+        "delta": result.get("delta"),
+        "run_id": run_id,
         "response_time_seconds": response_time
     }
 
@@ -1,33 +1,133 @@
-from typing import Dict, Any, List, Optional 
+from typing import Dict, Any, Iterator, List, Optional 
 from sqlalchemy import text
-from .db import engine
+from .config import ANALYSIS_PAYLOAD_VERSIONS_KEPT
+from .db import get_engine
+import base64
+import hashlib
 import logging
 import json
 
+def encode_cursor(values: List[Any]) -> str:
+    """Encode keyset values as an opaque, URL-safe pagination cursor"""
+    payload = json.dumps([v.isoformat() if hasattr(v, "isoformat") else v for v in values])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Decode a cursor produced by encode_cursor, raising ValueError if malformed"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+# Typed metric columns on analysis_results (see app/normalizers.py NUMERIC_COLUMNS)
+NORMALIZED_COLUMNS = [
+    "valuation_usd", "revenue_usd", "arr_usd", "tam_usd", "burn_rate_usd",
+    "cash_reserve_usd", "runway_months", "employees", "risk_gauge",
+]
+
+# Listing sort option -> (keyset comparison, ORDER BY direction)
+LISTING_SORTS = {"newest": ("<", "DESC"), "oldest": (">", "ASC")}
+
+def _listing_order(sort: str):
+    if sort not in LISTING_SORTS:
+        raise ValueError(f"Invalid sort. Use one of: {', '.join(LISTING_SORTS)}")
+    return LISTING_SORTS[sort]
+
+def _decode_listing_cursor(cursor: str, sort: str, size: int) -> List[Any]:
+    """Decode a listing cursor, rejecting cursors issued for a different sort order"""
+    values = decode_cursor(cursor, size + 1)
+    if values[0] != sort:
+        raise ValueError("Cursor does not match the requested sort")
+    return values[1:]
+
+def _prefix_pattern(prefix: str) -> str:
+    """Case-insensitive LIKE pattern matching names that start with `prefix`"""
+    escaped = prefix.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+def _normalized_metric_params(normalized_metrics: Dict[str, Any]) -> Dict[str, Any]:
+    from .normalizers import numeric_columns
+    params = numeric_columns(normalized_metrics)
+    params["normalized_metrics"] = json.dumps(normalized_metrics)
+    return params
+
+def update_normalized_metrics(conn, analysis_id: int, normalized_metrics: Dict[str, Any]) -> None:
+    """Write normalized_metrics and the typed metric columns for one analysis row"""
+    conn.execute(text(f"""
+        UPDATE analysis_results
+        SET normalized_metrics = CAST(:normalized_metrics AS JSONB),
+            {", ".join(f"{column} = :{column}" for column in NORMALIZED_COLUMNS)}
+        WHERE id = :id
+    """), dict(_normalized_metric_params(normalized_metrics), id=analysis_id))
+
+# Large JSON documents stored per version in analysis_payloads rather than on analysis_results
+PAYLOAD_FIELDS = ("extracted_data", "analysis_summary", "peer_comparison_table")
+
+def payload_hash(payload: Dict[str, Any]) -> str:
+    """Stable content hash of an analysis payload, used to skip writing unchanged versions"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def insert_analysis_payload(conn, analysis_id: int, version: int, payload: Dict[str, Any], digest: str) -> None:
+    """Write one payload version for an analysis row"""
+    conn.execute(text(f"""
+        INSERT INTO analysis_payloads (analysis_id, version, payload_hash, {", ".join(PAYLOAD_FIELDS)})
+        VALUES (:analysis_id, :version, :payload_hash, {", ".join(f"CAST(:{field} AS JSONB)" for field in PAYLOAD_FIELDS)})
+        ON CONFLICT (analysis_id, version) DO NOTHING
+    """), dict({field: json.dumps(payload.get(field)) for field in PAYLOAD_FIELDS},
+               analysis_id=analysis_id, version=version, payload_hash=digest))
+
 def upsert_analysis_result(gcs_key: str, startup_name: str, extracted_data: Dict[str, Any], 
                           analysis_summary: str = None, files_processed: int = 0,
-                           peer_comparison_table: str = None):
-    """Store complete analysis result for a startup (one row)"""
+                           peer_comparison_table: str = None, normalized_metrics: Dict[str, Any] = None):
+    """Store complete analysis result for a startup (one row).
+    
+    The JSON payload is written as a new version in analysis_payloads only when its
+    content hash differs from the current version; older versions beyond
+    ANALYSIS_PAYLOAD_VERSIONS_KEPT are pruned.
+    """
+    if normalized_metrics is None:
+        from .normalizers import normalize_metrics
+        normalized_metrics = normalize_metrics(extracted_data)
+    payload = {
+        "extracted_data": extracted_data,
+        "analysis_summary": analysis_summary,
+        "peer_comparison_table": peer_comparison_table
+    }
+    digest = payload_hash(payload)
     try:
-        with engine.begin() as conn:
-            conn.execute(text("""
-                INSERT INTO analysis_results (gcs_key, startup_name, extracted_data, analysis_summary, files_processed, peer_comparison_table)
-                VALUES (:gcs_key, :startup_name, :extracted_data, :analysis_summary, :files_processed, :peer_comparison_table)
+        with get_engine().begin() as conn:
+            row = conn.execute(text(f"""
+                INSERT INTO analysis_results (gcs_key, startup_name, files_processed,
+                                              normalized_metrics, {", ".join(NORMALIZED_COLUMNS)})
+                VALUES (:gcs_key, :startup_name, :files_processed,
+                        CAST(:normalized_metrics AS JSONB), {", ".join(f":{column}" for column in NORMALIZED_COLUMNS)})
                 ON CONFLICT (gcs_key, startup_name)
                 DO UPDATE SET 
-                    extracted_data = EXCLUDED.extracted_data,
-                    analysis_summary = EXCLUDED.analysis_summary,
                     files_processed = EXCLUDED.files_processed,
-                    peer_comparison_table = EXCLUDED.peer_comparison_table,
+                    normalized_metrics = EXCLUDED.normalized_metrics,
+                    {", ".join(f"{column} = EXCLUDED.{column}" for column in NORMALIZED_COLUMNS)},
                     updated_at = now()
-            """), {
+                RETURNING id, current_version, payload_hash
+            """), dict(_normalized_metric_params(normalized_metrics), **{
                 "gcs_key": gcs_key,
                 "startup_name": startup_name,
-                "extracted_data": json.dumps(extracted_data),  # Store as JSONB
-                "analysis_summary": json.dumps(analysis_summary),
-                "files_processed": files_processed,
-                "peer_comparison_table": json.dumps(peer_comparison_table)
-            })
+                "files_processed": files_processed
+            })).mappings().one()
+            
+            if row["payload_hash"] != digest:
+                version = row["current_version"] + 1
+                insert_analysis_payload(conn, row["id"], version, payload, digest)
+                conn.execute(text("""
+                    UPDATE analysis_results SET current_version = :version, payload_hash = :payload_hash
+                    WHERE id = :id
+                """), {"id": row["id"], "version": version, "payload_hash": digest})
+                conn.execute(text("""
+                    DELETE FROM analysis_payloads WHERE analysis_id = :id AND version <= :version - :kept
+                """), {"id": row["id"], "version": version, "kept": ANALYSIS_PAYLOAD_VERSIONS_KEPT})
         
         logging.info(f"Stored analysis result for {startup_name} from {gcs_key}")
         return True
@@ -42,11 +142,11 @@ def get_analysis_result(gcs_key: str = None, startup_name: str = None) -> Dict[s
         params = {}
         
         if gcs_key:
-            where_conditions.append("gcs_key = :gcs_key")
+            where_conditions.append("r.gcs_key = :gcs_key")
             params["gcs_key"] = gcs_key
         
         if startup_name:
-            where_conditions.append("startup_name = :startup_name")
+            where_conditions.append("r.startup_name = :startup_name")
             params["startup_name"] = startup_name
         
         if not where_conditions:
@@ -54,11 +154,13 @@ def get_analysis_result(gcs_key: str = None, startup_name: str = None) -> Dict[s
             
         where_clause = " AND ".join(where_conditions)
         
-        with engine.begin() as conn:
+        with get_engine().begin() as conn:
             result = conn.execute(text(f"""
-                SELECT id, gcs_key, startup_name, extracted_data, analysis_summary, 
-                       peer_comparison_table, files_processed, created_at, updated_at
-                FROM analysis_results
+                SELECT r.id, r.gcs_key, r.startup_name, p.extracted_data, p.analysis_summary, 
+                       p.peer_comparison_table, r.files_processed, r.created_at, r.updated_at,
+                       r.current_version AS version
+                FROM analysis_results r
+                LEFT JOIN analysis_payloads p ON p.analysis_id = r.id AND p.version = r.current_version
                 WHERE {where_clause}
             """), params).mappings().first()
         
@@ -70,6 +172,48 @@ def get_analysis_result(gcs_key: str = None, startup_name: str = None) -> Dict[s
         logging.error(f"Error getting analysis result: {e}")
         raise
 
+def _analysis_id(conn, gcs_key: str, startup_name: str = None) -> Optional[int]:
+    params = {"gcs_key": gcs_key}
+    condition = ""
+    if startup_name:
+        params["startup_name"] = startup_name
+        condition = " AND startup_name = :startup_name"
+    return conn.execute(text(f"""
+        SELECT id FROM analysis_results WHERE gcs_key = :gcs_key{condition} ORDER BY id LIMIT 1
+    """), params).scalar()
+
+def get_analysis_versions(gcs_key: str, startup_name: str = None) -> Optional[Dict[str, Any]]:
+    """List the stored payload versions of an analysis, newest first; None if there is no analysis"""
+    with get_engine().begin() as conn:
+        analysis_id = _analysis_id(conn, gcs_key, startup_name)
+        if analysis_id is None:
+            return None
+        current = conn.execute(text("""
+            SELECT gcs_key, startup_name, current_version FROM analysis_results WHERE id = :id
+        """), {"id": analysis_id}).mappings().one()
+        versions = conn.execute(text("""
+            SELECT version, payload_hash, created_at,
+                   pg_column_size(extracted_data) + COALESCE(pg_column_size(analysis_summary), 0)
+                       + COALESCE(pg_column_size(peer_comparison_table), 0) AS stored_bytes
+            FROM analysis_payloads
+            WHERE analysis_id = :id
+            ORDER BY version DESC
+        """), {"id": analysis_id}).mappings().all()
+    return dict(current, versions=[dict(row) for row in versions])
+
+def get_analysis_payloads(gcs_key: str, versions: List[int], startup_name: str = None) -> Dict[int, Dict[str, Any]]:
+    """Load the given payload versions of an analysis, keyed by version"""
+    with get_engine().begin() as conn:
+        analysis_id = _analysis_id(conn, gcs_key, startup_name)
+        if analysis_id is None:
+            return {}
+        rows = conn.execute(text(f"""
+            SELECT version, {", ".join(PAYLOAD_FIELDS)}
+            FROM analysis_payloads
+            WHERE analysis_id = :id AND version = ANY(:versions)
+        """), {"id": analysis_id, "versions": list(versions)}).mappings().all()
+    return {row["version"]: {field: row[field] for field in PAYLOAD_FIELDS} for row in rows}
+
 def get_cached_analysis_result(gcs_key: str) -> Dict[str, Any]:
     """Get cached analysis result by GCS key"""
     return get_analysis_result(gcs_key=gcs_key)
@@ -77,51 +221,150 @@ def get_cached_analysis_result(gcs_key: str) -> Dict[str, Any]:
 def get_conversation_history(session_id: str, limit: int = 20) -> List[Dict[str, Any]]:
     """Get conversation history for a session (gcs_key)"""
     try:
-        with engine.begin() as conn:
+        with get_engine().begin() as conn:
             result = conn.execute(text("""
                 SELECT user_message, model_response, created_at
                 FROM conversations 
                 WHERE session_id = :session_id
+                  -- Lets the planner skip monthly partitions older than the session
+                  AND created_at >= COALESCE(
+                      (SELECT MIN(first_chat) FROM chat_sessions WHERE session_id = :session_id),
+                      '-infinity'::timestamptz)
                 ORDER BY created_at ASC
                 LIMIT :limit
             """), {"session_id": session_id, "limit": limit}).mappings().all()
         
         # Convert to expected format (with 'message' and 'sender' keys for compatibility)
-        formatted_history = []
-        for row in result:
-            # Add user message first
-            if row['user_message']:
-                formatted_history.append({
-                    'message': row['user_message'],
-                    'sender': 'user',
-                    'created_at': row['created_at']
-                })
-            # Then add bot response
-            if row['model_response']:
-                formatted_history.append({
-                    'message': row['model_response'],
-                    'sender': 'assistant',
-                    'created_at': row['created_at']
-                })
+        formatted_history = _format_turns(result)
         
         return formatted_history
     except Exception as e:
         logging.error(f"Error getting conversation history: {e}")
         return []
 
-def store_conversation_pair(session_id: str, user_message: str, model_response: str, startup_name: str = None) -> bool:
-    """Store a complete conversation pair (user question + bot response)"""
+def _format_turns(rows) -> List[Dict[str, Any]]:
+    """Flatten conversation rows into alternating user/assistant messages"""
+    formatted_history = []
+    for row in rows:
+        if row['user_message']:
+            formatted_history.append({
+                'message': row['user_message'],
+                'sender': 'user',
+                'created_at': row['created_at']
+            })
+        if row['model_response']:
+            formatted_history.append({
+                'message': row['model_response'],
+                'sender': 'assistant',
+                'created_at': row['created_at']
+            })
+    return formatted_history
+
+def get_recent_conversation_turns(session_id: str, limit: int) -> List[Dict[str, Any]]:
+    """Get the latest `limit` conversation pairs for a session, oldest first"""
     try:
-        with engine.begin() as conn:
+        with get_engine().begin() as conn:
+            result = conn.execute(text("""
+                SELECT user_message, model_response, created_at
+                FROM conversations
+                WHERE session_id = :session_id
+                  AND created_at >= COALESCE(
+                      (SELECT MIN(first_chat) FROM chat_sessions WHERE session_id = :session_id),
+                      '-infinity'::timestamptz)
+                ORDER BY created_at DESC
+                LIMIT :limit
+            """), {"session_id": session_id, "limit": limit}).mappings().all()
+        return _format_turns(reversed(result))
+    except Exception as e:
+        logging.error(f"Error getting recent conversation turns: {e}")
+        return []
+
+def get_unsummarized_conversation_turns(session_id: str, after=None, limit: int = None) -> List[Dict[str, Any]]:
+    """Get conversation pairs for a session created after `after`, oldest first, at most `limit` of them"""
+    try:
+        with get_engine().begin() as conn:
+            result = conn.execute(text("""
+                SELECT user_message, model_response, created_at
+                FROM conversations
+                WHERE session_id = :session_id
+                  AND created_at > COALESCE(CAST(:after AS TIMESTAMPTZ), '-infinity'::timestamptz)
+                ORDER BY created_at ASC
+                LIMIT :limit
+            """), {"session_id": session_id, "after": after, "limit": limit}).mappings().all()
+        return [dict(row) for row in result]
+    except Exception as e:
+        logging.error(f"Error getting unsummarized conversation turns: {e}")
+        return []
+
+def get_session_summary(session_id: str) -> Optional[Dict[str, Any]]:
+    """Get the running summary of a chat session, if one has been compacted"""
+    try:
+        with get_engine().begin() as conn:
+            result = conn.execute(text("""
+                SELECT session_id, summary, summarized_through, turns_summarized, updated_at
+                FROM chat_session_summaries
+                WHERE session_id = :session_id
+            """), {"session_id": session_id}).mappings().first()
+        return dict(result) if result else None
+    except Exception as e:
+        logging.error(f"Error getting session summary: {e}")
+        return None
+
+def upsert_session_summary(session_id: str, summary: str, summarized_through, turns_summarized: int) -> bool:
+    """Store a session's running summary unless a newer one is already stored"""
+    try:
+        with get_engine().begin() as conn:
             conn.execute(text("""
-                INSERT INTO conversations (session_id, startup_name, gcs_key, user_message, model_response, created_at)
-                VALUES (:session_id, :startup_name, :gcs_key, :user_message, :model_response, now())
+                INSERT INTO chat_session_summaries (session_id, summary, summarized_through, turns_summarized)
+                VALUES (:session_id, :summary, :summarized_through, :turns_summarized)
+                ON CONFLICT (session_id)
+                DO UPDATE SET
+                    summary = EXCLUDED.summary,
+                    summarized_through = EXCLUDED.summarized_through,
+                    turns_summarized = EXCLUDED.turns_summarized,
+                    updated_at = now()
+                WHERE chat_session_summaries.summarized_through < EXCLUDED.summarized_through
+            """), {
+                "session_id": session_id,
+                "summary": summary,
+                "summarized_through": summarized_through,
+                "turns_summarized": turns_summarized
+            })
+        return True
+    except Exception as e:
+        logging.error(f"Error storing session summary: {e}")
+        return False
+
+def store_conversation_pair(session_id: str, user_message: str, model_response: str, startup_name: str = None,
+                            model_meta: Dict[str, Any] = None) -> bool:
+    """Store a complete conversation pair (user question + bot response)"""
+    try:
+        with get_engine().begin() as conn:
+            created_at = conn.execute(text("""
+                INSERT INTO conversations (session_id, startup_name, gcs_key, user_message, model_response, model_meta, created_at)
+                VALUES (:session_id, :startup_name, :gcs_key, :user_message, :model_response, CAST(:model_meta AS JSONB), now())
+                RETURNING created_at
             """), {
                 "session_id": session_id,
                 "startup_name": startup_name,
                 "gcs_key": session_id,  # Using session_id as gcs_key since they're the same
                 "user_message": user_message,
-                "model_response": model_response
+                "model_response": model_response,
+                "model_meta": json.dumps(model_meta) if model_meta is not None else None
+            }).scalar_one()
+            
+            # Keep the session summary in step within the same transaction
+            conn.execute(text("""
+                INSERT INTO chat_sessions (session_id, startup_name, first_chat, last_chat, message_count)
+                VALUES (:session_id, :startup_name, :created_at, :created_at, 1)
+                ON CONFLICT (session_id, startup_name)
+                DO UPDATE SET
+                    last_chat = GREATEST(chat_sessions.last_chat, EXCLUDED.last_chat),
+                    message_count = chat_sessions.message_count + 1
+            """), {
+                "session_id": session_id,
+                "startup_name": startup_name or "",
+                "created_at": created_at
             })
         return True
     except Exception as e:
@@ -133,40 +376,401 @@ def store_conversation_message(session_id: str, message: str, sender: str) -> bo
     # This function is called by the chatbot service but we'll handle storage differently
     return True
 
-def get_startup_chat_sessions() -> List[Dict[str, Any]]:
-    """Get list of startups with chat sessions"""
+def get_startup_chat_sessions(limit: int = 50, cursor: str = None, startup_name_prefix: str = None,
+                              sort: str = "newest") -> Dict[str, Any]:
+    """Get a page of startups with chat sessions, most recently active first by default"""
+    comparison, direction = _listing_order(sort)
+    params = {"limit": limit + 1}
+    conditions = []
+    if startup_name_prefix:
+        params["prefix"] = _prefix_pattern(startup_name_prefix)
+        conditions.append("lower(startup_name) LIKE :prefix ESCAPE '\\'")
+    if cursor:
+        params["last_chat"], params["session_id"], params["startup_name"] = _decode_listing_cursor(cursor, sort, 3)
+        conditions.append(f"""(last_chat, session_id, startup_name)
+                    {comparison} (CAST(:last_chat AS TIMESTAMPTZ), :session_id, :startup_name)""")
+    where_clause = f"\n                WHERE {' AND '.join(conditions)}" if conditions else ""
+    
     try:
-        with engine.begin() as conn:
-            result = conn.execute(text("""
+        with get_engine().begin() as conn:
+            result = conn.execute(text(f"""
                 SELECT 
-                    c.session_id as gcs_key,
-                    c.startup_name,
-                    MIN(c.created_at) as first_chat,
-                    MAX(c.created_at) as last_chat,
-                    COUNT(*) as message_count
-                FROM conversations c
-                GROUP BY c.session_id, c.startup_name
-                ORDER BY MAX(c.created_at) DESC
-                LIMIT 50
-            """)).mappings().all()
+                    session_id as gcs_key,
+                    startup_name,
+                    first_chat,
+                    last_chat,
+                    message_count
+                FROM chat_sessions{where_clause}
+                ORDER BY last_chat {direction}, session_id {direction}, startup_name {direction}
+                LIMIT :limit
+            """), params).mappings().all()
         
-        return [dict(row) for row in result]
+        rows = [dict(row) for row in result]
+        has_more = len(rows) > limit
+        next_cursor = None
+        if has_more:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor([sort, last["last_chat"], last["gcs_key"], last["startup_name"]])
+        
+        for row in rows:
+            row["startup_name"] = row["startup_name"] or None
+        
+        return {"sessions": rows, "next_cursor": next_cursor, "has_more": has_more}
     except Exception as e:
         logging.error(f"Error getting startup chat sessions: {e}")
-        return []
+        return {"sessions": [], "next_cursor": None, "has_more": False}
 
-def get_all_analysis_results() -> List[Dict[str, Any]]:
-    """Get list of all available analysis results for chat"""
+def get_all_analysis_results(limit: int = 100, cursor: str = None, startup_name_prefix: str = None,
+                             sort: str = "newest") -> Dict[str, Any]:
+    """Get a page of available analysis results for chat, keyset-paginated on (created_at, id)"""
+    comparison, direction = _listing_order(sort)
+    params = {"limit": limit + 1}
+    conditions = []
+    if startup_name_prefix:
+        params["prefix"] = _prefix_pattern(startup_name_prefix)
+        conditions.append("lower(startup_name) LIKE :prefix ESCAPE '\\'")
+    if cursor:
+        params["created_at"], params["id"] = _decode_listing_cursor(cursor, sort, 2)
+        conditions.append(f"(created_at, id) {comparison} (CAST(:created_at AS TIMESTAMPTZ), :id)")
+    where_clause = f"\n                WHERE {' AND '.join(conditions)}" if conditions else ""
+    
     try:
-        with engine.begin() as conn:
-            result = conn.execute(text("""
-                SELECT gcs_key, startup_name, created_at, files_processed
-                FROM analysis_results
-                ORDER BY created_at DESC
-                LIMIT 100
-            """)).mappings().all()
+        with get_engine().begin() as conn:
+            result = conn.execute(text(f"""
+                SELECT id, gcs_key, startup_name, created_at, files_processed
+                FROM analysis_results{where_clause}
+                ORDER BY created_at {direction}, id {direction}
+                LIMIT :limit
+            """), params).mappings().all()
         
-        return [dict(row) for row in result]
+        rows = [dict(row) for row in result]
+        has_more = len(rows) > limit
+        next_cursor = None
+        if has_more:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([sort, rows[-1]["created_at"], rows[-1]["id"]])
+        
+        # The id is only needed for the cursor
+        for row in rows:
+            row.pop("id")
+        
+        return {"analyses": rows, "next_cursor": next_cursor, "has_more": has_more}
     except Exception as e:
         logging.error(f"Error getting all analysis results: {e}")
-        return []
+        return {"analyses": [], "next_cursor": None, "has_more": False}
+
+def search_analyses_by_metrics(filters: List[tuple] = None, sort: str = None, order: str = "desc",
+                               limit: int = 50, cursor: str = None) -> Dict[str, Any]:
+    """Filter and sort analyses on the typed metric columns, keyset-paginated on (metric, id).
+    
+    filters are (column, operator, value) tuples; column must be in NORMALIZED_COLUMNS
+    and operator one of >=, <=, >, <, =. Rows without a value for the sort metric are
+    left out. Raises ValueError for unknown columns, operators or bad cursors.
+    """
+    if sort is not None and sort not in NORMALIZED_COLUMNS:
+        raise ValueError(f"Invalid sort. Use one of: {', '.join(NORMALIZED_COLUMNS)}")
+    if order not in ("asc", "desc"):
+        raise ValueError("Invalid order. Use 'asc' or 'desc'")
+    
+    params = {"limit": limit + 1}
+    conditions = []
+    for i, (column, operator, value) in enumerate(filters or []):
+        if column not in NORMALIZED_COLUMNS:
+            raise ValueError(f"Invalid filter metric '{column}'. Use one of: {', '.join(NORMALIZED_COLUMNS)}")
+        if operator not in (">=", "<=", ">", "<", "="):
+            raise ValueError(f"Invalid filter operator '{operator}'")
+        conditions.append(f"{column} {operator} :filter_{i}")
+        params[f"filter_{i}"] = value
+    
+    sort_column = sort or "id"
+    comparison = "<" if order == "desc" else ">"
+    if sort:
+        conditions.append(f"{sort} IS NOT NULL")
+    if cursor:
+        cursor_sort, cursor_order, params["after_value"], params["after_id"] = decode_cursor(cursor, 4)
+        if (cursor_sort, cursor_order) != (sort_column, order):
+            raise ValueError("Cursor does not match the requested sort")
+        conditions.append(f"({sort_column}, id) {comparison} (:after_value, :after_id)")
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    with get_engine().begin() as conn:
+        result = conn.execute(text(f"""
+            SELECT id, gcs_key, startup_name, created_at, updated_at, normalized_metrics,
+                   {", ".join(NORMALIZED_COLUMNS)}
+            FROM analysis_results
+            {where_clause}
+            ORDER BY {sort_column} {order.upper()}, id {order.upper()}
+            LIMIT :limit
+        """), params).mappings().all()
+    
+    rows = [dict(row) for row in result]
+    has_more = len(rows) > limit
+    next_cursor = None
+    if has_more:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([sort_column, order, rows[-1][sort_column], rows[-1]["id"]])
+    return {"analyses": rows, "next_cursor": next_cursor, "has_more": has_more}
+
+def insert_analysis_run(run: Dict[str, Any]) -> Optional[int]:
+    """Store one analysis run record; returns its id or None on failure"""
+    try:
+        with get_engine().begin() as conn:
+            return conn.execute(text("""
+                INSERT INTO analysis_runs (gcs_key, startup_name, execution, model, outcome, error, started_at,
+                                           total_seconds, stage_seconds, model_calls, input_tokens, cached_tokens,
+                                           output_tokens, cost_usd, bytes_downloaded, files_processed, files_extracted,
+                                           input_plan)
+                VALUES (:gcs_key, :startup_name, :execution, :model, :outcome, :error, :started_at,
+                        :total_seconds, CAST(:stage_seconds AS JSONB), CAST(:model_calls AS JSONB), :input_tokens,
+                        :cached_tokens, :output_tokens, :cost_usd, :bytes_downloaded, :files_processed, :files_extracted,
+                        CAST(:input_plan AS JSONB))
+                RETURNING id
+            """), dict(
+                run,
+                stage_seconds=json.dumps(run["stage_seconds"]),
+                model_calls=json.dumps(run["model_calls"]),
+                input_plan=json.dumps(run["input_plan"]) if run.get("input_plan") is not None else None
+            )).scalar_one()
+    except Exception as e:
+        logging.error(f"Error storing analysis run for {run.get('gcs_key')}: {e}")
+        return None
+
+def get_analysis_run_stats(days: int = 30) -> List[Dict[str, Any]]:
+    """Per day and model: run counts, latency and stage percentiles, token, byte and cost totals"""
+    with get_engine().begin() as conn:
+        result = conn.execute(text("""
+            SELECT
+                date_trunc('day', started_at) AS day,
+                COALESCE(model, 'none') AS model,
+                COUNT(*) AS runs,
+                COUNT(*) FILTER (WHERE outcome <> 'success') AS failed_runs,
+                percentile_cont(0.5) WITHIN GROUP (ORDER BY total_seconds) AS p50_seconds,
+                percentile_cont(0.95) WITHIN GROUP (ORDER BY total_seconds) AS p95_seconds,
+                percentile_cont(0.99) WITHIN GROUP (ORDER BY total_seconds) AS p99_seconds,
+                percentile_cont(0.5) WITHIN GROUP (ORDER BY (stage_seconds->>'extract')::float) AS p50_extract_seconds,
+                percentile_cont(0.95) WITHIN GROUP (ORDER BY (stage_seconds->>'extract')::float) AS p95_extract_seconds,
+                percentile_cont(0.5) WITHIN GROUP (ORDER BY (stage_seconds->>'generate')::float) AS p50_generate_seconds,
+                percentile_cont(0.95) WITHIN GROUP (ORDER BY (stage_seconds->>'generate')::float) AS p95_generate_seconds,
+                percentile_cont(0.5) WITHIN GROUP (ORDER BY input_tokens) AS p50_input_tokens,
+                percentile_cont(0.95) WITHIN GROUP (ORDER BY input_tokens) AS p95_input_tokens,
+                SUM(input_tokens) AS input_tokens,
+                SUM(cached_tokens) AS cached_tokens,
+                SUM(output_tokens) AS output_tokens,
+                SUM(bytes_downloaded) AS bytes_downloaded,
+                SUM(cost_usd) AS cost_usd
+            FROM analysis_runs
+            WHERE started_at >= now() - make_interval(days => :days)
+            GROUP BY 1, 2
+            ORDER BY 1 DESC, 2
+        """), {"days": days}).mappings().all()
+    return [dict(row) for row in result]
+
+def get_analysis_run_costs(days: int = 30, startup_name: str = None) -> List[Dict[str, Any]]:
+    """Per startup and day: runs, tokens and estimated cost"""
+    with get_engine().begin() as conn:
+        result = conn.execute(text("""
+            SELECT
+                startup_name,
+                date_trunc('day', started_at) AS day,
+                COUNT(*) AS runs,
+                SUM(input_tokens) AS input_tokens,
+                SUM(output_tokens) AS output_tokens,
+                SUM(cost_usd) AS cost_usd
+            FROM analysis_runs
+            WHERE started_at >= now() - make_interval(days => :days)
+              AND (CAST(:startup_name AS TEXT) IS NULL OR startup_name = :startup_name)
+            GROUP BY 1, 2
+            ORDER BY 1, 2 DESC
+        """), {"days": days, "startup_name": startup_name}).mappings().all()
+    return [dict(row) for row in result]
+
+def get_analysis_artifacts(gcs_key: str, startup_name: str) -> Optional[Dict[str, Any]]:
+    """Get the checkpointed artifacts of the latest run for an analysis"""
+    try:
+        with get_engine().begin() as conn:
+            row = conn.execute(text("""
+                SELECT gcs_key, startup_name, execution, stage, manifest, extracted_texts,
+                       generated_content, created_at, updated_at
+                FROM analysis_artifacts
+                WHERE gcs_key = :gcs_key AND startup_name = :startup_name
+            """), {"gcs_key": gcs_key, "startup_name": startup_name}).mappings().first()
+        return dict(row) if row else None
+    except Exception as e:
+        logging.error(f"Error getting analysis artifacts for {gcs_key}: {e}")
+        return None
+
+def start_analysis_artifacts(gcs_key: str, startup_name: str, execution: str, manifest: List[Dict[str, Any]],
+                             extracted_texts: Dict[str, str] = None) -> bool:
+    """Begin a new checkpoint for a run, replacing the previous run's artifacts"""
+    try:
+        with get_engine().begin() as conn:
+            conn.execute(text("""
+                INSERT INTO analysis_artifacts (gcs_key, startup_name, execution, stage, manifest, extracted_texts)
+                VALUES (:gcs_key, :startup_name, :execution, :stage, CAST(:manifest AS JSONB), CAST(:extracted_texts AS JSONB))
+                ON CONFLICT (gcs_key, startup_name)
+                DO UPDATE SET
+                    execution = EXCLUDED.execution,
+                    stage = EXCLUDED.stage,
+                    manifest = EXCLUDED.manifest,
+                    extracted_texts = EXCLUDED.extracted_texts,
+                    generated_content = NULL,
+                    created_at = now(),
+                    updated_at = now()
+            """), {
+                "gcs_key": gcs_key,
+                "startup_name": startup_name,
+                "execution": execution,
+                "stage": "extracted" if extracted_texts is not None else "listed",
+                "manifest": json.dumps(manifest, default=str),
+                "extracted_texts": json.dumps(extracted_texts) if extracted_texts is not None else None
+            })
+        return True
+    except Exception as e:
+        logging.error(f"Error starting analysis checkpoint for {gcs_key}: {e}")
+        return False
+
+def update_analysis_artifacts(gcs_key: str, startup_name: str, stage: str, extracted_texts: Dict[str, str] = None,
+                              generated_text: str = None, generated_section: Dict[str, str] = None) -> bool:
+    """Advance a checkpoint's stage, saving extracted texts, a single-call output or one section's output"""
+    try:
+        with get_engine().begin() as conn:
+            conn.execute(text("""
+                UPDATE analysis_artifacts
+                SET stage = :stage,
+                    extracted_texts = COALESCE(CAST(:extracted_texts AS JSONB), extracted_texts),
+                    generated_content = CASE
+                        WHEN CAST(:generated_text AS TEXT) IS NOT NULL
+                            THEN jsonb_build_object('text', CAST(:generated_text AS TEXT))
+                        WHEN CAST(:generated_section AS JSONB) IS NOT NULL
+                            THEN jsonb_build_object('sections',
+                                COALESCE(generated_content->'sections', '{}'::jsonb) || CAST(:generated_section AS JSONB))
+                        ELSE generated_content
+                    END,
+                    updated_at = now()
+                WHERE gcs_key = :gcs_key AND startup_name = :startup_name
+            """), {
+                "gcs_key": gcs_key,
+                "startup_name": startup_name,
+                "stage": stage,
+                "extracted_texts": json.dumps(extracted_texts) if extracted_texts is not None else None,
+                "generated_text": generated_text,
+                "generated_section": json.dumps(generated_section) if generated_section is not None else None
+            })
+        return True
+    except Exception as e:
+        logging.error(f"Error checkpointing {stage} for {gcs_key}: {e}")
+        return False
+
+def iter_generated_artifacts(batch_size: int = 100) -> Iterator[Dict[str, Any]]:
+    """Stream checkpoints that hold raw model output, via a server-side cursor"""
+    with get_engine().connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(text("""
+            SELECT gcs_key, startup_name, execution, generated_content, jsonb_array_length(manifest) AS files_processed
+            FROM analysis_artifacts
+            WHERE generated_content IS NOT NULL
+            ORDER BY gcs_key, startup_name
+        """))
+        for row in result.mappings():
+            yield dict(row)
+
+def iter_analysis_results(since=None, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+    """Stream full analysis rows (optionally only those updated after `since`) via a server-side cursor"""
+    with get_engine().connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(text("""
+            SELECT r.id, r.gcs_key, r.startup_name, r.files_processed, r.created_at, r.updated_at,
+                   p.extracted_data, p.analysis_summary, p.peer_comparison_table, r.normalized_metrics
+            FROM analysis_results r
+            LEFT JOIN analysis_payloads p ON p.analysis_id = r.id AND p.version = r.current_version
+            WHERE r.updated_at > COALESCE(CAST(:since AS TIMESTAMPTZ), '-infinity'::timestamptz)
+            ORDER BY r.updated_at, r.id
+        """), {"since": since})
+        for row in result.mappings():
+            yield dict(row)
+
+def iter_conversations(since=None, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+    """Stream conversation rows (optionally only those created after `since`) via a server-side cursor"""
+    with get_engine().connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(text("""
+            SELECT id, session_id::text AS session_id, startup_name, gcs_key, user_message, model_response,
+                   user_meta, model_meta, created_at
+            FROM conversations
+            WHERE created_at > COALESCE(CAST(:since AS TIMESTAMPTZ), '-infinity'::timestamptz)
+            ORDER BY created_at, id
+        """), {"since": since})
+        for row in result.mappings():
+            yield dict(row)
+
+def get_company_profiles(name_keys: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Load stored company profiles by normalized name, regardless of age"""
+    if not name_keys:
+        return {}
+    with get_engine().begin() as conn:
+        result = conn.execute(text("""
+            SELECT name_key, company_name, profile, source, source_gcs_key, refreshed_at
+            FROM company_profiles
+            WHERE name_key = ANY(:name_keys)
+        """), {"name_keys": list(name_keys)}).mappings().all()
+    return {row["name_key"]: dict(row) for row in result}
+
+def get_peer_candidate_profiles(startup_key: str, max_age_days: int, limit: int) -> List[Dict[str, Any]]:
+    """Fresh profiles of companies related to a startup: its own earlier peers, the startups
+    that listed it as a peer, and the other peers listed alongside it, newest first"""
+    with get_engine().begin() as conn:
+        result = conn.execute(text("""
+            WITH related AS (
+                SELECT unnest(peers) AS name_key FROM company_peer_sets WHERE startup_key = :startup_key
+                UNION
+                SELECT startup_key FROM company_peer_sets WHERE :startup_key = ANY(peers)
+                UNION
+                SELECT unnest(peers) FROM company_peer_sets WHERE :startup_key = ANY(peers)
+            )
+            SELECT p.name_key, p.company_name, p.profile, p.source, p.refreshed_at
+            FROM company_profiles p
+            JOIN related r ON r.name_key = p.name_key
+            WHERE p.name_key <> :startup_key
+              AND p.refreshed_at > now() - make_interval(days => :max_age_days)
+            ORDER BY p.refreshed_at DESC
+            LIMIT :limit
+        """), {"startup_key": startup_key, "max_age_days": max_age_days, "limit": limit}).mappings().all()
+    return [dict(row) for row in result]
+
+def upsert_company_profiles(profiles: List[Dict[str, Any]], gcs_key: str, max_age_days: int) -> None:
+    """Store researched company profiles.
+    
+    A profile from a company's own data room ('extracted_data') always replaces the
+    stored one; a peer-table profile does not overwrite a fresh data-room profile.
+    """
+    with get_engine().begin() as conn:
+        for profile in profiles:
+            conn.execute(text("""
+                INSERT INTO company_profiles (name_key, company_name, profile, source, source_gcs_key)
+                VALUES (:name_key, :company_name, CAST(:profile AS JSONB), :source, :source_gcs_key)
+                ON CONFLICT (name_key)
+                DO UPDATE SET
+                    company_name = EXCLUDED.company_name,
+                    profile = EXCLUDED.profile,
+                    source = EXCLUDED.source,
+                    source_gcs_key = EXCLUDED.source_gcs_key,
+                    refreshed_at = now()
+                WHERE EXCLUDED.source = 'extracted_data'
+                   OR company_profiles.source = 'peer_table'
+                   OR company_profiles.refreshed_at <= now() - make_interval(days => :max_age_days)
+            """), {
+                "name_key": profile["name_key"],
+                "company_name": profile["company_name"],
+                "profile": json.dumps(profile["profile"]),
+                "source": profile["source"],
+                "source_gcs_key": gcs_key,
+                "max_age_days": max_age_days
+            })
+
+def upsert_company_peer_set(startup_key: str, startup_name: str, peers: List[str]) -> None:
+    """Replace the list of peers named in a startup's latest peer table"""
+    with get_engine().begin() as conn:
+        conn.execute(text("""
+            INSERT INTO company_peer_sets (startup_key, startup_name, peers)
+            VALUES (:startup_key, :startup_name, :peers)
+            ON CONFLICT (startup_key)
+            DO UPDATE SET startup_name = EXCLUDED.startup_name, peers = EXCLUDED.peers, updated_at = now()
+        """), {"startup_key": startup_key, "startup_name": startup_name, "peers": peers})
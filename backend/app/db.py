@@ -1,13 +1,18 @@
-import pg8000
+import threading
 import sqlalchemy
-from google.cloud.sql.connector import Connector, IPTypes
 from .config import (
-    INSTANCE_CONNECTION_NAME, DB_USER, DB_PASS, DB_NAME, USE_PRIVATE_IP
+    INSTANCE_CONNECTION_NAME, DB_USER, DB_PASS, DB_NAME, USE_PRIVATE_IP, BULKHEADS, DB_POOL_OVERFLOW,
+    CHAT_COMPACTION_WORKERS, INGEST_ANALYSIS_WORKERS
 )
 
-_connector = Connector(refresh_strategy="LAZY")
+# Connector and engine are created on first use so importing this module
+# does not require Cloud SQL credentials
+_connector = None
+_engine = None
+_engine_lock = threading.Lock()
 
-def _getconn() -> pg8000.dbapi.Connection:
+def _getconn():
+    from google.cloud.sql.connector import IPTypes
     return _connector.connect(
         INSTANCE_CONNECTION_NAME,
         "pg8000",
@@ -17,12 +22,45 @@ def _getconn() -> pg8000.dbapi.Connection:
         ip_type=IPTypes.PRIVATE if USE_PRIVATE_IP else IPTypes.PUBLIC,
     )
 
-engine = sqlalchemy.create_engine(
-    "postgresql+pg8000://",
-    creator=_getconn,
-    pool_size=5,
-    max_overflow=2,
-    pool_timeout=30,
-    pool_recycle=1800,
-    future=True,
-)
+# Partition maintenance holds its advisory-lock connection while it works on a second one
+MAINTENANCE_CONNECTIONS = 2
+
+def pool_size() -> int:
+    """One connection for every thread that talks to the database.
+
+    Besides the db and export bulkheads, chat and analyses read and write on model
+    bulkhead threads, and the ingest workers, the compaction worker and partition
+    maintenance run outside any bulkhead.
+    """
+    bulkhead_threads = sum(BULKHEADS[name]["max_workers"] for name in ("db", "export", "model"))
+    return bulkhead_threads + INGEST_ANALYSIS_WORKERS + CHAT_COMPACTION_WORKERS + MAINTENANCE_CONNECTIONS
+
+def get_engine() -> sqlalchemy.engine.Engine:
+    """Return the shared SQLAlchemy engine, creating it on first use"""
+    global _connector, _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                from google.cloud.sql.connector import Connector
+                _connector = Connector(refresh_strategy="LAZY")
+                _engine = sqlalchemy.create_engine(
+                    "postgresql+pg8000://",
+                    creator=_getconn,
+                    pool_size=pool_size(),
+                    max_overflow=DB_POOL_OVERFLOW,
+                    pool_timeout=30,
+                    pool_recycle=1800,
+                    future=True,
+                )
+    return _engine
+
+def dispose_engine() -> None:
+    """Close pooled connections and the Cloud SQL connector; used when a worker shuts down"""
+    global _connector, _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+        if _connector is not None:
+            _connector.close()
+            _connector = None
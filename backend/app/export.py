@@ -0,0 +1,143 @@
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Tuple
+from .bulkheads import export_bulkhead
+from .config import EXPORT_BATCH_SIZE, EXPORT_BUFFERED_CHUNKS
+import json
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Column name -> Arrow type name; JSONB columns are exported as JSON text
+EXPORT_COLUMNS: Dict[str, List[Tuple[str, str]]] = {
+    "analyses": [
+        ("id", "int64"), ("gcs_key", "string"), ("startup_name", "string"), ("files_processed", "int64"),
+        ("created_at", "timestamp"), ("updated_at", "timestamp"),
+        ("extracted_data", "json"), ("analysis_summary", "json"), ("peer_comparison_table", "json"),
+        ("normalized_metrics", "json"),
+    ],
+    "conversations": [
+        ("id", "int64"), ("session_id", "string"), ("startup_name", "string"), ("gcs_key", "string"),
+        ("user_message", "string"), ("model_response", "string"),
+        ("user_meta", "json"), ("model_meta", "json"), ("created_at", "timestamp"),
+    ],
+}
+
+NDJSON_CHUNK_BYTES = 64 * 1024
+
+class _DrainableSink:
+    """Write-only file object whose buffered bytes can be drained while tell() keeps counting"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def _encoded_chunks(kind: str, fmt: str, since) -> Callable[[], Iterator[bytes]]:
+    """Blocking iterator of encoded export bytes: rows are read and encoded on the same thread"""
+    from app.dao import iter_analysis_results, iter_conversations
+    source = iter_analysis_results if kind == "analyses" else iter_conversations
+
+    def chunks() -> Iterator[bytes]:
+        rows = source(since=since, batch_size=EXPORT_BATCH_SIZE)
+        try:
+            yield from _ndjson(rows) if fmt == "ndjson" else _columnar(kind, fmt, rows)
+        finally:
+            # Releases the server-side cursor when the client goes away mid-export
+            rows.close()
+    return chunks
+
+def _ndjson(rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    buffer = []
+    size = 0
+    for row in rows:
+        line = (json.dumps(row, default=str) + "\n").encode("utf-8")
+        buffer.append(line)
+        size += len(line)
+        if size >= NDJSON_CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+def _arrow_schema(kind: str):
+    import pyarrow as pa
+    types = {"int64": pa.int64(), "string": pa.string(), "json": pa.string(), "timestamp": pa.timestamp("us", tz="UTC")}
+    return pa.schema([(name, types[type_name]) for name, type_name in EXPORT_COLUMNS[kind]])
+
+def _record_batch(kind: str, schema, rows: List[Dict[str, Any]]):
+    import pyarrow as pa
+    columns = []
+    for name, type_name in EXPORT_COLUMNS[kind]:
+        values = [row.get(name) for row in rows]
+        if type_name == "json":
+            values = [json.dumps(v, default=str) if v is not None else None for v in values]
+        columns.append(values)
+    return pa.RecordBatch.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+    )
+
+def _columnar(kind: str, fmt: str, rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(kind)
+    sink = _DrainableSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+        write = writer.write_batch
+    else:
+        writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), schema)
+        write = writer.write_batch
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            write(_record_batch(kind, schema, batch))
+            batch = []
+            yield sink.drain()
+    if batch:
+        write(_record_batch(kind, schema, batch))
+    writer.close()
+    yield sink.drain()
+
+def check_export_format(fmt: str) -> None:
+    """Raise ValueError for unknown formats or columnar formats without pyarrow installed"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid format. Use one of: {', '.join(EXPORT_FORMATS)}")
+    if fmt != "ndjson":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError(f"Format '{fmt}' requires pyarrow to be installed on the server")
+
+def stream_export(kind: str, fmt: str, since=None) -> AsyncIterator[bytes]:
+    """Stream all rows of `kind` ("analyses" or "conversations") in `fmt` with constant memory.
+
+    Rows are read through a server-side cursor and encoded batch by batch on the
+    export bulkhead, so JSON, Arrow and Parquet encoding never runs on the event
+    loop; only finished chunks are handed over, at most EXPORT_BUFFERED_CHUNKS ahead.
+    """
+    return export_bulkhead.stream(_encoded_chunks(kind, fmt, since), max_buffered=EXPORT_BUFFERED_CHUNKS)
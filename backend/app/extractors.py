@@ -0,0 +1,297 @@
+from typing import Callable, Dict, Optional, Union
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from .config import (
+    EXTRACTION_WORKERS, EXTRACTION_TIMEOUT_SECONDS, EXTRACTION_MAX_ROWS_PER_SHEET,
+    EXTRACTION_SPOOL_THRESHOLD_BYTES, EXTRACTION_MEMORY_BUDGET_BYTES, EXTRACTION_MAX_CHARS_PER_DOCUMENT
+)
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+PPTX_MIME = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PDF_MIME = "application/pdf"
+
+# Extractors accept either the raw bytes or the path of a spooled temp file
+Source = Union[bytes, str]
+
+# MIME type -> function turning a document into compact text of at most max_chars characters
+EXTRACTORS: Dict[str, Callable[[Source, int], str]] = {}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def register_extractor(*mime_types: str):
+    """Decorator registering a text extractor for one or more MIME types"""
+    def decorator(func: Callable[[Source, int], str]) -> Callable[[Source, int], str]:
+        for mime_type in mime_types:
+            EXTRACTORS[mime_type] = func
+        return func
+    return decorator
+
+def get_extractor(mime_type: str) -> Optional[Callable[[Source, int], str]]:
+    """Return the extractor registered for a MIME type, if any"""
+    return EXTRACTORS.get(mime_type)
+
+class MemoryBudget:
+    """Tracks bytes a single request holds in memory during extraction"""
+
+    def __init__(self, limit_bytes: int):
+        self.limit_bytes = limit_bytes
+        self.used_bytes = 0
+        self._lock = threading.Lock()
+
+    def try_reserve(self, n: int) -> bool:
+        with self._lock:
+            if self.used_bytes + n > self.limit_bytes:
+                return False
+            self.used_bytes += n
+            return True
+
+    def reserve_up_to(self, n: int) -> int:
+        """Reserve as much of n as is still free; returns the amount reserved"""
+        with self._lock:
+            n = max(0, min(n, self.limit_bytes - self.used_bytes))
+            self.used_bytes += n
+            return n
+
+    def release(self, n: int) -> None:
+        with self._lock:
+            self.used_bytes = max(0, self.used_bytes - n)
+
+def _open_source(source: Source):
+    """Return something the document libraries can open: a path or a BytesIO"""
+    return io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+
+def _capped(parts, max_chars: int) -> str:
+    """Join extracted parts, cutting the text at max_chars"""
+    text = "\n".join(parts)
+    return text if len(text) <= max_chars else text[:max_chars] + "\n[truncated]"
+
+def _row_text(cells) -> str:
+    """Join non-empty cell values into one compact, pipe-delimited row"""
+    values = [str(c).strip() for c in cells if c is not None and str(c).strip()]
+    return " | ".join(values)
+
+@register_extractor(DOCX_MIME)
+def extract_text_from_docx_bytes(source: Source, max_chars: int = EXTRACTION_MAX_CHARS_PER_DOCUMENT) -> str:
+    """Extract paragraphs and tables, in document order, from a .docx using python-docx"""
+    from docx import Document
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+    document = Document(_open_source(source))
+    lines, chars = [], 0
+    for child in document.element.body.iterchildren():
+        if chars > max_chars:
+            break
+        tag = child.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            text = Paragraph(child, document).text
+            if text.strip():
+                lines.append(text)
+                chars += len(text) + 1
+        elif tag == "tbl":
+            for row in Table(child, document).rows:
+                # Merged cells are repeated by python-docx; keep each underlying cell once
+                seen, cells = set(), []
+                for cell in row.cells:
+                    if id(cell._tc) not in seen:
+                        seen.add(id(cell._tc))
+                        cells.append(cell.text)
+                row_text = _row_text(cells)
+                if row_text:
+                    lines.append(row_text)
+                    chars += len(row_text) + 1
+    return _capped(lines, max_chars)
+
+@register_extractor(PDF_MIME)
+def extract_text_from_pdf_bytes(source: Source, max_chars: int = EXTRACTION_MAX_CHARS_PER_DOCUMENT) -> str:
+    """Extract page text from a .pdf using pypdf"""
+    from pypdf import PdfReader
+    reader = PdfReader(_open_source(source))
+    pages, chars = [], 0
+    for number, page in enumerate(reader.pages, start=1):
+        if chars > max_chars:
+            break
+        page_text = (page.extract_text() or "").strip()
+        if page_text:
+            pages.append(f"--- Page {number} ---\n{page_text}")
+            chars += len(pages[-1]) + 1
+    return _capped(pages, max_chars)
+
+@register_extractor(PPTX_MIME)
+def extract_text_from_pptx_bytes(source: Source, max_chars: int = EXTRACTION_MAX_CHARS_PER_DOCUMENT) -> str:
+    """Extract slide text and tables from a .pptx using python-pptx"""
+    from pptx import Presentation
+    presentation = Presentation(_open_source(source))
+    slides, chars = [], 0
+    for number, slide in enumerate(presentation.slides, start=1):
+        if chars > max_chars:
+            break
+        lines = []
+        for shape in slide.shapes:
+            if shape.has_text_frame:
+                text = shape.text_frame.text.strip()
+                if text:
+                    lines.append(text)
+            elif getattr(shape, "has_table", False) and shape.has_table:
+                for row in shape.table.rows:
+                    row_text = _row_text(cell.text for cell in row.cells)
+                    if row_text:
+                        lines.append(row_text)
+        if lines:
+            slides.append(f"--- Slide {number} ---\n" + "\n".join(lines))
+            chars += len(slides[-1]) + 1
+    return _capped(slides, max_chars)
+
+@register_extractor(XLSX_MIME)
+def extract_text_from_xlsx_bytes(source: Source, max_chars: int = EXTRACTION_MAX_CHARS_PER_DOCUMENT) -> str:
+    """Extract sheet rows from a .xlsx using openpyxl (cached values, not formulas)"""
+    from openpyxl import load_workbook
+    workbook = load_workbook(_open_source(source), read_only=True, data_only=True)
+    try:
+        sheets, chars = [], 0
+        for sheet in workbook.worksheets:
+            if chars > max_chars:
+                break
+            rows = []
+            for values in sheet.iter_rows(values_only=True):
+                row_text = _row_text(values)
+                if row_text:
+                    rows.append(row_text)
+                    chars += len(row_text) + 1
+                if len(rows) >= EXTRACTION_MAX_ROWS_PER_SHEET:
+                    rows.append("[truncated]")
+                    break
+                if chars > max_chars:
+                    break
+            if rows:
+                sheets.append(f"--- Sheet: {sheet.title} ---\n" + "\n".join(rows))
+        return _capped(sheets, max_chars)
+    finally:
+        workbook.close()
+
+def _run_extractor(mime_type: str, source: Source, max_chars: int) -> str:
+    """Process-pool entry point; looks the extractor up again in the worker"""
+    return EXTRACTORS[mime_type](source, max_chars)
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """Return the shared extraction process pool, creating it on first use.
+
+    Workers are spawned rather than forked: the API process holds DB connections,
+    gRPC channels and bulkhead threads that a forked child must not inherit.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def _recycle_extraction_pool(pool: ProcessPoolExecutor) -> None:
+    """Kill a pool whose worker is stuck or dead; the next extraction starts a fresh one.
+
+    Other extractions running in the same pool fail and their files are attached by URI.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return
+        _pool = None
+    # ProcessPoolExecutor has no public way to stop a busy worker
+    for process in list((pool._processes or {}).values()):
+        process.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _extract_in_pool(mime_type: str, source: Source, max_chars: int) -> str:
+    pool = get_extraction_pool()
+    future = pool.submit(_run_extractor, mime_type, source, max_chars)
+    del source
+    try:
+        return future.result(timeout=EXTRACTION_TIMEOUT_SECONDS)
+    except (FutureTimeout, BrokenProcessPool):
+        logging.warning(f"Extraction worker timed out or died on a {mime_type} file; recycling the pool")
+        _recycle_extraction_pool(pool)
+        raise
+
+def _download_and_extract(storage_client, file_uri: str, mime_type: str, budget: MemoryBudget, max_chars: int,
+                          on_download: Optional[Callable[[int], None]] = None) -> str:
+    # Parse 'gs://bucket_name/path/to/file' into bucket and blob path
+    bucket_name, blob_path = file_uri.replace("gs://", "").split("/", 1)
+    blob = storage_client.bucket(bucket_name).get_blob(blob_path)
+    if blob is None:
+        raise FileNotFoundError(file_uri)
+    size = blob.size or 0
+    if on_download:
+        on_download(size)
+
+    # Small blobs stay in memory if the budget allows; everything else is spooled to disk
+    if size <= EXTRACTION_SPOOL_THRESHOLD_BYTES and budget.try_reserve(size):
+        try:
+            return _extract_in_pool(mime_type, blob.download_as_bytes(), max_chars)
+        finally:
+            budget.release(size)
+
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(blob_path)[1])
+    os.close(fd)
+    try:
+        blob.download_to_filename(path)
+        return _extract_in_pool(mime_type, path, max_chars)
+    finally:
+        os.remove(path)
+
+def _extract_within_budget(storage_client, file_uri: str, mime_type: str, budget: MemoryBudget,
+                           on_download: Optional[Callable[[int], None]] = None) -> Optional[str]:
+    """Reserve room for the text before extracting and cap the extractor at it; None if there is no room"""
+    allowance = budget.reserve_up_to(EXTRACTION_MAX_CHARS_PER_DOCUMENT)
+    if allowance == 0:
+        logging.warning(f"Extraction memory budget exhausted; attaching {file_uri} by URI")
+        return None
+    text = None
+    try:
+        text = _download_and_extract(storage_client, file_uri, mime_type, budget, allowance, on_download)
+        return text
+    finally:
+        # Give back the part of the reservation the text did not use
+        budget.release(max(allowance - len(text or ""), 0))
+
+def extract_documents(storage_client, files: Dict[str, str],
+                      memory_budget_bytes: int = EXTRACTION_MEMORY_BUDGET_BYTES,
+                      on_download: Optional[Callable[[int], None]] = None) -> Dict[str, str]:
+    """Download and extract text for each {gcs_uri: mime_type} that has an extractor.
+    
+    Returns {gcs_uri: text} for successful, non-empty extractions only; callers
+    fall back to attaching the remaining files by URI. Each document's text is
+    reserved from the request's memory budget before extraction, up to
+    EXTRACTION_MAX_CHARS_PER_DOCUMENT, and the extractor stops at that length.
+    on_download, if given, is called with the size of each blob fetched.
+    """
+    pending = {uri: mime for uri, mime in files.items() if mime in EXTRACTORS}
+    if not pending:
+        return {}
+
+    budget = MemoryBudget(memory_budget_bytes)
+    texts = {}
+    with ThreadPoolExecutor(max_workers=min(len(pending), EXTRACTION_WORKERS * 2)) as downloads:
+        futures = {
+            uri: downloads.submit(_extract_within_budget, storage_client, uri, mime, budget, on_download)
+            for uri, mime in pending.items()
+        }
+        for uri, future in futures.items():
+            try:
+                text = future.result()
+            except Exception as e:
+                logging.error(f"Local extraction failed for {uri}: {e}")
+                continue
+            if text is None:
+                continue
+            if not text.strip():
+                logging.info(f"No text extracted from {uri}; attaching by URI")
+            else:
+                texts[uri] = text
+    return texts
@@ -1,17 +1,33 @@
 from typing import List, Dict, Any
-from google.cloud import storage
+from .cassettes import replaying, wrap_storage_client
 import logging
+import threading
 
-# Initialize the GCS client globally
-client = storage.Client()
+# The GCS client is created on first use so importing this module stays cheap
+_client = None
+_client_lock = threading.Lock()
 
 # Hardcode your bucket name
 BUCKET_NAME = "evaluate-startup"
 
+def get_storage_client():
+    """Return the shared GCS client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if replaying():
+                    # Cassette replay serves listings and downloads from disk
+                    _client = wrap_storage_client(None)
+                else:
+                    from google.cloud import storage
+                    _client = wrap_storage_client(storage.Client())
+    return _client
+
 def list_gcs_files(relative_path: str, max_files: int = 100) -> List[Dict[str, Any]]:
     """List files in the GCS path using relative path"""
     try:
-        bucket = client.bucket(BUCKET_NAME)
+        bucket = get_storage_client().bucket(BUCKET_NAME)
         
         # Use relative path as prefix
         prefix = relative_path if not relative_path.startswith('/') else relative_path[1:]
@@ -1,21 +1,43 @@
 from typing import List, Dict, Any
-from google import genai
-from google.genai import types
-from .gcs_service import list_gcs_files, BUCKET_NAME
+from .cassettes import replaying, wrap_gemini_client
+from .config import ENABLE_LOCAL_EXTRACTION
+from .extractors import extract_documents, extract_text_from_docx_bytes
+from .gcs_service import list_gcs_files, get_storage_client, BUCKET_NAME
+from .input_budget import drop_duplicates, plan_input
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 import logging
 import mimetypes
-from docx import Document 
-from google.cloud import storage
-import io
+import threading
+import time
+
+# google.genai and python-docx are imported lazily; the Gemini client is
+# created once on first use and shared across requests
+_gemini_client = None
+_gemini_client_lock = threading.Lock()
 
 def initialize_gemini_client():
-    """Initialize Gemini client"""
-    client = genai.Client(
-        vertexai=True,
-        project="startip-evaluator",
-        location="global",
-    )
-    return client
+    """Return the shared Gemini client, creating it on first use"""
+    global _gemini_client
+    if _gemini_client is None:
+        with _gemini_client_lock:
+            if _gemini_client is None:
+                if replaying():
+                    # Cassette replay serves every call from disk; no credentials needed
+                    _gemini_client = wrap_gemini_client(None)
+                else:
+                    from google import genai
+                    _gemini_client = wrap_gemini_client(genai.Client(
+                        vertexai=True,
+                        project="startip-evaluator",
+                        location="global",
+                    ))
+    return _gemini_client
+
+# Slim container images ship without /etc/mime.types, so register the formats we extract
+mimetypes.add_type("application/vnd.openxmlformats-officedocument.wordprocessingml.document", ".docx")
+mimetypes.add_type("application/vnd.openxmlformats-officedocument.presentationml.presentation", ".pptx")
+mimetypes.add_type("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx")
 
 def get_mime_type_from_filename(filename: str) -> str:
     """Detect MIME type from filename extension"""
@@ -40,63 +62,86 @@ def get_all_files_from_path(relative_path: str) -> List[Dict[str, Any]]:
         logging.error(f"Error getting files from {relative_path}: {str(e)}")
         raise
 
-def extract_text_from_docx_bytes(docx_bytes: bytes) -> str:
-    """Extract plain text from .docx bytes using python-docx"""
-    bio = io.BytesIO(docx_bytes)
-    document = Document(bio)
-    full_text = []
-    for para in document.paragraphs:
-        full_text.append(para.text)
-    return "\n".join(full_text)
+def _stage(run, name: str):
+    """Time a block against the run's named stage, if a run is being recorded"""
+    return run.stage(name) if run else nullcontext()
 
-def generate_from_gcs_files(gcs_file_uris: List[str], prompt, enable_grounding) -> str:
-    """Generate content from multiple GCS files with optional Google Search grounding"""
-    storage_client = storage.Client()
-    try:
-        client = initialize_gemini_client()
-        
-        # Create parts for each file with dynamic mime type detection
-        parts = []
-        for file_uri in gcs_file_uris:
-            filename = file_uri.split("/")[-1]
-            mime_type = get_mime_type_from_filename(filename)
-            
-            if filename.lower().endswith(".docx"):
-                # Extract plain text from .docx file in GCS
-                try:
-                    # Extract bucket and blob path from GS URI like 'gs://bucket_name/path/to/file.docx'
-                    path_parts = file_uri.replace("gs://", "").split("/", 1)
-                    bucket_name = path_parts[0]
-                    blob_path = path_parts[1]
-                    
-                    bucket = storage_client.bucket(bucket_name)
-                    blob = bucket.blob(blob_path)
-                    docx_bytes = blob.download_as_bytes()
-                    extracted_text = extract_text_from_docx_bytes(docx_bytes)
-                    
-                    # Add extracted text as a text part instead of URI
-                    part = types.Part.from_text(text=extracted_text)
-                    parts.append(part)
-                    
-                    print(f"Added extracted text from .docx file: {filename}")
-                    continue
-                except Exception as e:
-                    print(f"❌ Failed to extract text from .docx {filename}: {e}")
-                    logging.error(f".docx extraction error: {e}")
-                    # Fallback to attaching as URI (less ideal)
-            
-            # For non-docx files or fallback, add as URI with mime_type
-            part = types.Part.from_uri(
-                file_uri=file_uri,
-                mime_type=mime_type
+def build_document_parts(gcs_file_uris: List[str], run=None, checkpoint=None,
+                         files: List[Dict[str, Any]] = None) -> List[Any]:
+    """Build one model part per file: extracted text where possible, otherwise a GCS URI.
+    
+    `files` (listing entries with md5_hash and size) lets the input planner drop exact
+    duplicates before download and estimate URI parts; documents are then ranked and
+    trimmed to INPUT_TOKEN_BUDGET, with the plan stored on `run`.
+    """
+    from google.genai import types
+    storage_client = get_storage_client()
+    
+    files_by_uri = {file["full_path"]: file for file in files or []}
+    gcs_file_uris, duplicates = drop_duplicates(gcs_file_uris, files_by_uri)
+    mime_types = {
+        file_uri: get_mime_type_from_filename(file_uri.split("/")[-1])
+        for file_uri in gcs_file_uris
+    }
+    
+    # Extract text locally (process pool) for formats with a registered extractor
+    extracted_texts = {}
+    if checkpoint and checkpoint.extracted_texts is not None:
+        # Same files as the checkpointed run: reuse its extracted texts
+        extracted_texts = checkpoint.extracted_texts
+    elif ENABLE_LOCAL_EXTRACTION:
+        with _stage(run, "extract"):
+            extracted_texts = extract_documents(
+                storage_client, mime_types, on_download=run.add_bytes if run else None
             )
+        if checkpoint:
+            checkpoint.save_extracted(extracted_texts)
+    if run:
+        run.files_extracted = len(extracted_texts)
+    
+    # Most relevant documents first, within the input token budget
+    gcs_file_uris, texts, plan = plan_input(gcs_file_uris, mime_types, extracted_texts, files_by_uri)
+    plan["excluded"] = duplicates + plan["excluded"]
+    if plan["excluded"]:
+        logging.info(f"Input plan left out {len(plan['excluded'])} file(s): {plan['excluded']}")
+    if run:
+        run.input_plan = plan
+    
+    # Create parts for each file with dynamic mime type detection
+    parts = []
+    for file_uri in gcs_file_uris:
+        filename = file_uri.split("/")[-1]
+        mime_type = mime_types[file_uri]
+        
+        if file_uri in texts:
+            # Add extracted text as a text part instead of URI
+            part = types.Part.from_text(text=f"Document: {filename}\n{texts[file_uri]}")
             parts.append(part)
-            print(f"Added file: {filename} with mime type: {mime_type}")
+            print(f"Added extracted text from file: {filename}")
+            continue
         
-        # Add the text prompt
+        # No extractor, extraction disabled or failed: attach as URI with mime_type
+        part = types.Part.from_uri(
+            file_uri=file_uri,
+            mime_type=mime_type
+        )
+        parts.append(part)
+        print(f"Added file: {filename} with mime type: {mime_type}")
+    
+    return parts
+
+def generate_from_parts(document_parts: List[Any], prompt: str, enable_grounding: bool,
+                        model: str = "gemini-2.5-pro", max_output_tokens: int = 65535,
+                        run=None, section: str = None) -> str:
+    """Generate content from prepared document parts plus a text prompt"""
+    from google.genai import types
+    try:
+        client = initialize_gemini_client()
+        
+        # Add the text prompt after the documents
+        parts = list(document_parts)
         parts.append(types.Part.from_text(text=prompt))
         
-        model = "gemini-2.5-pro"  # ✅ Better grounding support
         contents = [
             types.Content(
                 role="user",
@@ -118,7 +163,7 @@ def generate_from_gcs_files(gcs_file_uris: List[str], prompt, enable_grounding)
         generate_content_config = types.GenerateContentConfig(
             tools=tools,
             temperature=0.3,  # ✅ Lower temperature for factual responses
-            max_output_tokens=65535,
+            max_output_tokens=max_output_tokens,
             safety_settings=[
                 types.SafetySetting(
                     category="HARM_CATEGORY_HATE_SPEECH",
@@ -140,14 +185,17 @@ def generate_from_gcs_files(gcs_file_uris: List[str], prompt, enable_grounding)
             # ✅ Removed thinking_config - can interfere with grounding
         )
         
-        print("🚀 Making API call with grounding...")
+        print(f"🚀 Making API call to {model}...")
         
         # ✅ Use non-streaming generate_content for better grounding
+        started = time.perf_counter()
         response = client.models.generate_content(
             model=model,
             contents=contents,
             config=generate_content_config,
         )
+        if run:
+            run.record_model_call(model, response, time.perf_counter() - started, section)
         
         print(f"📄 Response generated: {len(response.text)} characters")
         
@@ -161,47 +209,68 @@ def generate_from_gcs_files(gcs_file_uris: List[str], prompt, enable_grounding)
         
     except Exception as e:
         print(f"❌ Error generating content: {e}")
-        logging.error(f"Error generating content from GCS files: {str(e)}")
+        logging.error(f"Error generating content from parts: {str(e)}")
         raise
 
+def generate_from_gcs_files(gcs_file_uris: List[str], prompt, enable_grounding, run=None, checkpoint=None,
+                            files: List[Dict[str, Any]] = None) -> str:
+    """Generate content from multiple GCS files with optional Google Search grounding"""
+    if checkpoint and checkpoint.generated_text():
+        # A previous run got this far before failing; skip the model call
+        return checkpoint.generated_text()
+    
+    parts = build_document_parts(gcs_file_uris, run=run, checkpoint=checkpoint, files=files)
+    with _stage(run, "generate"):
+        generated_content = generate_from_parts(parts, prompt, enable_grounding, run=run)
+    if checkpoint:
+        checkpoint.save_generated(generated_content)
+    return generated_content
 
+def _file_info(all_files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Summarize listed files for API responses"""
+    file_info = []
+    for file in all_files:
+        filename = file.get("name", "").split("/")[-1]
+        file_info.append({
+            "filename": filename,
+            "full_path": file["full_path"],
+            "size": file.get("size"),
+            "mime_type": file.get("detected_mime_type"),
+            "content_type": file.get("content_type")
+        })
+    return file_info
 
-def generate_from_path(relative_path: str, prompt, enable_grounding) -> Dict[str, Any]:
+def generate_from_path(relative_path: str, prompt, enable_grounding, run=None, checkpoint=None) -> Dict[str, Any]:
     """Generate content from all files in a GCS path with optional grounding"""
     try:
         # Get all files from the path
-        all_files = get_all_files_from_path(relative_path)
+        with _stage(run, "list_files"):
+            all_files = get_all_files_from_path(relative_path)
+        if run:
+            run.files_processed = len(all_files)
         
         if not all_files:
             return {
                 "status": "error",
                 "message": f"No files found in path: {relative_path}"
             }
+        if checkpoint:
+            checkpoint.begin(all_files)
         
         # Extract file URIs for generation
         file_uris = [file["full_path"] for file in all_files]
         
         # Generate content from all files with grounding
-        generated_content = generate_from_gcs_files(file_uris, prompt, enable_grounding)
-        
-        # Prepare file info for response
-        file_info = []
-        for file in all_files:
-            filename = file.get("name", "").split("/")[-1]
-            file_info.append({
-                "filename": filename,
-                "full_path": file["full_path"],
-                "size": file.get("size"),
-                "mime_type": file.get("detected_mime_type"),
-                "content_type": file.get("content_type")
-            })
+        generated_content = generate_from_gcs_files(
+            file_uris, prompt, enable_grounding, run=run, checkpoint=checkpoint, files=all_files
+        )
         
         return {
             "status": "success",
             "relative_path": relative_path,
             "full_path": f"gs://{BUCKET_NAME}/{relative_path}",
             "total_files_processed": len(all_files),
-            "files_processed": file_info,
+            "files_processed": _file_info(all_files),
             "prompt": prompt,
             "generated_content": generated_content,
             "grounding_enabled": enable_grounding
@@ -215,3 +284,76 @@ def generate_from_path(relative_path: str, prompt, enable_grounding) -> Dict[str
             "relative_path": relative_path
         }
 
+def generate_sections_from_path(relative_path: str, sections: Dict[str, Dict[str, Any]], run=None,
+                                checkpoint=None) -> Dict[str, Any]:
+    """Run one concurrent model call per section over the same document parts.
+    
+    `sections` maps a section name to {"prompt", "model", "max_output_tokens", "grounding"}.
+    A failing section is reported in its own entry and does not affect the others.
+    Sections already present in a resumed checkpoint are not generated again.
+    """
+    try:
+        with _stage(run, "list_files"):
+            all_files = get_all_files_from_path(relative_path)
+        if run:
+            run.files_processed = len(all_files)
+        
+        if not all_files:
+            return {
+                "status": "error",
+                "message": f"No files found in path: {relative_path}"
+            }
+        if checkpoint:
+            checkpoint.begin(all_files)
+        
+        results = {}
+        for name, section in sections.items():
+            text = checkpoint.generated_section(name) if checkpoint else None
+            if text:
+                results[name] = {"status": "success", "text": text, "model": section["model"], "seconds": 0.0, "resumed": True}
+        pending = {name: section for name, section in sections.items() if name not in results}
+        
+        # Download and extract once; every section reuses the same parts
+        parts = build_document_parts(
+            [file["full_path"] for file in all_files], run=run, checkpoint=checkpoint, files=all_files
+        ) if pending else []
+        
+        def run_section(name: str, section: Dict[str, Any]) -> Dict[str, Any]:
+            started = time.time()
+            try:
+                text = generate_from_parts(
+                    parts, section["prompt"], section.get("grounding", True),
+                    model=section["model"], max_output_tokens=section["max_output_tokens"],
+                    run=run, section=name
+                )
+                outcome = {"status": "success", "text": text}
+                if checkpoint:
+                    checkpoint.save_section(name, text)
+            except Exception as e:
+                outcome = {"status": "error", "message": str(e), "text": None}
+            outcome["model"] = section["model"]
+            outcome["seconds"] = round(time.time() - started, 3)
+            return outcome
+        
+        if pending:
+            with _stage(run, "generate"), ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="section") as executor:
+                futures = {name: executor.submit(run_section, name, section) for name, section in pending.items()}
+                results.update({name: future.result() for name, future in futures.items()})
+        results = {name: results[name] for name in sections}
+        
+        return {
+            "status": "success",
+            "relative_path": relative_path,
+            "full_path": f"gs://{BUCKET_NAME}/{relative_path}",
+            "total_files_processed": len(all_files),
+            "files_processed": _file_info(all_files),
+            "sections": results
+        }
+        
+    except Exception as e:
+        logging.error(f"Error generating sections from path {relative_path}: {str(e)}")
+        return {
+            "status": "error",
+            "message": f"Failed to generate content: {str(e)}",
+            "relative_path": relative_path
+        }
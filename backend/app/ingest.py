@@ -0,0 +1,231 @@
+from typing import Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from .config import (
+    INGEST_DEBOUNCE_SECONDS, INGEST_MAX_DELAY_SECONDS, INGEST_ANALYSIS_WORKERS,
+    INGEST_LOCAL_FEED_POLL_SECONDS, INGEST_EXECUTION_MODE
+)
+from .gcs_service import BUCKET_NAME
+import base64
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+# Objects are uploaded as L1/L2/<filename>; the analysis key is L1/L2
+OBJECT_NAME_RE = re.compile(r"^([^/]+/[^/]+)/[^/]+$")
+
+def gcs_key_for_object(object_name: str) -> Optional[str]:
+    """Return the L1/L2 analysis key for an uploaded object, or None if it is not a document upload"""
+    match = OBJECT_NAME_RE.match(object_name or "")
+    return match.group(1) if match else None
+
+def parse_notification(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Normalize a Pub/Sub push message or a bare GCS object resource to {bucket, name, event_type}"""
+    message = payload.get("message")
+    if isinstance(message, dict):
+        attributes = message.get("attributes") or {}
+        resource = {}
+        if message.get("data"):
+            try:
+                resource = json.loads(base64.b64decode(message["data"]))
+            except Exception as e:
+                logging.warning(f"Could not decode notification data: {e}")
+        return {
+            "bucket": attributes.get("bucketId") or resource.get("bucket"),
+            "name": attributes.get("objectId") or resource.get("name"),
+            "event_type": attributes.get("eventType", "OBJECT_FINALIZE")
+        }
+
+    if payload.get("name"):
+        return {
+            "bucket": payload.get("bucket"),
+            "name": payload["name"],
+            "event_type": payload.get("event_type", "OBJECT_FINALIZE")
+        }
+    return None
+
+class UploadDebouncer:
+    """Coalesces bursts of uploads per L1/L2 prefix into one background analysis"""
+
+    def __init__(self, debounce_seconds: float = INGEST_DEBOUNCE_SECONDS,
+                 max_delay_seconds: float = INGEST_MAX_DELAY_SECONDS,
+                 workers: int = INGEST_ANALYSIS_WORKERS):
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._lock = threading.Lock()
+        self._prefixes: Dict[str, Dict[str, Any]] = {}
+
+    def record_upload(self, object_name: str) -> Optional[str]:
+        """Record an uploaded object and (re)arm the debounce timer for its prefix"""
+        gcs_key = gcs_key_for_object(object_name)
+        if not gcs_key:
+            return None
+
+        now = time.time()
+        with self._lock:
+            state = self._prefixes.setdefault(gcs_key, {
+                "gcs_key": gcs_key,
+                "status": "idle",
+                "upload_count": 0,
+                "pending_uploads": 0,
+                "last_upload": None,
+                "first_pending_at": None,
+                "last_upload_at": None,
+                "last_run_started_at": None,
+                "last_run_finished_at": None,
+                "last_error": None,
+                "timer": None,
+                "rerun": False
+            })
+            state["upload_count"] += 1
+            state["pending_uploads"] += 1
+            state["last_upload"] = object_name
+            state["last_upload_at"] = now
+
+            if state["status"] in ("queued", "running"):
+                # New files arrived after the analysis was handed to a worker; analyze again once it finishes
+                state["rerun"] = True
+                return gcs_key
+
+            if state["first_pending_at"] is None:
+                state["first_pending_at"] = now
+            if state["timer"]:
+                state["timer"].cancel()
+
+            delay = min(self.debounce_seconds, state["first_pending_at"] + self.max_delay_seconds - now)
+            state["status"] = "pending"
+            state["timer"] = threading.Timer(max(delay, 0), self._fire, args=(gcs_key,))
+            state["timer"].daemon = True
+            state["timer"].start()
+        return gcs_key
+
+    def _fire(self, gcs_key: str) -> None:
+        with self._lock:
+            state = self._prefixes[gcs_key]
+            state["timer"] = None
+            state["status"] = "queued"
+        self._executor.submit(self._analyze, gcs_key)
+
+    def _analyze(self, gcs_key: str) -> None:
+        from .controller import generate_content_from_path
+
+        with self._lock:
+            state = self._prefixes[gcs_key]
+            state["status"] = "running"
+            state["first_pending_at"] = None
+            state["pending_uploads"] = 0
+            state["last_run_started_at"] = time.time()
+
+        error = None
+        try:
+            result = generate_content_from_path(gcs_key, execution=INGEST_EXECUTION_MODE)
+            if result.get("status") != "success":
+                error = result.get("message", "Analysis failed")
+        except Exception as e:
+            error = str(e)
+
+        if error:
+            logging.error(f"Pre-analysis failed for {gcs_key}: {error}")
+        else:
+            logging.info(f"Pre-analysis finished for {gcs_key}")
+
+        with self._lock:
+            state["status"] = "error" if error else "done"
+            state["last_error"] = error
+            state["last_run_finished_at"] = time.time()
+            rerun, state["rerun"] = state["rerun"], False
+            if rerun:
+                state["first_pending_at"] = time.time()
+                state["status"] = "pending"
+                state["timer"] = threading.Timer(self.debounce_seconds, self._fire, args=(gcs_key,))
+                state["timer"].daemon = True
+                state["timer"].start()
+
+    def get_status(self, gcs_key: str = None) -> List[Dict[str, Any]]:
+        """Return the ingestion state of one prefix, or of all known prefixes"""
+        with self._lock:
+            if gcs_key:
+                states = [self._prefixes[gcs_key]] if gcs_key in self._prefixes else []
+            else:
+                states = list(self._prefixes.values())
+            
+            statuses = []
+            for state in states:
+                statuses.append({k: v for k, v in state.items() if k != "timer"})
+            return statuses
+
+class LocalNotificationFeed:
+    """Stand-in for bucket notifications: polls a local directory laid out like the bucket"""
+
+    def __init__(self, root_dir: str, debouncer: "UploadDebouncer",
+                 poll_seconds: float = INGEST_LOCAL_FEED_POLL_SECONDS):
+        self.root_dir = root_dir
+        self.debouncer = debouncer
+        self.poll_seconds = poll_seconds
+        self._seen: Dict[str, float] = {}
+
+    def _mtimes(self) -> Dict[str, float]:
+        mtimes = {}
+        for dirpath, _, filenames in os.walk(self.root_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                mtimes[path] = os.path.getmtime(path)
+        return mtimes
+
+    def seed(self) -> None:
+        """Treat the files already present as seen, so only later uploads trigger analysis"""
+        self._seen = self._mtimes()
+
+    def poll_once(self) -> List[str]:
+        """Emit an upload for every new or modified file since the last poll"""
+        emitted = []
+        for path, mtime in self._mtimes().items():
+            if self._seen.get(path) == mtime:
+                continue
+            self._seen[path] = mtime
+            object_name = os.path.relpath(path, self.root_dir).replace(os.sep, "/")
+            if self.debouncer.record_upload(object_name):
+                emitted.append(object_name)
+        return emitted
+
+    def start(self) -> threading.Thread:
+        def loop():
+            try:
+                self.seed()
+            except Exception as e:
+                logging.error(f"Local notification feed could not list {self.root_dir}: {e}")
+            while True:
+                try:
+                    self.poll_once()
+                except Exception as e:
+                    logging.error(f"Local notification feed failed: {e}")
+                time.sleep(self.poll_seconds)
+
+        thread = threading.Thread(target=loop, name="local-notification-feed", daemon=True)
+        thread.start()
+        return thread
+
+upload_debouncer = UploadDebouncer()
+
+def handle_notification(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Record an upload notification; analysis starts once the prefix has been quiet"""
+    event = parse_notification(payload)
+    if not event or not event["name"]:
+        return {"status": "ignored", "reason": "Unrecognized notification payload"}
+    if event["bucket"] and event["bucket"] != BUCKET_NAME:
+        return {"status": "ignored", "reason": f"Unexpected bucket: {event['bucket']}"}
+    if event["event_type"] != "OBJECT_FINALIZE":
+        return {"status": "ignored", "reason": f"Event type {event['event_type']} does not trigger analysis"}
+
+    gcs_key = upload_debouncer.record_upload(event["name"])
+    if not gcs_key:
+        return {"status": "ignored", "reason": f"Object is not under an L1/L2 prefix: {event['name']}"}
+
+    return {
+        "status": "accepted",
+        "gcs_key": gcs_key,
+        "object": event["name"]
+    }
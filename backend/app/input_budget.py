@@ -0,0 +1,130 @@
+from typing import Any, Dict, List, Optional, Tuple
+from .chat_context import estimate_tokens
+from .config import INPUT_TOKEN_BUDGET, INPUT_MIN_TRUNCATED_TOKENS
+
+# Rough Gemini input costs for parts sent by URI (see the Vertex AI token docs):
+# images are billed per 768x768 tile, PDFs per page, audio and video per second
+TOKENS_PER_IMAGE_TILE = 258
+IMAGE_BYTES_PER_TILE = 250_000
+MAX_IMAGE_TILES = 8
+TOKENS_PER_PDF_PAGE = 258
+PDF_BYTES_PER_PAGE = 100_000
+AUDIO_TOKENS_PER_SECOND = 32
+AUDIO_BYTES_PER_SECOND = 16_000
+VIDEO_TOKENS_PER_SECOND = 300
+VIDEO_BYTES_PER_SECOND = 250_000
+
+# Filename keywords -> relevance bonus; the highest matching bonus counts
+RELEVANCE_KEYWORDS = [
+    (("deck", "pitch", "presentation"), 100),
+    (("financial", "p&l", "pnl", "projection", "forecast", "model", "cap table", "captable",
+      "revenue", "balance sheet", "cash flow", "cashflow", "valuation"), 90),
+    (("memo", "summary", "overview", "business plan", "one pager", "onepager", "executive",
+      "traction", "metrics", "kpi"), 80),
+    (("founder", "team", "bio", "market", "competit"), 60),
+]
+
+# MIME family -> base relevance; documents outrank media
+KIND_RELEVANCE = {"document": 50, "spreadsheet": 50, "text": 40, "image": 0, "audio": 0, "video": 0, "other": 10}
+
+def _kind(mime_type: str) -> str:
+    if mime_type.startswith("image/"):
+        return "image"
+    if mime_type.startswith("audio/"):
+        return "audio"
+    if mime_type.startswith("video/"):
+        return "video"
+    if "spreadsheet" in mime_type or mime_type in ("text/csv", "application/vnd.ms-excel"):
+        return "spreadsheet"
+    if mime_type.startswith("text/"):
+        return "text"
+    if mime_type == "application/pdf" or "document" in mime_type or "presentation" in mime_type:
+        return "document"
+    return "other"
+
+def estimate_part_tokens(mime_type: str, size: Optional[int], text: str = None) -> int:
+    """Estimate a part's input tokens from its extracted text, or from MIME type and size"""
+    if text is not None:
+        return estimate_tokens(text)
+    size = size or 0
+    kind = _kind(mime_type)
+    if kind == "image":
+        return TOKENS_PER_IMAGE_TILE * min(size // IMAGE_BYTES_PER_TILE + 1, MAX_IMAGE_TILES)
+    if kind == "audio":
+        return AUDIO_TOKENS_PER_SECOND * (size // AUDIO_BYTES_PER_SECOND + 1)
+    if kind == "video":
+        return VIDEO_TOKENS_PER_SECOND * (size // VIDEO_BYTES_PER_SECOND + 1)
+    if mime_type == "application/pdf":
+        return TOKENS_PER_PDF_PAGE * (size // PDF_BYTES_PER_PAGE + 1)
+    return size // 4 + 1
+
+def relevance_score(filename: str, mime_type: str) -> int:
+    """Score a document for inclusion; pitch decks and financials first, photos and media last"""
+    name = filename.lower().replace("_", " ").replace("-", " ")
+    bonus = max((score for keywords, score in RELEVANCE_KEYWORDS if any(k in name for k in keywords)), default=0)
+    return KIND_RELEVANCE[_kind(mime_type)] + bonus
+
+def drop_duplicates(gcs_file_uris: List[str], files_by_uri: Dict[str, Dict[str, Any]]) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Keep the first of each set of files with the same MD5; returns (kept uris, excluded entries)"""
+    kept, excluded, seen = [], [], {}
+    for uri in gcs_file_uris:
+        md5 = (files_by_uri.get(uri) or {}).get("md5_hash")
+        if md5 and md5 in seen:
+            excluded.append({"file": uri.split("/")[-1], "reason": "duplicate", "duplicate_of": seen[md5].split("/")[-1]})
+            continue
+        if md5:
+            seen[md5] = uri
+        kept.append(uri)
+    return kept, excluded
+
+def plan_input(gcs_file_uris: List[str], mime_types: Dict[str, str], extracted_texts: Dict[str, str],
+               files_by_uri: Dict[str, Dict[str, Any]], token_budget: int = INPUT_TOKEN_BUDGET
+               ) -> Tuple[List[str], Dict[str, str], Dict[str, Any]]:
+    """Rank documents and fit them under token_budget.
+
+    Returns (uris to send in order, texts to send for extracted files, plan report).
+    Documents are added most relevant first; a text document that no longer fits is
+    trimmed if at least INPUT_MIN_TRUNCATED_TOKENS remain, anything else that does not
+    fit is excluded. A budget of 0 keeps every document in its original order.
+    """
+    candidates = []
+    for position, uri in enumerate(gcs_file_uris):
+        filename = uri.split("/")[-1]
+        text = extracted_texts.get(uri)
+        candidates.append({
+            "uri": uri,
+            "file": filename,
+            "mime_type": mime_types[uri],
+            "estimated_tokens": estimate_part_tokens(mime_types[uri], (files_by_uri.get(uri) or {}).get("size"), text),
+            "score": relevance_score(filename, mime_types[uri]),
+            "position": position,
+        })
+    if token_budget > 0:
+        candidates.sort(key=lambda c: (-c["score"], c["position"]))
+
+    uris, texts, included, excluded = [], {}, [], []
+    remaining = token_budget
+    for candidate in candidates:
+        uri, tokens = candidate.pop("uri"), candidate["estimated_tokens"]
+        candidate.pop("position")
+        text = extracted_texts.get(uri)
+        if token_budget > 0 and tokens > remaining:
+            if text is None or remaining < INPUT_MIN_TRUNCATED_TOKENS:
+                excluded.append(dict(candidate, reason="over_budget"))
+                continue
+            text = text[:remaining * 4] + "\n[truncated to fit the input token budget]"
+            candidate.update(estimated_tokens=remaining, truncated=True, original_tokens=tokens)
+            tokens = remaining
+        uris.append(uri)
+        if text is not None:
+            texts[uri] = text
+        included.append(candidate)
+        remaining -= tokens
+
+    plan = {
+        "budget_tokens": token_budget,
+        "estimated_tokens": sum(entry["estimated_tokens"] for entry in included),
+        "included": included,
+        "excluded": excluded,
+    }
+    return uris, texts, plan
@@ -1,9 +1,44 @@
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi import Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from .bulkheads import BulkheadFull, db_bulkhead
+from .config import (
+    WARMUP_ON_STARTUP, CONVERSATION_MAINTENANCE_INTERVAL_SECONDS, INGEST_LOCAL_FEED_DIR, WORKER_INIT_HOOKS
+)
+from .db import dispose_engine
+from .ingest import LocalNotificationFeed, upload_debouncer
+from .partitions import start_partition_maintenance
 from .router import router
+from .scheduler import SchedulingMiddleware, TenantQuotaExceeded
+from .serve import log_config
+from .warmup import get_warmup_state, mark_draining, ping_database, run_worker_init_hooks, start_background_warmup
+from uvicorn.config import LOGGING_CONFIG
 import uvicorn
 
-app = FastAPI(title="My API", version="1.0.0")
+IMPORT_SECONDS = round(time.perf_counter() - _IMPORT_STARTED, 4)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs once per worker process
+    run_worker_init_hooks(WORKER_INIT_HOOKS)
+    if WARMUP_ON_STARTUP:
+        start_background_warmup()
+    if CONVERSATION_MAINTENANCE_INTERVAL_SECONDS > 0:
+        start_partition_maintenance()
+    if INGEST_LOCAL_FEED_DIR:
+        LocalNotificationFeed(INGEST_LOCAL_FEED_DIR, upload_debouncer).start()
+    yield
+    # In-flight requests have finished (or the graceful shutdown timeout expired)
+    mark_draining()
+    dispose_engine()
+
+app = FastAPI(title="My API", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -14,19 +49,60 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Tag each request with its priority class and tenant for the bulkhead schedulers
+app.add_middleware(SchedulingMiddleware)
+
+@app.exception_handler(BulkheadFull)
+async def bulkhead_full_handler(request: Request, exc: BulkheadFull):
+    # Fail fast instead of queueing behind a saturated I/O class
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": "1"},
+        content={"status": "error", "message": str(exc), "bulkhead": exc.name}
+    )
+
+@app.exception_handler(TenantQuotaExceeded)
+async def tenant_quota_handler(request: Request, exc: TenantQuotaExceeded):
+    # One tenant's burst must not take capacity from the others
+    return JSONResponse(
+        status_code=429,
+        headers={"Retry-After": "2"},
+        content={"status": "error", "message": str(exc), "tenant": exc.tenant, "class": exc.request_class}
+    )
+
 # Include router
 app.include_router(router, prefix="/genaiexchange", tags=["api"])
 
+@app.get("/healthz", tags=["health"])
+async def liveness():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/readyz", tags=["health"])
+async def readiness():
+    """Readiness probe: the database is reachable and the worker is not shutting down"""
+    if get_warmup_state()["draining"]:
+        return JSONResponse(status_code=503, content={"status": "draining"})
+    try:
+        await db_bulkhead.run(ping_database)
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "not_ready", "message": f"Database unavailable: {str(e)}"}
+        )
+
+    return {
+        "status": "ready",
+        "import_seconds": IMPORT_SECONDS,
+        "warmup": get_warmup_state()
+    }
+
 def configure_logging():
-    # Configure default logging format with timestamp
-    LOGGING_CONFIG["formatters"]["default"]["fmt"] = "%(asctime)s [%(name)s] %(levelprefix)s %(message)s"
-    LOGGING_CONFIG["formatters"]["default"]["datefmt"] = "%Y-%m-%d %H:%M:%S"
-    
-    # Configure access log format with timestamp
-    LOGGING_CONFIG["formatters"]["access"]["fmt"] = '%(asctime)s %(levelprefix)s %(client_addr)s - "%(request_line)s" %(status_code)s'
-    LOGGING_CONFIG["formatters"]["access"]["datefmt"] = "%Y-%m-%d %H:%M:%S"
+    # Timestamped default and access log formats (same as the production launcher)
+    LOGGING_CONFIG.update(log_config())
 
 if __name__ == "__main__":
+    # Single-process development server; use `python -m app.serve` in production
     configure_logging()
     
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -34,4 +110,4 @@ if __name__ == "__main__":
 # uvicorn app.main:app --reload --host 0.0.0.0 --port 8000
 # netstat -tulpn | grep :8000
 # kill -9 xxx
-# conda activate fastapi_env
\ No newline at end of file
+# conda activate fastapi_env
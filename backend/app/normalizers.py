@@ -0,0 +1,195 @@
+from typing import Any, Dict, List, Optional, Tuple
+from .config import CURRENCY_TO_USD, DEFAULT_CURRENCY
+import re
+
+# extracted_data field -> metric kind
+METRIC_KINDS = {
+    "valuation": "money", "revenue": "money", "arr": "money", "profit": "money", "tam": "money",
+    "liabilities": "money", "cac": "money", "burn_rate": "money", "cash_reserve": "money",
+    "fixed_assets": "money", "raw_materials_cost": "money", "inventory_cost": "money",
+    "marketing_cost": "money", "operations_cost": "money",
+    "number_of_employees": "count", "funding_rounds": "count",
+    "runway": "duration", "total_runway": "duration",
+    "risk_gauge": "score",
+}
+
+# Metrics copied into indexed analysis_results columns for range queries and sorts
+NUMERIC_COLUMNS = {
+    "valuation": "valuation_usd",
+    "revenue": "revenue_usd",
+    "arr": "arr_usd",
+    "tam": "tam_usd",
+    "burn_rate": "burn_rate_usd",
+    "cash_reserve": "cash_reserve_usd",
+    "runway": "runway_months",
+    "number_of_employees": "employees",
+    "risk_gauge": "risk_gauge",
+}
+
+# The other dollars are listed first and a bare "$" only counts when no letter precedes it
+CURRENCY_PATTERNS = [
+    (re.compile(r"\bS\$|SGD\b", re.I), "SGD"),
+    (re.compile(r"\bA\$|AUD\b", re.I), "AUD"),
+    (re.compile(r"\bC\$|\bCA\$|CAD\b", re.I), "CAD"),
+    (re.compile(r"\bHK\$|HKD\b", re.I), "HKD"),
+    (re.compile(r"\bNZ\$|NZD\b", re.I), "NZD"),
+    (re.compile(r"US\$|USD|(?<![A-Z])\$", re.I), "USD"),
+    (re.compile(r"€|EUR\b|euros?\b", re.I), "EUR"),
+    (re.compile(r"£|GBP\b", re.I), "GBP"),
+    (re.compile(r"₹|INR\b|\bRs\.?|rupees?\b", re.I), "INR"),
+    (re.compile(r"¥|JPY\b|yen\b", re.I), "JPY"),
+    (re.compile(r"CNY\b|RMB\b|yuan\b", re.I), "CNY"),
+]
+
+MULTIPLIERS = {
+    "k": 1e3, "thousand": 1e3,
+    "lakh": 1e5, "lakhs": 1e5, "lac": 1e5, "lacs": 1e5,
+    "m": 1e6, "mm": 1e6, "mn": 1e6, "mio": 1e6, "mil": 1e6, "mln": 1e6, "million": 1e6, "millions": 1e6,
+    "cr": 1e7, "crore": 1e7, "crores": 1e7,
+    "b": 1e9, "bn": 1e9, "billion": 1e9, "billions": 1e9,
+    "t": 1e12, "tn": 1e12, "trillion": 1e12,
+}
+
+# A number with an optional scale word, e.g. "1.2B", "450", "3,500 crore"
+NUMBER_RE = re.compile(
+    r"(\d[\d,]*(?:\.\d+)?)\s*(" + "|".join(sorted(MULTIPLIERS, key=len, reverse=True)) + r")?(?![a-z])",
+    re.I
+)
+RANGE_JOIN_RE = re.compile(r"^\s*(?:-|–|—|to)\s*[^\d]{0,4}$", re.I)
+
+DURATION_UNITS = [
+    (re.compile(r"\byears?\b|\byrs?\b", re.I), 12.0),
+    (re.compile(r"\bweeks?\b|\bwks?\b", re.I), 12 / 52),
+    (re.compile(r"\bdays?\b", re.I), 12 / 365),
+    (re.compile(r"\bmonths?\b|\bmos?\b", re.I), 1.0),
+]
+YEARLY_RE = re.compile(r"per\s+(?:year|annum)|/\s*(?:yr|year)|annual(?:ly)?|\bp\.?a\.?\b", re.I)
+MONTHLY_RE = re.compile(r"per\s+month|/\s*(?:mo|month)|monthly", re.I)
+NEGATIVE_RE = re.compile(r"^\s*[-−(]|\bloss\b|\bnegative\b", re.I)
+SCORE_SCALE_RE = re.compile(r"(?:/|out\s+of)\s*(\d+(?:\.\d+)?)", re.I)
+
+def _numbers(text: str) -> List[Tuple[float, Optional[float], int, int]]:
+    """(number, multiplier or None, start, end) for each number in the text"""
+    found = []
+    for match in NUMBER_RE.finditer(text):
+        number = float(match.group(1).replace(",", ""))
+        scale = MULTIPLIERS[match.group(2).lower()] if match.group(2) else None
+        found.append((number, scale, match.start(), match.end()))
+    return found
+
+def _is_year(number: Tuple[float, Optional[float], int, int]) -> bool:
+    value, scale, start, end = number
+    return scale is None and end - start == 4 and 1900 <= value <= 2100
+
+def _quantity_span(text: str) -> Optional[Tuple[Dict[str, Any], int, int]]:
+    """The first number (or the midpoint of a leading range) with its scale applied, and where it sits"""
+    numbers = _numbers(text)
+    # "FY2023: $5M" - skip bare years when another number follows
+    while len(numbers) > 1 and _is_year(numbers[0]):
+        numbers = numbers[1:]
+    if not numbers:
+        return None
+    number, scale, start, end = numbers[0]
+    # "10-15M" or "$10M to $15M": the range shares the second number's scale
+    if len(numbers) > 1 and RANGE_JOIN_RE.match(text[end:numbers[1][2]]):
+        high, high_scale, _, high_end = numbers[1]
+        scale = scale or high_scale
+        low, high = number * (scale or 1), high * (high_scale or scale or 1)
+        return {"value": (low + high) / 2, "low": low, "high": high}, start, high_end
+    return {"value": number * (scale or 1)}, start, end
+
+def _first_quantity(text: str) -> Optional[Dict[str, Any]]:
+    """The first number (or the midpoint of a leading range), with its scale applied"""
+    span = _quantity_span(text)
+    return span[0] if span else None
+
+def _currency_near(text: str, start: int, end: int) -> Optional[str]:
+    """The currency written closest to text[start:end]; a prefix wins a tie with a suffix"""
+    best = None
+    for pattern, code in CURRENCY_PATTERNS:
+        for match in pattern.finditer(text):
+            if match.end() <= start:
+                distance = (start - match.end(), 0)
+            elif match.start() >= end:
+                distance = (match.start() - end, 1)
+            else:
+                distance = (0, 0)
+            if best is None or distance < best[0]:
+                best = (distance, code)
+    return best[1] if best else None
+
+def _parse_money(text: str) -> Optional[Dict[str, Any]]:
+    span = _quantity_span(text)
+    if span is None:
+        return None
+    # "INR 50 crore (approx. $6M)" is in INR: take the currency attached to the parsed number
+    quantity, start, end = span
+    currency = _currency_near(text, start, end)
+    result = dict(quantity, unit=currency or DEFAULT_CURRENCY, currency_assumed=currency is None)
+    if NEGATIVE_RE.search(text):
+        for key in ("value", "low", "high"):
+            if key in result:
+                result[key] = -abs(result[key])
+    if YEARLY_RE.search(text):
+        result["period"] = "year"
+    elif MONTHLY_RE.search(text):
+        result["period"] = "month"
+    rate = CURRENCY_TO_USD.get(result["unit"])
+    result["value_usd"] = result["value"] * rate if rate is not None else None
+    return result
+
+def _parse_count(text: str) -> Optional[Dict[str, Any]]:
+    quantity = _first_quantity(text)
+    return dict(quantity, unit="count") if quantity else None
+
+def _parse_duration(text: str) -> Optional[Dict[str, Any]]:
+    quantity = _first_quantity(text)
+    if quantity is None:
+        return None
+    # Runway is asked for in months, so a bare number is taken as months
+    factor = next((factor for pattern, factor in DURATION_UNITS if pattern.search(text)), 1.0)
+    result = {key: value * factor for key, value in quantity.items()}
+    result["unit"] = "months"
+    return result
+
+def _parse_score(text: str) -> Optional[Dict[str, Any]]:
+    numbers = _numbers(text)
+    if not numbers:
+        return None
+    scale = SCORE_SCALE_RE.search(text)
+    return {"value": numbers[0][0], "unit": "score", "scale": float(scale.group(1)) if scale else 5.0}
+
+PARSERS = {"money": _parse_money, "count": _parse_count, "duration": _parse_duration, "score": _parse_score}
+
+def normalize_metric(field: str, text: Any) -> Optional[Dict[str, Any]]:
+    """Parse one extracted field into {"kind", "value", "unit", ...}, or None if it has no number"""
+    kind = METRIC_KINDS.get(field)
+    if kind is None or text is None:
+        return None
+    text = str(text).strip()
+    if not text or text.lower() == "not specified":
+        return None
+    parsed = PARSERS[kind](text)
+    return dict(parsed, kind=kind, raw=text) if parsed else None
+
+def normalize_metrics(extracted_data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Typed values for every numeric field in extracted_data that could be parsed"""
+    normalized = {}
+    for field in METRIC_KINDS:
+        metric = normalize_metric(field, (extracted_data or {}).get(field))
+        if metric:
+            normalized[field] = metric
+    return normalized
+
+def numeric_columns(normalized: Dict[str, Dict[str, Any]]) -> Dict[str, Optional[float]]:
+    """Values for the indexed analysis_results columns (money in USD, burn rate per month)"""
+    columns = {}
+    for field, column in NUMERIC_COLUMNS.items():
+        metric = normalized.get(field)
+        value = None
+        if metric:
+            value = metric["value_usd"] if metric["kind"] == "money" else metric["value"]
+            if field == "burn_rate" and value is not None and metric.get("period") == "year":
+                value = value / 12
+        columns[column] = value
+    return columns
@@ -0,0 +1,251 @@
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, timezone
+from sqlalchemy import text
+from .config import (
+    CONVERSATION_PARTITION_MONTHS_AHEAD, CONVERSATION_RETENTION_MONTHS,
+    CONVERSATION_ARCHIVE_PATH, CONVERSATION_MAINTENANCE_INTERVAL_SECONDS
+)
+from .db import get_engine
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+PARTITION_NAME_RE = re.compile(r"^conversations_p(\d{4})(\d{2})$")
+LEGACY_TABLE = "conversations_unpartitioned"
+
+# Arbitrary constant so only one worker runs maintenance at a time
+MAINTENANCE_LOCK_ID = 7_301_028
+
+def _add_months(year: int, month: int, months: int) -> Tuple[int, int]:
+    index = year * 12 + (month - 1) + months
+    return index // 12, index % 12 + 1
+
+def _partition_name(year: int, month: int) -> str:
+    return f"conversations_p{year:04d}{month:02d}"
+
+def _month_start(year: int, month: int) -> str:
+    return f"{year:04d}-{month:02d}-01 00:00:00+00"
+
+def _create_partition(conn, year: int, month: int) -> bool:
+    """Create the monthly partition if missing; returns False if it could not be created"""
+    next_year, next_month = _add_months(year, month, 1)
+    try:
+        with conn.begin_nested():
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {_partition_name(year, month)}
+                PARTITION OF conversations
+                FOR VALUES FROM ('{_month_start(year, month)}') TO ('{_month_start(next_year, next_month)}')
+            """))
+        return True
+    except Exception as e:
+        # Typically rows for this month already landed in the default partition
+        logging.error(f"Could not create partition {_partition_name(year, month)}: {e}")
+        return False
+
+def ensure_conversation_partitions(conn, months_ahead: int = CONVERSATION_PARTITION_MONTHS_AHEAD,
+                                   since: Optional[datetime] = None) -> List[str]:
+    """Create monthly partitions from `since` (default: this month) through `months_ahead` months ahead"""
+    now = datetime.now(timezone.utc)
+    start = since.astimezone(timezone.utc) if since else now
+    year, month = start.year, start.month
+    last_year, last_month = _add_months(now.year, now.month, months_ahead)
+
+    created = []
+    while (year, month) <= (last_year, last_month):
+        if _create_partition(conn, year, month):
+            created.append(_partition_name(year, month))
+        year, month = _add_months(year, month, 1)
+    return created
+
+def rename_unpartitioned_conversations(conn) -> Optional[str]:
+    """Move a pre-partitioning conversations table aside so the partitioned one can be created"""
+    relkind = conn.execute(text("""
+        SELECT c.relkind
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = 'conversations' AND n.nspname = current_schema()
+    """)).scalar()
+    if relkind != "r":
+        return None
+
+    logging.info("Migrating unpartitioned conversations table")
+    conn.execute(text(f"ALTER TABLE conversations RENAME TO {LEGACY_TABLE}"))
+    conn.execute(text(f"ALTER SEQUENCE IF EXISTS conversations_id_seq RENAME TO {LEGACY_TABLE}_id_seq"))
+    conn.execute(text(f"ALTER INDEX IF EXISTS conversations_pkey RENAME TO {LEGACY_TABLE}_pkey"))
+    return LEGACY_TABLE
+
+def copy_unpartitioned_conversations(conn, legacy_table: str) -> int:
+    """Copy rows from the renamed legacy table into the partitioned conversations table"""
+    oldest = conn.execute(text(f"SELECT MIN(created_at) FROM {legacy_table}")).scalar()
+    if oldest is None:
+        return 0
+
+    ensure_conversation_partitions(conn, since=oldest)
+    copied = conn.execute(text(f"""
+        INSERT INTO conversations (id, session_id, startup_name, gcs_key, user_message, model_response,
+                                   user_meta, model_meta, created_at)
+        SELECT id, session_id, startup_name, gcs_key, user_message, model_response,
+               user_meta, model_meta, created_at
+        FROM {legacy_table}
+    """)).rowcount
+    conn.execute(text("""
+        SELECT setval(pg_get_serial_sequence('conversations', 'id'),
+                      GREATEST((SELECT MAX(id) FROM conversations), 1))
+    """))
+    logging.info(f"Copied {copied} conversations into partitions; {legacy_table} can be dropped once verified")
+    return copied
+
+def list_conversation_partitions(conn) -> List[Tuple[str, int, int]]:
+    """Return (name, year, month) for each monthly partition, oldest first"""
+    names = conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'conversations'
+    """)).scalars().all()
+
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            partitions.append((name, int(match.group(1)), int(match.group(2))))
+    return sorted(partitions, key=lambda p: (p[1], p[2]))
+
+def _archive_partition(partition: str, archive_path: str) -> str:
+    """Stream a partition's rows to a gzip-compressed NDJSON file and return its location"""
+    filename = f"{partition}.ndjson.gz"
+    is_gcs = archive_path.startswith("gs://")
+    if is_gcs:
+        fd, local_path = tempfile.mkstemp(suffix=".ndjson.gz")
+        os.close(fd)
+    else:
+        os.makedirs(archive_path, exist_ok=True)
+        local_path = os.path.join(archive_path, filename)
+
+    try:
+        with get_engine().connect() as conn, gzip.open(local_path, "wt", encoding="utf-8") as out:
+            rows = conn.execution_options(stream_results=True, yield_per=1000).execute(text(f"""
+                SELECT id, session_id, startup_name, gcs_key, user_message, model_response,
+                       user_meta, model_meta, created_at
+                FROM {partition}
+                ORDER BY created_at, id
+            """)).mappings()
+            for row in rows:
+                out.write(json.dumps(dict(row), default=str) + "\n")
+
+        if not is_gcs:
+            return local_path
+
+        from .gcs_service import get_storage_client
+        bucket_name, _, prefix = archive_path[len("gs://"):].partition("/")
+        blob_name = f"{prefix.rstrip('/')}/{filename}" if prefix else filename
+        get_storage_client().bucket(bucket_name).blob(blob_name).upload_from_filename(local_path)
+        return f"gs://{bucket_name}/{blob_name}"
+    finally:
+        if is_gcs and os.path.exists(local_path):
+            os.remove(local_path)
+
+def _drop_partition(conn, name: str) -> int:
+    """Detach and drop a partition and bring chat_sessions back in line with the rows that remain.
+
+    Sessions with rows in the partition are recounted from what is left in conversations;
+    sessions with nothing left are deleted. Returns the number of sessions touched.
+    """
+    conn.execute(text(f"""
+        CREATE TEMP TABLE expired_sessions ON COMMIT DROP AS
+        SELECT DISTINCT session_id, COALESCE(startup_name, '') AS startup_name
+        FROM {name}
+    """))
+    conn.execute(text(f"ALTER TABLE conversations DETACH PARTITION {name}"))
+    conn.execute(text(f"DROP TABLE {name}"))
+    conn.execute(text("""
+        UPDATE chat_sessions s
+        SET first_chat = remaining.first_chat, message_count = remaining.message_count
+        FROM (
+            SELECT e.session_id, e.startup_name, MIN(c.created_at) AS first_chat, COUNT(*) AS message_count
+            FROM expired_sessions e
+            JOIN conversations c
+              ON c.session_id = e.session_id AND COALESCE(c.startup_name, '') = e.startup_name
+            GROUP BY e.session_id, e.startup_name
+        ) remaining
+        WHERE s.session_id = remaining.session_id::text AND s.startup_name = remaining.startup_name
+    """))
+    conn.execute(text("""
+        DELETE FROM chat_sessions s
+        USING expired_sessions e
+        WHERE s.session_id = e.session_id::text AND s.startup_name = e.startup_name
+          AND NOT EXISTS (
+              SELECT 1 FROM conversations c
+              WHERE c.session_id = e.session_id AND COALESCE(c.startup_name, '') = e.startup_name
+          )
+    """))
+    return conn.execute(text("SELECT COUNT(*) FROM expired_sessions")).scalar()
+
+def apply_conversation_retention(retention_months: int = CONVERSATION_RETENTION_MONTHS,
+                                 archive_path: str = CONVERSATION_ARCHIVE_PATH) -> List[Dict[str, Any]]:
+    """Archive, detach and drop monthly partitions older than the retention window"""
+    if retention_months <= 0:
+        return []
+
+    now = datetime.now(timezone.utc)
+    cutoff = _add_months(now.year, now.month, -retention_months)
+
+    with get_engine().connect() as conn:
+        expired = [p for p in list_conversation_partitions(conn) if (p[1], p[2]) < cutoff]
+
+    archived = []
+    for name, year, month in expired:
+        try:
+            location = _archive_partition(name, archive_path)
+            # chat_sessions is adjusted in the same transaction as the drop
+            with get_engine().begin() as conn:
+                sessions = _drop_partition(conn, name)
+            archived.append({"partition": name, "archive": location, "sessions_updated": sessions})
+            logging.info(f"Archived conversations partition {name} to {location}")
+        except Exception as e:
+            logging.error(f"Failed to archive conversations partition {name}: {e}")
+    return archived
+
+def run_conversation_maintenance() -> Dict[str, Any]:
+    """Pre-create upcoming partitions and apply retention, once across all workers"""
+    with get_engine().connect() as lock_conn:
+        acquired = lock_conn.execute(
+            text("SELECT pg_try_advisory_lock(:id)"), {"id": MAINTENANCE_LOCK_ID}
+        ).scalar()
+        lock_conn.commit()
+        if not acquired:
+            return {"status": "skipped", "message": "Maintenance already running in another worker"}
+
+        try:
+            with get_engine().begin() as conn:
+                created = ensure_conversation_partitions(conn)
+            archived = apply_conversation_retention()
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MAINTENANCE_LOCK_ID})
+            lock_conn.commit()
+
+    return {
+        "status": "success",
+        "partitions": created,
+        "archived": archived
+    }
+
+def start_partition_maintenance() -> threading.Thread:
+    """Run run_conversation_maintenance periodically in a daemon thread"""
+    def loop():
+        while True:
+            try:
+                run_conversation_maintenance()
+            except Exception as e:
+                logging.error(f"Conversation partition maintenance failed: {e}")
+            time.sleep(CONVERSATION_MAINTENANCE_INTERVAL_SECONDS)
+
+    thread = threading.Thread(target=loop, name="partition-maintenance", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,53 @@
+from typing import Any, Dict, List
+
+# List items carrying one of these keys are matched by it rather than by position,
+# so a reordered peer table does not show up as every row changing
+LIST_ITEM_KEYS = ("Company Name", "name", "id")
+
+def _item_key(items: List[Any]):
+    for key in LIST_ITEM_KEYS:
+        if items and all(isinstance(item, dict) and item.get(key) is not None for item in items):
+            return key
+    return None
+
+def diff_json(before: Any, after: Any, path: str = "") -> List[Dict[str, Any]]:
+    """Return the leaf-level changes between two JSON documents as {"path", "change", "before", "after"}"""
+    if isinstance(before, dict) and isinstance(after, dict):
+        changes = []
+        for key in list(before) + [k for k in after if k not in before]:
+            child = f"{path}.{key}" if path else str(key)
+            if key not in after:
+                changes.append({"path": child, "change": "removed", "before": before[key], "after": None})
+            elif key not in before:
+                changes.append({"path": child, "change": "added", "before": None, "after": after[key]})
+            else:
+                changes.extend(diff_json(before[key], after[key], child))
+        return changes
+
+    if isinstance(before, list) and isinstance(after, list):
+        key = _item_key(before + after)
+        if key:
+            return diff_json({item[key]: item for item in before}, {item[key]: item for item in after}, path)
+        changes = []
+        for i in range(max(len(before), len(after))):
+            child = f"{path}[{i}]"
+            if i >= len(after):
+                changes.append({"path": child, "change": "removed", "before": before[i], "after": None})
+            elif i >= len(before):
+                changes.append({"path": child, "change": "added", "before": None, "after": after[i]})
+            else:
+                changes.extend(diff_json(before[i], after[i], child))
+        return changes
+
+    if before != after:
+        return [{"path": path, "change": "changed", "before": before, "after": after}]
+    return []
+
+def diff_payloads(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """Diff two analysis payload versions field by field; unchanged fields are left out"""
+    changes = {}
+    for field in sorted(set(before) | set(after)):
+        field_changes = diff_json(before.get(field), after.get(field))
+        if field_changes:
+            changes[field] = field_changes
+    return changes
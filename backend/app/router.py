@@ -1,12 +1,14 @@
-import asyncio
-from fastapi import APIRouter, Query, HTTPException
-from fastapi.concurrency import run_in_threadpool
+from datetime import datetime
+from typing import Dict, Any, List
+from fastapi import APIRouter, Body, Query, HTTPException, WebSocket, WebSocketDisconnect
+from .bulkheads import db_bulkhead, gcs_bulkhead, model_bulkhead, export_bulkhead, get_bulkhead_stats
 from .controller import *
 
-import anyio
+import json
+import logging
+import time
 from app.dao import get_analysis_result, get_conversation_history
 from app.gemini_service import initialize_gemini_client
-from google.genai import types
 from fastapi.responses import StreamingResponse
 import re
 
@@ -20,7 +22,9 @@ async def hello():
 @router.get("/generate_summary")
 async def generate_content_endpoint(
     path: str = Query(..., description="Relative path in bucket (e.g., L1/L2)"),
-    mode: str = Query("new", description="Mode: 'new' to generate fresh analysis, 'read' to fetch cached result")
+    mode: str = Query("new", description="Mode: 'new' to generate fresh analysis, 'read' to fetch cached result"),
+    execution: str = Query(None, description="For mode='new': 'single' model call, 'parallel' per-section calls or 'delta' (only changed files)"),
+    resume: bool = Query(True, description="For mode='new': continue a previously failed run from its last completed stage")
 ):
     """Generate AI content from ALL files in GCS path OR retrieve cached analysis"""
     
@@ -31,9 +35,12 @@ async def generate_content_endpoint(
             detail="Invalid path format. Expected format: L1/L2 (only one slash allowed, no leading/trailing slashes)."
         )
     
+    if execution not in (None, "single", "parallel", "delta"):
+        raise HTTPException(status_code=400, detail="Invalid execution parameter. Use 'single', 'parallel' or 'delta'")
+    
     if mode == "new":
-        # Run the sync function in threadpool for proper async handling
-        result = await run_in_threadpool(generate_content_from_path, path)
+        # Run the sync function on the model bulkhead so long generations cannot starve reads
+        result = await model_bulkhead.run(generate_content_from_path, path, execution=execution, resume=resume)
         
         if result["status"] == "error":
             raise HTTPException(status_code=400, detail=result["message"])
@@ -43,8 +50,8 @@ async def generate_content_endpoint(
     elif mode == "read":
         from app.dao import get_cached_analysis_result
         
-        # Run the sync DAO function in threadpool
-        cached_result = await run_in_threadpool(get_cached_analysis_result, gcs_key=path)
+        # Run the sync DAO function on the db bulkhead
+        cached_result = await db_bulkhead.run(get_cached_analysis_result, gcs_key=path)
         
         if not cached_result:
             raise HTTPException(
@@ -65,8 +72,8 @@ async def list_all_files_endpoint(
     path: str = Query(..., description="Relative path in bucket (e.g., L1/L2)")
 ):
     """List ALL files in gs://evaluate-startup/{path} with mime type detection"""
-    # Run sync function in threadpool
-    result = await run_in_threadpool(list_all_files_from_path, path)
+    # Run sync function on the gcs bulkhead
+    result = await gcs_bulkhead.run(list_all_files_from_path, path)
     
     if result["status"] == "error":
         raise HTTPException(status_code=400, detail=result["message"])
@@ -82,7 +89,7 @@ async def chat_message(
 ):
     """Chat about a specific startup analysis using its GCS key as session ID"""
     
-    result = await run_in_threadpool(generate_chat_response, gcs_key, message)
+    result = await model_bulkhead.run(generate_chat_response, gcs_key, message)
     
     if result["status"] == "error":
         raise HTTPException(status_code=400, detail=result["message"])
@@ -98,12 +105,12 @@ async def get_chat_history(gcs_key: str):
     logging.info(f"get_chat_history called with gcs_key: {gcs_key}")
     
     # Verify analysis exists
-    analysis = await run_in_threadpool(get_analysis_result, gcs_key=gcs_key)
+    analysis = await db_bulkhead.run(get_analysis_result, gcs_key=gcs_key)
     if not analysis:
         logging.warning(f"No analysis found for GCS key: {gcs_key}")
         raise HTTPException(status_code=404, detail="No analysis found for this GCS key")
     
-    history = await run_in_threadpool(get_conversation_history, session_id=gcs_key)
+    history = await db_bulkhead.run(get_conversation_history, session_id=gcs_key)
     
     return {
         "status": "success",
@@ -113,90 +120,400 @@ async def get_chat_history(gcs_key: str):
     }
 
 @router.get("/chat/startup-sessions")
-async def list_startup_chat_sessions():
+async def list_startup_chat_sessions(
+    limit: int = Query(50, ge=1, le=200, description="Page size"),
+    cursor: str = Query(None, description="Opaque cursor from a previous page's next_cursor"),
+    startup_name: str = Query(None, description="Only startups whose name starts with this (case-insensitive)"),
+    sort: str = Query("newest", description="newest or oldest last activity first")
+):
     """Get list of startups with chat sessions"""
     
     from app.dao import get_startup_chat_sessions
-    sessions = await run_in_threadpool(get_startup_chat_sessions)
+    try:
+        page = await db_bulkhead.run(get_startup_chat_sessions, limit, cursor, startup_name, sort)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return {
         "status": "success",
-        "sessions": sessions
+        "sessions": page["sessions"],
+        "next_cursor": page["next_cursor"],
+        "has_more": page["has_more"]
     }
 
 @router.get("/chat/available-analyses")
-async def get_available_analyses():
+async def get_available_analyses(
+    limit: int = Query(100, ge=1, le=500, description="Page size"),
+    cursor: str = Query(None, description="Opaque cursor from a previous page's next_cursor"),
+    startup_name: str = Query(None, description="Only startups whose name starts with this (case-insensitive)"),
+    sort: str = Query("newest", description="newest or oldest analyses first")
+):
     """Get list of all available analysis results that can be used for chat"""
     
     from app.dao import get_all_analysis_results
-    analyses = await run_in_threadpool(get_all_analysis_results)
+    try:
+        page = await db_bulkhead.run(get_all_analysis_results, limit, cursor, startup_name, sort)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return {
         "status": "success",
-        "available_analyses": analyses,
+        "available_analyses": page["analyses"],
+        "next_cursor": page["next_cursor"],
+        "has_more": page["has_more"],
         "message": "Use any gcs_key from this list to start a chat session"
     }
 
 
 
+@router.get("/analyses/search")
+async def search_analyses(
+    filter: List[str] = Query([], description="Metric filter such as revenue_usd>=1000000; repeatable"),
+    sort: str = Query(None, description="Metric column to sort by, e.g. revenue_usd or runway_months"),
+    order: str = Query("desc", description="asc or desc"),
+    limit: int = Query(50, ge=1, le=200, description="Page size"),
+    cursor: str = Query(None, description="Opaque cursor from a previous page's next_cursor")
+):
+    """Range-filter and sort analyses on their normalized numeric metrics"""
+    
+    from app.dao import search_analyses_by_metrics
+    filters = []
+    for expression in filter:
+        match = re.fullmatch(r'\s*(\w+)\s*(>=|<=|>|<|=)\s*(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)\s*', expression)
+        if not match:
+            raise HTTPException(status_code=400, detail=f"Invalid filter '{expression}'. Expected e.g. revenue_usd>=1000000")
+        filters.append((match.group(1), match.group(2), float(match.group(3))))
+    
+    try:
+        page = await db_bulkhead.run(search_analyses_by_metrics, filters, sort, order, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "status": "success",
+        "analyses": page["analyses"],
+        "next_cursor": page["next_cursor"],
+        "has_more": page["has_more"]
+    }
+
+@router.get("/analyses/versions")
+async def analysis_versions(
+    gcs_key: str = Query(..., description="GCS key of the analysis"),
+    startup_name: str = Query(None, description="Startup name, if the key holds more than one analysis")
+):
+    """List the stored payload versions of an analysis, newest first"""
+
+    from app.dao import get_analysis_versions
+    result = await db_bulkhead.run(get_analysis_versions, gcs_key, startup_name)
+    if result is None:
+        raise HTTPException(status_code=404, detail="No analysis found for this key")
+    return {"status": "success", **result}
+
+@router.get("/analyses/diff")
+async def analysis_diff(
+    gcs_key: str = Query(..., description="GCS key of the analysis"),
+    from_version: int = Query(None, ge=1, description="Older version (default: the one before to_version)"),
+    to_version: int = Query(None, ge=1, description="Newer version (default: current)"),
+    startup_name: str = Query(None, description="Startup name, if the key holds more than one analysis")
+):
+    """Show what changed in extracted data, summary and peer table between two analysis versions"""
+
+    from app.dao import get_analysis_payloads, get_analysis_versions
+    from app.payload_diff import diff_payloads
+    if to_version is None or from_version is None:
+        history = await db_bulkhead.run(get_analysis_versions, gcs_key, startup_name)
+        if history is None:
+            raise HTTPException(status_code=404, detail="No analysis found for this key")
+        to_version = to_version or history["current_version"]
+        older = [v["version"] for v in history["versions"] if v["version"] < to_version]
+        if from_version is None:
+            if not older:
+                raise HTTPException(status_code=404, detail=f"No version stored before version {to_version}")
+            from_version = older[0]
+
+    payloads = await db_bulkhead.run(get_analysis_payloads, gcs_key, [from_version, to_version], startup_name)
+    missing = [v for v in (from_version, to_version) if v not in payloads]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Version(s) not stored: {', '.join(map(str, missing))}")
+
+    return {
+        "status": "success",
+        "gcs_key": gcs_key,
+        "from_version": from_version,
+        "to_version": to_version,
+        "changes": diff_payloads(payloads[from_version], payloads[to_version])
+    }
+
 @router.post("/chat/stream/message")
 async def chat_stream_message(
     gcs_key: str = Query(..., description="GCS key (session ID)"),
     message: str = Query(..., description="User input message")
 ):
+    from app.answer_cache import UNCACHED_ROUTES, answer_cache, analysis_version
+    from app.chat_context import build_chat_prompt, load_chat_context, schedule_compaction
+    from app.chat_routing import route_chat_message, decision_meta
+    from app.config import ANSWER_CACHE_ENABLED
+    from app.dao import store_conversation_pair
+    
     # Prepare prompt using existing conversation loading logic
-    analysis = await asyncio.to_thread(get_analysis_result, gcs_key)
+    analysis = await db_bulkhead.run(get_analysis_result, gcs_key)
     if not analysis:
         raise HTTPException(status_code=404, detail="No analysis found for this GCS key")
+    
+    started = time.perf_counter()
+    startup_name = analysis.get('startup_name', 'Unknown')
+    version = analysis_version(analysis)
+    
+    # Repeated questions about the same analysis are served from the answer cache
+    cached = answer_cache.lookup(gcs_key, message, version) if ANSWER_CACHE_ENABLED else None
+    if cached:
+        async def cached_generator():
+            yield cached["answer"]
+            model_meta = {
+                "route": "cache",
+                "similarity": cached["similarity"],
+                "cached_question": cached["question"],
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+            await db_bulkhead.run(store_conversation_pair, gcs_key, message, cached["answer"], startup_name, model_meta)
+            schedule_compaction(gcs_key)
+        return StreamingResponse(cached_generator(), media_type="text/plain")
+    
+    decision = route_chat_message(message, analysis)
+    
+    async def record_turn(response_text: str):
+        model_meta = decision_meta(decision, time.perf_counter() - started)
+        logging.info(f"Chat stream route for {gcs_key}: {model_meta}")
+        if ANSWER_CACHE_ENABLED and decision["route"] not in UNCACHED_ROUTES and response_text:
+            answer_cache.store(gcs_key, message, response_text, version)
+        await db_bulkhead.run(store_conversation_pair, gcs_key, message, response_text, startup_name, model_meta)
+        schedule_compaction(gcs_key)
+    
+    if decision["route"] == "direct":
+        async def direct_generator():
+            yield decision["answer"]
+            await record_turn(decision["answer"])
+        return StreamingResponse(direct_generator(), media_type="text/plain")
 
-    conversation_history = await asyncio.to_thread(get_conversation_history, gcs_key, 10)
-    context_lines = []
-    for msg in conversation_history:
-        role = "User" if msg['sender'] == 'user' else "Assistant"
-        context_lines.append(f"{role}: {msg['message']}")
-    conversation_text = "\n".join(context_lines) if context_lines else "No previous conversation."
-    
-    system_prompt = f"""You are an expert startup analyst assistant discussing {analysis.get('startup_name', 'Unknown')}.
-STARTUP ANALYSIS SUMMARY:
-{analysis.get('analysis_summary', '')}
-Conversation History:
-{conversation_text}
-User: {message}
-Assistant:"""
+    # Running summary of older turns plus the last few turns verbatim, under a token budget
+    chat_context = await db_bulkhead.run(load_chat_context, gcs_key)
+    system_prompt = build_chat_prompt(
+        startup_name, analysis.get('analysis_summary', ''), chat_context["summary"], chat_context["recent_turns"], message
+    )
     
+    from google.genai import types
     client = initialize_gemini_client()
     
-    # Define the grounding tool with Google Search
-    grounding_tool = types.Tool(google_search=types.GoogleSearch())
-    
-    # Configure generation settings with grounding tool enabled
+    # Ground with Google Search only on the research route
+    tools = [types.Tool(google_search=types.GoogleSearch())] if decision["grounding"] else []
     config = types.GenerateContentConfig(
-        tools=[grounding_tool],
+        tools=tools,
         temperature=0.7,
-        max_output_tokens=1000,
+        max_output_tokens=decision["max_output_tokens"],
     )
     
-    async def async_generator_wrapper(sync_generator):
-        for item in sync_generator:
-            yield item
-    
     async def event_generator():
+        chunks = []
         try:
-            sync_stream = await anyio.to_thread.run_sync(
+            # The blocking stream is consumed on a model bulkhead thread, not the event loop
+            sync_stream = model_bulkhead.stream(
                 lambda: client.models.generate_content_stream(
-                    model="gemini-2.5-flash",
+                    model=decision["model"],
                     contents=system_prompt,
                     config=config
                 )
             )
-            async for chunk in async_generator_wrapper(sync_stream):
+            async for chunk in sync_stream:
                 print(chunk)
                 # try to yield the text or string
-                if hasattr(chunk, 'text'):
-                    yield chunk.text
-                else:
-                    yield str(chunk)
+                text = chunk.text if hasattr(chunk, 'text') else str(chunk)
+                if text:
+                    chunks.append(text)
+                    yield text
         except Exception as e:
             yield f"\n\n[Stream error: {str(e)}]"
+            return
+        await record_turn("".join(chunks))
     
     return StreamingResponse(event_generator(), media_type="text/plain")
+
+@router.websocket("/chat/ws")
+async def chat_socket(
+    websocket: WebSocket,
+    gcs_key: str = Query(..., description="GCS key (session ID)")
+):
+    """Multi-turn chat over one socket: the context is loaded once and each answer is streamed as tokens.
+
+    Send {"message": "..."} (or plain text) per turn; the server replies with
+    {"type": "token", "text"} events followed by {"type": "done", "route"}.
+    """
+    from app.chat_socket import ChatSession
+    from app.scheduler import TenantQuotaExceeded
+    await websocket.accept()
+    session = None
+    try:
+        session = await ChatSession.open(gcs_key)
+        if session is None:
+            await websocket.send_json({"type": "error", "message": "No analysis found for this GCS key"})
+            await websocket.close(code=1008)
+            return
+        await websocket.send_json({"type": "ready", "session_id": gcs_key, "startup_name": session.startup_name})
+
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                payload = json.loads(raw)
+                message = payload.get("message", "") if isinstance(payload, dict) else str(payload)
+            except ValueError:
+                message = raw
+            if not message.strip():
+                await websocket.send_json({"type": "error", "message": "Empty message"})
+                continue
+            events = session.ask(message)
+            try:
+                async for event in events:
+                    await websocket.send_json(event)
+            except WebSocketDisconnect:
+                raise
+            except TenantQuotaExceeded as e:
+                await websocket.send_json({"type": "error", "message": str(e), "retry_after": 2})
+            except Exception as e:
+                logging.error(f"Chat socket turn failed for {gcs_key}: {e}")
+                await websocket.send_json({"type": "error", "message": f"Failed to generate chat response: {str(e)}"})
+            finally:
+                # Stops the model stream now rather than when the generator is collected
+                await events.aclose()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logging.error(f"Chat socket for {gcs_key} failed: {e}")
+        try:
+            await websocket.close(code=1011)
+        except RuntimeError:
+            pass  # already closed
+    finally:
+        if session is not None:
+            await session.close()
+            logging.info(f"Chat socket for {gcs_key} closed after {session.turns} turns")
+
+# EXPORT ENDPOINTS
+
+async def _export_response(kind: str, format: str, since: datetime):
+    from app.export import EXPORT_FORMATS, check_export_format, stream_export
+    try:
+        check_export_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    extension = "parquet" if format == "parquet" else format
+    return StreamingResponse(
+        stream_export(kind, format, since),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{kind}.{extension}"'}
+    )
+
+@router.get("/export/analyses")
+async def export_analyses(
+    format: str = Query("ndjson", description="'ndjson', 'arrow' (IPC stream) or 'parquet'"),
+    since: datetime = Query(None, description="Only rows with updated_at after this timestamp (incremental sync)")
+):
+    """Stream every analysis, including extracted_data and peer_comparison_table"""
+    return await _export_response("analyses", format, since)
+
+@router.get("/export/conversations")
+async def export_conversations(
+    format: str = Query("ndjson", description="'ndjson', 'arrow' (IPC stream) or 'parquet'"),
+    since: datetime = Query(None, description="Only rows created after this timestamp (incremental sync)")
+):
+    """Stream full chat transcripts"""
+    return await _export_response("conversations", format, since)
+
+# INGESTION ENDPOINTS
+
+@router.post("/ingest/notify")
+async def ingest_notification(payload: Dict[str, Any] = Body(..., description="Pub/Sub push message or GCS object resource")):
+    """Record an upload; the L1/L2 prefix is analyzed in the background once uploads settle"""
+    
+    from app.ingest import handle_notification
+    return handle_notification(payload)
+
+@router.get("/ingest/status")
+async def ingest_status(
+    path: str = Query(None, description="Relative path in bucket (e.g., L1/L2); omit for all prefixes")
+):
+    """Get background pre-analysis state for recently uploaded prefixes"""
+    
+    from app.ingest import upload_debouncer
+    return {
+        "status": "success",
+        "prefixes": upload_debouncer.get_status(path)
+    }
+
+# METRICS ENDPOINTS
+
+@router.get("/metrics/bulkheads")
+async def bulkhead_metrics():
+    """Queue depth, wait time and utilization per I/O bulkhead"""
+    return {
+        "status": "success",
+        "bulkheads": get_bulkhead_stats()
+    }
+
+@router.get("/metrics/scheduler")
+async def scheduler_metrics():
+    """Per-class request latency percentiles and SLO attainment, plus per-class queueing per bulkhead"""
+    from app.scheduler import slo_tracker
+    stats = get_bulkhead_stats()
+    return {
+        "status": "success",
+        "classes": slo_tracker.stats(),
+        "bulkheads": {name: {"classes": bulkhead["classes"], "tenants_in_flight": bulkhead["tenants_in_flight"]}
+                      for name, bulkhead in stats.items()}
+    }
+
+@router.get("/metrics/analysis-runs")
+async def analysis_run_metrics(days: int = Query(30, ge=1, le=365, description="Look-back window in days")):
+    """Analysis run latency, stage and token percentiles plus totals, by day and model"""
+    from app.dao import get_analysis_run_stats
+    return {
+        "status": "success",
+        "days": days,
+        "by_day_and_model": await db_bulkhead.run(get_analysis_run_stats, days)
+    }
+
+@router.get("/metrics/analysis-runs/costs")
+async def analysis_run_costs(
+    days: int = Query(30, ge=1, le=365, description="Look-back window in days"),
+    startup_name: str = Query(None, description="Only this startup")
+):
+    """Estimated model cost and token usage per startup and day"""
+    from app.dao import get_analysis_run_costs
+    return {
+        "status": "success",
+        "days": days,
+        "by_startup_and_day": await db_bulkhead.run(get_analysis_run_costs, days, startup_name)
+    }
+
+# MAINTENANCE ENDPOINTS
+
+@router.post("/maintenance/conversations")
+async def conversation_maintenance():
+    """Pre-create upcoming conversation partitions and archive those past retention"""
+    
+    from app.partitions import run_conversation_maintenance
+    try:
+        return await db_bulkhead.run(run_conversation_maintenance)
+    except Exception as e:
+        logging.error(f"Conversation maintenance failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Maintenance failed: {str(e)}")
+
+@router.post("/maintenance/reparse")
+async def reparse_analyses():
+    """Re-run section splitting and KV extraction over all stored raw model outputs"""
+    
+    from app.checkpoints import reparse_all_analyses
+    try:
+        return await export_bulkhead.run(reparse_all_analyses)
+    except Exception as e:
+        logging.error(f"Bulk re-parse failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Re-parse failed: {str(e)}")
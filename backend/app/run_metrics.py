@@ -0,0 +1,105 @@
+from typing import Any, Dict, List, Optional
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from .config import MODEL_PRICING_PER_MILLION_TOKENS
+import threading
+import time
+
+def estimate_cost_usd(model: str, input_tokens: int, cached_tokens: int, output_tokens: int) -> Optional[float]:
+    """Estimate a model call's cost from list prices; None for models without a price"""
+    pricing = MODEL_PRICING_PER_MILLION_TOKENS.get(model)
+    if not pricing:
+        return None
+    uncached = max(input_tokens - cached_tokens, 0)
+    cost = (uncached * pricing["input"] + cached_tokens * pricing["cached_input"]
+            + output_tokens * pricing["output"]) / 1_000_000
+    return round(cost, 6)
+
+class AnalysisRun:
+    """Collects timings, token usage and bytes for one analysis run.
+    
+    Stages may be timed from several threads (parallel sections), so all
+    updates go through a lock. Call record() once at the end to persist it.
+    """
+
+    def __init__(self, gcs_key: str, execution: str):
+        self.gcs_key = gcs_key
+        self.execution = execution
+        self.startup_name = None
+        self.started_at = datetime.now(timezone.utc)
+        self.stage_seconds: Dict[str, float] = {}
+        self.model_calls: List[Dict[str, Any]] = []
+        self.bytes_downloaded = 0
+        self.files_processed = 0
+        self.files_extracted = 0
+        self.input_plan = None  # set by build_document_parts
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block and add it to the named stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.stage_seconds[name] = round(self.stage_seconds.get(name, 0.0) + elapsed, 3)
+
+    def add_bytes(self, count: int) -> None:
+        with self._lock:
+            self.bytes_downloaded += count
+
+    def record_model_call(self, model: str, response: Any, seconds: float, section: str = None) -> None:
+        """Record a generate_content call from its usage_metadata"""
+        usage = getattr(response, "usage_metadata", None)
+        input_tokens = getattr(usage, "prompt_token_count", None) or 0
+        cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+        # Thinking tokens are billed as output
+        output_tokens = ((getattr(usage, "candidates_token_count", None) or 0)
+                         + (getattr(usage, "thoughts_token_count", None) or 0))
+        call = {
+            "model": model,
+            "section": section,
+            "input_tokens": input_tokens,
+            "cached_tokens": cached_tokens,
+            "output_tokens": output_tokens,
+            "seconds": round(seconds, 3),
+            "cost_usd": estimate_cost_usd(model, input_tokens, cached_tokens, output_tokens),
+        }
+        with self._lock:
+            self.model_calls.append(call)
+
+    def totals(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = list(self.model_calls)
+        costs = [call["cost_usd"] for call in calls if call["cost_usd"] is not None]
+        return {
+            "model": "+".join(sorted({call["model"] for call in calls})) or None,
+            "input_tokens": sum(call["input_tokens"] for call in calls),
+            "cached_tokens": sum(call["cached_tokens"] for call in calls),
+            "output_tokens": sum(call["output_tokens"] for call in calls),
+            "cost_usd": round(sum(costs), 6) if costs else None,
+        }
+
+    def record(self, outcome: str, error: str = None) -> Optional[int]:
+        """Persist the run to analysis_runs; returns the run id, or None if it could not be stored"""
+        from app.dao import insert_analysis_run
+        row = dict(
+            self.totals(),
+            gcs_key=self.gcs_key,
+            startup_name=self.startup_name,
+            execution=self.execution,
+            started_at=self.started_at,
+            total_seconds=round(time.perf_counter() - self._started, 3),
+            stage_seconds=self.stage_seconds,
+            model_calls=self.model_calls,
+            bytes_downloaded=self.bytes_downloaded,
+            files_processed=self.files_processed,
+            files_extracted=self.files_extracted,
+            input_plan=self.input_plan,
+            outcome=outcome,
+            error=error,
+        )
+        return insert_analysis_run(row)
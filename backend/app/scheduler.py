@@ -0,0 +1,205 @@
+from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+from .config import SCHEDULER_CLASSES, TENANT_QUOTAS, SCHEDULER_SLO_WINDOW
+import threading
+import time
+
+# (priority class, tenant) of the request being handled; read when work is submitted to a bulkhead
+_current_request: ContextVar[Tuple[str, Optional[str]]] = ContextVar("current_request", default=("interactive", None))
+
+class TenantQuotaExceeded(Exception):
+    """Raised when a tenant already has its quota of work queued or running; surfaced as 429"""
+
+    def __init__(self, tenant: str, request_class: str, bulkhead: str):
+        super().__init__(f"Tenant '{tenant}' has too many {request_class} requests in progress, please retry shortly")
+        self.tenant = tenant
+        self.request_class = request_class
+        self.bulkhead = bulkhead
+
+def current_request() -> Tuple[str, Optional[str]]:
+    return _current_request.get()
+
+def tenant_quota(tenant: str, request_class: str) -> int:
+    quotas = TENANT_QUOTAS.get(tenant) or TENANT_QUOTAS["default"]
+    return quotas.get(request_class, TENANT_QUOTAS["default"][request_class])
+
+def tenant_of(key: Optional[str]) -> Optional[str]:
+    """The tenant is the L1 segment of an L1/L2 key"""
+    if not key:
+        return None
+    return key.strip("/").split("/")[0] or None
+
+def classify_request(path: str, query: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    """Map an HTTP request to its priority class and tenant"""
+    path = path.rstrip("/")
+
+    def first(name: str) -> Optional[str]:
+        return (query.get(name) or [None])[0]
+
+    tenant = tenant_of(first("path") or first("gcs_key") or first("session_id"))
+
+    if "/export/" in path or "/maintenance/" in path:
+        return "analysis", tenant
+    if path.endswith("/generate_summary"):
+        return ("interactive" if first("mode") == "read" else "analysis"), tenant
+    if path.endswith("/chat/message") or path.endswith("/chat/stream/message") or path.endswith("/chat/ws"):
+        return "chat", tenant
+    return "interactive", tenant
+
+class FairQueue:
+    """Thread-safe queue that is weighted-fair across classes and round-robin across tenants.
+    
+    Each class carries a virtual pass that advances by 1/weight per dequeued item,
+    so over time classes are served in proportion to their weights and no class
+    starves. A class that was idle restarts at the current virtual time instead
+    of cashing in credit from its idle period.
+
+    Weights only order queued work, so with `workers` consumers a class may also
+    hold `reserved` slots: other classes are not handed work that would leave fewer
+    free consumers than the reservations not yet in use. Consumers call done()
+    for every item get() returned.
+    """
+
+    def __init__(self, weights: Dict[str, float], workers: int = 0, reserved: Dict[str, int] = None):
+        self._weights = weights
+        self._classes = {name: OrderedDict() for name in weights}
+        self._pass = {name: 0.0 for name in weights}
+        self._virtual_time = 0.0
+        self._size = 0
+        self._workers = workers
+        self._reserved = {name: (reserved or {}).get(name, 0) for name in weights}
+        self._running = {name: 0 for name in weights}
+        self._not_empty = threading.Condition()
+
+    def put(self, request_class: str, tenant: Optional[str], item: Any) -> None:
+        with self._not_empty:
+            tenants = self._classes[request_class]
+            if not tenants:
+                self._pass[request_class] = max(self._pass[request_class], self._virtual_time)
+            tenants.setdefault(tenant, deque()).append(item)
+            self._size += 1
+            self._not_empty.notify()
+
+    def _may_start(self, request_class: str) -> bool:
+        if not self._workers:
+            return True
+        free = self._workers - sum(self._running.values())
+        held_for_others = sum(
+            max(reserved - self._running[name], 0)
+            for name, reserved in self._reserved.items() if name != request_class
+        )
+        return free > held_for_others
+
+    def get(self) -> Any:
+        with self._not_empty:
+            while True:
+                eligible = [name for name, tenants in self._classes.items() if tenants and self._may_start(name)]
+                if eligible:
+                    break
+                self._not_empty.wait()
+            request_class = min(eligible, key=lambda name: (self._pass[name], -self._weights[name]))
+            self._virtual_time = self._pass[request_class]
+            self._pass[request_class] += 1.0 / self._weights[request_class]
+            self._running[request_class] += 1
+
+            # Serve the tenant at the front, then move it to the back of the rotation
+            tenants = self._classes[request_class]
+            tenant, items = tenants.popitem(last=False)
+            item = items.popleft()
+            if items:
+                tenants[tenant] = items
+            self._size -= 1
+            return item
+
+    def done(self, request_class: str) -> None:
+        """Mark an item returned by get() as finished, freeing its slot"""
+        with self._not_empty:
+            self._running[request_class] -= 1
+            self._not_empty.notify()
+
+    def depth(self) -> Dict[str, int]:
+        with self._not_empty:
+            return {name: sum(len(items) for items in tenants.values()) for name, tenants in self._classes.items()}
+
+def _percentile_ms(ordered: list, q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000, 1)
+
+class SloTracker:
+    """Recent end-to-end request latencies per class, with percentiles and SLO attainment"""
+
+    def __init__(self, window: int = SCHEDULER_SLO_WINDOW):
+        self._lock = threading.Lock()
+        self._samples = {name: deque(maxlen=window) for name in SCHEDULER_CLASSES}
+        self._counts = {name: {"requests": 0, "errors": 0, "slo_misses": 0} for name in SCHEDULER_CLASSES}
+
+    def record(self, request_class: str, seconds: float, status_code: int) -> None:
+        with self._lock:
+            self._samples[request_class].append(seconds)
+            counts = self._counts[request_class]
+            counts["requests"] += 1
+            if status_code >= 500:
+                counts["errors"] += 1
+            if seconds * 1000 > SCHEDULER_CLASSES[request_class]["slo_ms"]:
+                counts["slo_misses"] += 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            result = {}
+            for name, samples in self._samples.items():
+                ordered = sorted(samples)
+                slo_seconds = SCHEDULER_CLASSES[name]["slo_ms"] / 1000
+                result[name] = dict(
+                    self._counts[name],
+                    slo_ms=SCHEDULER_CLASSES[name]["slo_ms"],
+                    p50_ms=_percentile_ms(ordered, 0.5),
+                    p95_ms=_percentile_ms(ordered, 0.95),
+                    p99_ms=_percentile_ms(ordered, 0.99),
+                    # Share of the recent window that met the SLO
+                    slo_attainment=round(sum(1 for s in ordered if s <= slo_seconds) / len(ordered), 4) if ordered else None
+                )
+            return result
+
+slo_tracker = SloTracker()
+
+class SchedulingMiddleware:
+    """ASGI middleware that tags each request with its class and tenant and records its latency"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "websocket":
+            # A socket is long-lived, so it only carries its class and tenant to the bulkheads
+            token = _current_request.set(classify_request(
+                scope["path"], parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            ))
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _current_request.reset(token)
+            return
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_class, tenant = classify_request(
+            scope["path"], parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        )
+        token = _current_request.set((request_class, tenant))
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            slo_tracker.record(request_class, time.perf_counter() - started, status["code"])
+            _current_request.reset(token)
@@ -1,27 +1,71 @@
 from sqlalchemy import text
-from .db import engine
+from .db import get_engine
+import json
 import logging
 
 DDL = """
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 
--- Single row per startup analysis
+-- Single narrow row per startup analysis; the large JSON payloads live in analysis_payloads
 CREATE TABLE IF NOT EXISTS analysis_results (
   id BIGSERIAL PRIMARY KEY,
   gcs_key TEXT NOT NULL,
   startup_name TEXT NOT NULL,
-  extracted_data JSONB NOT NULL,
-  analysis_summary JSONB,
   files_processed INTEGER DEFAULT 0,
   created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
   updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-  peer_comparison_table JSONB,
   UNIQUE(gcs_key, startup_name)
 );
 
--- Conversations table (unchanged)
+ALTER TABLE analysis_results
+  ADD COLUMN IF NOT EXISTS current_version INTEGER NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS payload_hash TEXT;
+
+-- Versioned analysis payloads; a new version is written only when the content changes
+CREATE TABLE IF NOT EXISTS analysis_payloads (
+  analysis_id BIGINT NOT NULL REFERENCES analysis_results (id) ON DELETE CASCADE,
+  version INTEGER NOT NULL,
+  payload_hash TEXT NOT NULL,
+  extracted_data JSONB NOT NULL,
+  analysis_summary JSONB,
+  peer_comparison_table JSONB,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (analysis_id, version)
+);
+
+-- Keyset pagination and prefix filtering for /chat/available-analyses
+CREATE INDEX IF NOT EXISTS idx_analysis_results_created
+  ON analysis_results (created_at, id);
+
+CREATE INDEX IF NOT EXISTS idx_analysis_results_name_prefix
+  ON analysis_results (lower(startup_name) text_pattern_ops, created_at, id);
+
+-- Typed metrics parsed from extracted_data (app/normalizers.py), money in USD
+ALTER TABLE analysis_results
+  ADD COLUMN IF NOT EXISTS normalized_metrics JSONB,
+  ADD COLUMN IF NOT EXISTS valuation_usd DOUBLE PRECISION,
+  ADD COLUMN IF NOT EXISTS revenue_usd DOUBLE PRECISION,
+  ADD COLUMN IF NOT EXISTS arr_usd DOUBLE PRECISION,
+  ADD COLUMN IF NOT EXISTS tam_usd DOUBLE PRECISION,
+  ADD COLUMN IF NOT EXISTS burn_rate_usd DOUBLE PRECISION,
+  ADD COLUMN IF NOT EXISTS cash_reserve_usd DOUBLE PRECISION,
+  ADD COLUMN IF NOT EXISTS runway_months DOUBLE PRECISION,
+  ADD COLUMN IF NOT EXISTS employees DOUBLE PRECISION,
+  ADD COLUMN IF NOT EXISTS risk_gauge DOUBLE PRECISION;
+
+CREATE INDEX IF NOT EXISTS idx_analysis_results_valuation ON analysis_results (valuation_usd, id);
+CREATE INDEX IF NOT EXISTS idx_analysis_results_revenue ON analysis_results (revenue_usd, id);
+CREATE INDEX IF NOT EXISTS idx_analysis_results_arr ON analysis_results (arr_usd, id);
+CREATE INDEX IF NOT EXISTS idx_analysis_results_tam ON analysis_results (tam_usd, id);
+CREATE INDEX IF NOT EXISTS idx_analysis_results_burn_rate ON analysis_results (burn_rate_usd, id);
+CREATE INDEX IF NOT EXISTS idx_analysis_results_cash_reserve ON analysis_results (cash_reserve_usd, id);
+CREATE INDEX IF NOT EXISTS idx_analysis_results_runway ON analysis_results (runway_months, id);
+CREATE INDEX IF NOT EXISTS idx_analysis_results_employees ON analysis_results (employees, id);
+CREATE INDEX IF NOT EXISTS idx_analysis_results_risk_gauge ON analysis_results (risk_gauge, id);
+
+-- Conversations, range-partitioned by month (see app/partitions.py)
 CREATE TABLE IF NOT EXISTS conversations (
-  id BIGSERIAL PRIMARY KEY,
+  id BIGSERIAL,
   session_id UUID NOT NULL,
   startup_name TEXT,
   gcs_key TEXT,
@@ -29,16 +73,203 @@ CREATE TABLE IF NOT EXISTS conversations (
   model_response TEXT NOT NULL,
   user_meta JSONB,
   model_meta JSONB,
-  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Catches rows outside the pre-created monthly partitions
+CREATE TABLE IF NOT EXISTS conversations_default PARTITION OF conversations DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_conversations_session_created
+  ON conversations (session_id, created_at);
+
+-- One row per chat session, maintained incrementally by store_conversation_pair
+CREATE TABLE IF NOT EXISTS chat_sessions (
+  session_id TEXT NOT NULL,
+  startup_name TEXT NOT NULL DEFAULT '',
+  first_chat TIMESTAMPTZ NOT NULL,
+  last_chat TIMESTAMPTZ NOT NULL,
+  message_count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (session_id, startup_name)
 );
+
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_last_chat
+  ON chat_sessions (last_chat DESC, session_id DESC, startup_name DESC);
+
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_name_prefix
+  ON chat_sessions (lower(startup_name) text_pattern_ops, last_chat);
+
+-- Running summary of older turns per session, maintained asynchronously after each turn
+CREATE TABLE IF NOT EXISTS chat_session_summaries (
+  session_id TEXT PRIMARY KEY,
+  summary TEXT NOT NULL,
+  summarized_through TIMESTAMPTZ NOT NULL,
+  turns_summarized INTEGER NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Intermediate artifacts of the latest run per analysis (app/checkpoints.py):
+-- stage is listed, extracted, generated or stored; generated_content holds the raw
+-- model output as {"text": ...} (single call) or {"sections": {...}} (parallel)
+CREATE TABLE IF NOT EXISTS analysis_artifacts (
+  gcs_key TEXT NOT NULL,
+  startup_name TEXT NOT NULL,
+  execution TEXT NOT NULL,
+  stage TEXT NOT NULL,
+  manifest JSONB NOT NULL,
+  extracted_texts JSONB,
+  generated_content JSONB,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (gcs_key, startup_name)
+);
+
+-- One row per analysis run (generate_content_from_path), successful or not
+CREATE TABLE IF NOT EXISTS analysis_runs (
+  id BIGSERIAL PRIMARY KEY,
+  gcs_key TEXT NOT NULL,
+  startup_name TEXT,
+  execution TEXT NOT NULL,
+  model TEXT,
+  outcome TEXT NOT NULL,
+  error TEXT,
+  started_at TIMESTAMPTZ NOT NULL,
+  total_seconds DOUBLE PRECISION NOT NULL,
+  stage_seconds JSONB NOT NULL DEFAULT '{}'::jsonb,
+  model_calls JSONB NOT NULL DEFAULT '[]'::jsonb,
+  input_tokens INTEGER NOT NULL DEFAULT 0,
+  cached_tokens INTEGER NOT NULL DEFAULT 0,
+  output_tokens INTEGER NOT NULL DEFAULT 0,
+  cost_usd NUMERIC(12, 6),
+  bytes_downloaded BIGINT NOT NULL DEFAULT 0,
+  files_processed INTEGER NOT NULL DEFAULT 0,
+  files_extracted INTEGER NOT NULL DEFAULT 0
+);
+
+ALTER TABLE analysis_runs ADD COLUMN IF NOT EXISTS input_plan JSONB;
+
+-- Company profiles shared across analyses, keyed by normalized company name
+CREATE TABLE IF NOT EXISTS company_profiles (
+  name_key TEXT PRIMARY KEY,
+  company_name TEXT NOT NULL,
+  profile JSONB NOT NULL,
+  source TEXT NOT NULL,  -- 'extracted_data' (the company's own data room) or 'peer_table'
+  source_gcs_key TEXT,
+  refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Peers named in each startup's latest peer table, for finding related cached profiles
+CREATE TABLE IF NOT EXISTS company_peer_sets (
+  startup_key TEXT PRIMARY KEY,
+  startup_name TEXT NOT NULL,
+  peers TEXT[] NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_company_peer_sets_peers
+  ON company_peer_sets USING GIN (peers);
+
+CREATE INDEX IF NOT EXISTS idx_analysis_runs_started
+  ON analysis_runs (started_at);
+
+CREATE INDEX IF NOT EXISTS idx_analysis_runs_startup_started
+  ON analysis_runs (startup_name, started_at);
+"""
+
+# Runs after the DDL and any conversations migration
+BACKFILL_SQL = """
+-- Backfill chat_sessions from existing conversations the first time the table is created
+INSERT INTO chat_sessions (session_id, startup_name, first_chat, last_chat, message_count)
+SELECT session_id::text, COALESCE(startup_name, ''), MIN(created_at), MAX(created_at), COUNT(*)
+FROM conversations
+WHERE NOT EXISTS (SELECT 1 FROM chat_sessions)
+GROUP BY session_id, COALESCE(startup_name, '')
+ON CONFLICT DO NOTHING;
+"""
+
+# lz4 TOAST compression needs PostgreSQL 14+; older servers keep the default (pglz)
+PAYLOAD_COMPRESSION_SQL = """
+ALTER TABLE analysis_payloads ALTER COLUMN extracted_data SET COMPRESSION lz4;
+ALTER TABLE analysis_payloads ALTER COLUMN analysis_summary SET COMPRESSION lz4;
+ALTER TABLE analysis_payloads ALTER COLUMN peer_comparison_table SET COMPRESSION lz4
 """
 
+def _decode_legacy_json(value):
+    # Older rows may hold JSON documents stored as JSON strings
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+def migrate_analysis_payloads(conn) -> int:
+    """Move payloads still stored inline in analysis_results into analysis_payloads, then drop those columns"""
+    from .dao import PAYLOAD_FIELDS, payload_hash, insert_analysis_payload
+    inline = conn.execute(text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'analysis_results' AND column_name = 'extracted_data'
+    """)).scalar()
+    if not inline:
+        return 0
+
+    rows = conn.execute(text(f"""
+        SELECT id, {", ".join(PAYLOAD_FIELDS)} FROM analysis_results WHERE current_version = 0
+    """)).mappings().all()
+    for row in rows:
+        payload = {field: _decode_legacy_json(row[field]) for field in PAYLOAD_FIELDS}
+        digest = payload_hash(payload)
+        insert_analysis_payload(conn, row["id"], 1, payload, digest)
+        conn.execute(text("""
+            UPDATE analysis_results SET current_version = 1, payload_hash = :digest WHERE id = :id
+        """), {"id": row["id"], "digest": digest})
+    conn.execute(text(f"""
+        ALTER TABLE analysis_results {", ".join(f"DROP COLUMN {field}" for field in PAYLOAD_FIELDS)}
+    """))
+    logging.info(f"Moved {len(rows)} analysis payloads to analysis_payloads")
+    return len(rows)
+
+def backfill_normalized_metrics(conn) -> int:
+    """Fill the typed metric columns for rows stored before normalization existed"""
+    from .dao import update_normalized_metrics
+    from .normalizers import normalize_metrics
+    rows = conn.execute(text("""
+        SELECT r.id, p.extracted_data
+        FROM analysis_results r
+        JOIN analysis_payloads p ON p.analysis_id = r.id AND p.version = r.current_version
+        WHERE r.normalized_metrics IS NULL
+    """)).mappings().all()
+    for row in rows:
+        update_normalized_metrics(conn, row["id"], normalize_metrics(row["extracted_data"]))
+    if rows:
+        logging.info(f"Normalized metrics for {len(rows)} existing analyses")
+    return len(rows)
+
 def init_schema():
+    from .partitions import (
+        ensure_conversation_partitions, copy_unpartitioned_conversations, rename_unpartitioned_conversations
+    )
     try:
-        with engine.begin() as conn:
+        with get_engine().begin() as conn:
+            legacy_table = rename_unpartitioned_conversations(conn)
             statements = [stmt.strip() for stmt in DDL.split(';') if stmt.strip()]
             for stmt in statements:
                 conn.execute(text(stmt))
+            ensure_conversation_partitions(conn)
+            if legacy_table:
+                copy_unpartitioned_conversations(conn, legacy_table)
+            statements = [stmt.strip() for stmt in BACKFILL_SQL.split(';') if stmt.strip()]
+            for stmt in statements:
+                conn.execute(text(stmt))
+            for stmt in [stmt.strip() for stmt in PAYLOAD_COMPRESSION_SQL.split(';') if stmt.strip()]:
+                try:
+                    with conn.begin_nested():
+                        conn.execute(text(stmt))
+                except Exception as e:
+                    logging.warning(f"Payload compression not changed: {e}")
+                    break
+            migrate_analysis_payloads(conn)
+            backfill_normalized_metrics(conn)
         logging.info("✅ Database schema initialized successfully")
         return True
     except Exception as e:
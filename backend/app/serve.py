@@ -0,0 +1,115 @@
+"""Production entry point: python -m app.serve [--workers N] [--port P]
+
+Runs app.main:app under uvicorn with one process per worker sharing the listening
+socket, uvloop and httptools when they are installed, and a graceful drain on
+SIGTERM: readiness starts failing, the socket stops accepting, and in-flight
+requests and streams get SERVER_GRACEFUL_SHUTDOWN_SECONDS to finish.
+"""
+from typing import Any, Dict, List, Optional
+from .config import (
+    SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_BACKLOG,
+    SERVER_KEEP_ALIVE_SECONDS, SERVER_GRACEFUL_SHUTDOWN_SECONDS
+)
+from .warmup import mark_draining
+import argparse
+import copy
+import importlib.util
+import os
+import uvicorn
+from uvicorn.config import LOGGING_CONFIG
+
+def log_config() -> Dict[str, Any]:
+    """uvicorn's logging config with timestamps on the default and access formatters"""
+    config = copy.deepcopy(LOGGING_CONFIG)
+    config["formatters"]["default"]["fmt"] = "%(asctime)s [%(name)s] %(levelprefix)s %(message)s"
+    config["formatters"]["default"]["datefmt"] = "%Y-%m-%d %H:%M:%S"
+    config["formatters"]["access"]["fmt"] = '%(asctime)s %(levelprefix)s %(client_addr)s - "%(request_line)s" %(status_code)s'
+    config["formatters"]["access"]["datefmt"] = "%Y-%m-%d %H:%M:%S"
+    return config
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+def _read_ints(path: str) -> List[int]:
+    with open(path) as f:
+        return [int(value) for value in f.read().split()]
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """CPUs allowed by the container's cgroup quota; None when unlimited or not in a cgroup"""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        return int(quota) / int(period) if quota != "max" else None
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1: a quota of -1 means unlimited
+        quota, = _read_ints("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        period, = _read_ints("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        return quota / period if quota > 0 and period > 0 else None
+    except (OSError, ValueError):
+        return None
+
+def worker_count(requested: int = SERVER_WORKERS) -> int:
+    """Requested worker count, or one per CPU this process may use when 0.
+
+    Host cores visible through sched_getaffinity are capped by the cgroup CPU quota,
+    so a container limited to 2 CPUs on a 64-core node starts 2 workers, not 64.
+    """
+    if requested > 0:
+        return requested
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, int(limit))
+    return max(cpus, 1)
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn server that marks the worker as draining as soon as a shutdown signal arrives"""
+
+    def handle_exit(self, sig, frame) -> None:
+        mark_draining()
+        super().handle_exit(sig, frame)
+
+def build_config(host: str = SERVER_HOST, port: int = SERVER_PORT, workers: int = SERVER_WORKERS) -> uvicorn.Config:
+    return uvicorn.Config(
+        "app.main:app",
+        host=host,
+        port=port,
+        workers=worker_count(workers),
+        loop="uvloop" if _available("uvloop") else "asyncio",
+        http="httptools" if _available("httptools") else "h11",
+        backlog=SERVER_BACKLOG,
+        timeout_keep_alive=SERVER_KEEP_ALIVE_SECONDS,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_SHUTDOWN_SECONDS,
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+        log_config=log_config(),
+    )
+
+def serve(host: str = SERVER_HOST, port: int = SERVER_PORT, workers: int = SERVER_WORKERS) -> None:
+    """Run the API until terminated; with more than one worker a supervisor process starts and restarts them"""
+    config = build_config(host, port, workers)
+    server = DrainingServer(config)
+    print(f"Serving on {host}:{port} with {config.workers} worker(s), loop={config.loop}, http={config.http}")
+    if config.workers > 1:
+        from uvicorn.supervisors import Multiprocess
+        sock = config.bind_socket()
+        Multiprocess(config, target=server.run, sockets=[sock]).run()
+    else:
+        server.run()
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the API with production server settings")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", SERVER_PORT)))
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="0 = one per CPU allowed by the cgroup quota")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.workers)
+
+if __name__ == "__main__":
+    main()
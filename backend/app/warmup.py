@@ -0,0 +1,70 @@
+from typing import Dict, Any, List
+import importlib
+import logging
+import threading
+import time
+
+# Shared warm-up state, read by the readiness endpoint
+_state: Dict[str, Any] = {
+    "started_at": None,
+    "finished_at": None,
+    "db": False,
+    "model": False,
+    "errors": {},
+    "draining": False
+}
+
+def ping_database() -> None:
+    """Check out a pooled connection and run a trivial query"""
+    from sqlalchemy import text
+    from .db import get_engine
+    with get_engine().connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+def warm_up() -> Dict[str, Any]:
+    """Pre-establish the DB pool and the Gemini client"""
+    _state["started_at"] = time.time()
+    try:
+        ping_database()
+        _state["db"] = True
+    except Exception as e:
+        _state["errors"]["db"] = str(e)
+        logging.error(f"DB warm-up failed: {e}")
+
+    try:
+        from .gemini_service import initialize_gemini_client
+        initialize_gemini_client()
+        _state["model"] = True
+    except Exception as e:
+        _state["errors"]["model"] = str(e)
+        logging.error(f"Model client warm-up failed: {e}")
+
+    _state["finished_at"] = time.time()
+    logging.info(f"Warm-up finished in {_state['finished_at'] - _state['started_at']:.3f}s")
+    return get_warmup_state()
+
+def run_worker_init_hooks(hooks: List[str]) -> None:
+    """Call each "module:function" hook once in this worker process; failures are logged, not raised"""
+    for hook in hooks:
+        try:
+            module_name, _, function_name = hook.partition(":")
+            getattr(importlib.import_module(module_name), function_name)()
+        except Exception as e:
+            _state["errors"][hook] = str(e)
+            logging.error(f"Worker init hook {hook} failed: {e}")
+
+def mark_draining() -> None:
+    """Flag the worker as shutting down so readiness fails while in-flight requests finish"""
+    _state["draining"] = True
+
+def start_background_warmup() -> threading.Thread:
+    """Run warm_up in a daemon thread so startup is not blocked"""
+    thread = threading.Thread(target=warm_up, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+def get_warmup_state() -> Dict[str, Any]:
+    """Return a copy of the current warm-up state"""
+    state = dict(_state)
+    state["errors"] = dict(_state["errors"])
+    return state
@@ -0,0 +1,58 @@
+import pytest
+from app.normalizers import PARSERS
+
+@pytest.mark.parametrize("kind, text, expected", [
+    # Currency prefixes
+    ("money", "$5M", {"value": 5e6, "unit": "USD"}),
+    ("money", "US$ 2.5 million", {"value": 2.5e6, "unit": "USD"}),
+    ("money", "S$5M", {"value": 5e6, "unit": "SGD"}),
+    ("money", "SGD 5M", {"value": 5e6, "unit": "SGD"}),
+    ("money", "A$3M", {"value": 3e6, "unit": "AUD"}),
+    ("money", "C$3M", {"value": 3e6, "unit": "CAD"}),
+    ("money", "HK$10M", {"value": 1e7, "unit": "HKD"}),
+    ("money", "NZ$1M", {"value": 1e6, "unit": "NZD"}),
+    ("money", "₹50 crore", {"value": 5e8, "unit": "INR"}),
+    ("money", "Rs. 12 lakh", {"value": 1.2e6, "unit": "INR"}),
+    ("money", "€1.2B", {"value": 1.2e9, "unit": "EUR"}),
+    ("money", "4.5M", {"value": 4.5e6, "unit": "USD", "currency_assumed": True}),
+    # Scale words
+    ("money", "€5 Mio", {"value": 5e6, "unit": "EUR"}),
+    ("money", "$4 mil", {"value": 4e6, "unit": "USD"}),
+    ("money", "$2.5 mln", {"value": 2.5e6, "unit": "USD"}),
+    # Two currencies: the one attached to the parsed number wins
+    ("money", "INR 50 crore (approx. $6M)", {"value": 5e8, "unit": "INR", "value_usd": 6e6}),
+    ("money", "50 crore INR (~$6M)", {"value": 5e8, "unit": "INR"}),
+    ("money", "$6M (₹50 crore)", {"value": 6e6, "unit": "USD"}),
+    ("money", "€5M, about US$5.4M", {"value": 5e6, "unit": "EUR"}),
+    # Ranges
+    ("money", "$10-15M", {"value": 12.5e6, "low": 10e6, "high": 15e6}),
+    ("money", "$10M to $20M", {"value": 15e6, "low": 10e6, "high": 20e6}),
+    # Negatives and periods
+    ("money", "-$2M", {"value": -2e6}),
+    ("money", "($1.5M)", {"value": -1.5e6}),
+    ("money", "Net loss of $3M", {"value": -3e6}),
+    ("money", "$200K per month", {"value": 2e5, "period": "month"}),
+    ("money", "$2.4M annually", {"value": 2.4e6, "period": "year"}),
+    # Years
+    ("money", "FY2023: $5M", {"value": 5e6, "unit": "USD"}),
+    ("count", "2021", {"value": 2021}),
+    ("duration", "18 months as of 2024", {"value": 18}),
+    # Other kinds
+    ("count", "about 1,200 employees", {"value": 1200, "unit": "count"}),
+    ("duration", "2 years", {"value": 24, "unit": "months"}),
+    ("duration", "18", {"value": 18, "unit": "months"}),
+    ("score", "7/10", {"value": 7, "unit": "score", "scale": 10}),
+    ("score", "3", {"value": 3, "scale": 5}),
+])
+def test_parsers(kind, text, expected):
+    parsed = PARSERS[kind](text)
+    assert {key: parsed.get(key) for key in expected} == pytest.approx(expected)
+
+@pytest.mark.parametrize("kind, text", [
+    ("money", "not disclosed"),
+    ("count", "n/a"),
+    ("duration", "unknown"),
+    ("score", ""),
+])
+def test_parsers_without_numbers(kind, text):
+    assert PARSERS[kind](text) is None